@@ -1,3 +1,7 @@
+import csv
+import io
+import json
+import math
 import os
 import time
 import random
@@ -7,6 +11,122 @@ from tkinter import messagebox
 import customtkinter as ctk
 import pandas as pd
 
+from event_markers import EventMarkerSender, LocalTransport
+from log_writer import BackgroundWriter
+
+
+class TrialLogger:
+    """
+    Append-only CSV log with one row per trial.
+
+    The header is fixed when the logger is created, so every row has the
+    same columns (missing values are written as empty cells). Rows are
+    formatted on the calling thread and handed to a BackgroundWriter, which
+    writes, flushes and fsyncs them on its own thread; earlier rows are
+    never rewritten, so logging a trial costs the same at trial 1 and trial
+    500 and never blocks the Tk main thread on the disk.
+
+    An existing log file is never overwritten: if out_path already exists,
+    the log goes to a new file with a timestamp suffix.
+    """
+
+    def __init__(self, out_path, columns):
+        if os.path.exists(out_path):
+            stem, ext = os.path.splitext(out_path)
+            out_path = f"{stem}_{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+        self.out_path = out_path
+        self.columns = list(columns)
+
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        self.writer = BackgroundWriter(out_path, mode="w", fsync=True, newline="")
+        self._buffer = io.StringIO()
+        self._formatter = csv.DictWriter(self._buffer, fieldnames=self.columns, restval="")
+        self._formatter.writeheader()
+        self._send()
+
+    def _send(self):
+        self.writer.write(self._buffer.getvalue())
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def write_row(self, row):
+        """Append one trial (a dict keyed by the header columns)."""
+        self._formatter.writerow({
+            key: "" if isinstance(value, float) and math.isnan(value) else value
+            for key, value in row.items()
+        })
+        self._send()
+
+    def close(self):
+        """Wait until every row is on disk and close the file."""
+        self.writer.close()
+
+
+class EventClock:
+    """
+    High-resolution timestamps for trial events.
+
+    Every event is stamped with time.perf_counter_ns() (monotonic, sub-
+    microsecond, unaffected by NTP or DST adjustments of the wall clock).
+    The wall clock is read only once, together with perf_counter_ns and
+    monotonic_ns, as the session anchor; wall-clock times in the log are
+    derived from it, so they cannot jump within a session.
+
+    Tk key and mouse events carry the window system's own timestamp
+    (event.time, integer milliseconds on a clock with an arbitrary origin,
+    wrapping at 2**32). Its offset to perf_counter is estimated as the
+    smallest (handler time - event time) seen so far, i.e. the event that
+    was handled with the least delay; event times are then expressed on
+    the perf_counter clock, so they do not include the time the event
+    waited in the Tk queue. The raw event.time is logged too, so the
+    offset can be re-estimated offline from all events of a session.
+    """
+
+    TK_TIME_WRAP = 2 ** 32
+
+    def __init__(self):
+        self.anchor = {
+            "unix_ns": time.time_ns(),
+            "perf_counter_ns": time.perf_counter_ns(),
+            "monotonic_ns": time.monotonic_ns(),
+            "perf_counter_resolution_s": time.get_clock_info("perf_counter").resolution,
+            "monotonic_resolution_s": time.get_clock_info("monotonic").resolution,
+        }
+        self._tk_last_ms = None        # last raw event.time
+        self._tk_unwrapped_ms = None   # event.time with wrap-arounds undone
+        self._tk_offset_ns = None      # perf_counter_ns - event time in ns
+
+    def now_ns(self):
+        return time.perf_counter_ns()
+
+    def to_unix(self, perf_ns):
+        """Wall-clock time (seconds since the epoch) of a perf_counter_ns stamp, via the session anchor."""
+        if perf_ns is None:
+            return None
+        return (self.anchor["unix_ns"] + perf_ns - self.anchor["perf_counter_ns"]) / 1e9
+
+    def event_time_ns(self, event, handler_ns):
+        """perf_counter_ns at which a Tk event occurred, or None if it carries no usable timestamp."""
+        tk_ms = getattr(event, "time", None)
+        if not isinstance(tk_ms, int) or tk_ms == 0:
+            return None
+
+        tk_ms %= self.TK_TIME_WRAP
+        if self._tk_last_ms is None:
+            self._tk_unwrapped_ms = tk_ms
+        else:
+            self._tk_unwrapped_ms += (tk_ms - self._tk_last_ms) % self.TK_TIME_WRAP
+        self._tk_last_ms = tk_ms
+
+        offset_ns = handler_ns - self._tk_unwrapped_ms * 1_000_000
+        if self._tk_offset_ns is None or offset_ns < self._tk_offset_ns:
+            self._tk_offset_ns = offset_ns
+        return self._tk_unwrapped_ms * 1_000_000 + self._tk_offset_ns
+
+    def save_anchor(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.anchor, f, indent=2)
+
 
 class EEGReadingGUI:
     """
@@ -21,9 +141,13 @@ class EEGReadingGUI:
           'correct_option' (e.g., "A", "B", "C", "D")
       - Any additional columns (topic_hint, genre, difficulty, etc.)
         are passed through into the trial log.
+
+    Event markers (reading onset, reading end, question onset, response)
+    are sent through marker_transport (see event_markers.py); without one,
+    a LocalTransport stand-in records them.
     """
 
-    def __init__(self, stimuli_csv_path, shuffle_trials=True):
+    def __init__(self, stimuli_csv_path, shuffle_trials=True, marker_transport=None):
         # ---- Root window & appearance ----
         self.root = ctk.CTk()
         self.root.title("EEG Reading Experiment")
@@ -56,10 +180,28 @@ class EEGReadingGUI:
         self.frame = None                     # current main frame
 
         # Timing and logging
-        self.trial_start_time = None          # reading phase start
-        self.question_start_time = None       # question phase start
+        self.clock = EventClock()
+        self.trial_start_ns = None            # reading phase start (perf_counter_ns)
+        self.question_start_ns = None         # question phase start (perf_counter_ns)
         self.current_log_entry = None         # dict for current trial
-        self.log_rows = []                    # list of log dicts
+        self.trial_logger = None              # TrialLogger, opened once the participant ID is known
+        self.marker_transport = marker_transport or LocalTransport()
+        self.markers = None                   # EventMarkerSender, started with the trial logger
+
+        # Trial log columns, fixed for the whole session
+        self.log_columns = (
+            ["participant_id", "trial_index", "stim_index",
+             "reading_start_time_unix", "reading_end_time_unix", "reading_time_sec",
+             "reading_start_perf_ns", "reading_end_perf_ns", "reading_end_handler_perf_ns",
+             "reading_end_tk_event_ms", "reading_end_source", "reading_onset_latency_ms",
+             "reading_prefetched"]
+            + [col for col in self.stim_df.columns if col != "text"]
+            + ["question_response", "question_start_time_unix", "question_end_time_unix", "question_time_sec",
+               "question_start_perf_ns", "question_end_perf_ns", "question_onset_latency_ms",
+               "question_prefetched"]
+        )
+        if "correct_option" in self.stim_df.columns:
+            self.log_columns += ["question_correct_option", "question_is_correct"]
 
         # GUI style
         self.button_height = 35
@@ -69,6 +211,19 @@ class EEGReadingGUI:
 
         # Multiple-choice response variable
         self.mc_response_var = tk.StringVar(value="")
+        self.option_labels = ["A", "B", "C", "D"]
+
+        # Pre-built trial screens (see build_trial_screens), the trial each
+        # one currently holds, whether it was prepared ahead of its onset and
+        # the measured time from starting a screen change to its redraw
+        self.reading_buffers = []
+        self.active_reading_buffer = None
+        self.question_screen = None
+        self.question_trial_idx = None
+        self.reading_prefetched = False
+        self.question_prefetched = False
+        self.reading_onset_latency_ms = None
+        self.question_onset_latency_ms = None
 
         # Key binding state
         self.space_binding_active = False
@@ -135,7 +290,21 @@ class EEGReadingGUI:
         self.participant_id = pid
         self.participant_id_display = f"ID: {pid}"
 
-        os.makedirs("logs", exist_ok=True)
+        self.trial_logger = TrialLogger(
+            os.path.join("logs", f"EEG_log_{self.participant_id}.csv"),
+            self.log_columns,
+        )
+        # One-time wall-clock anchor of the perf_counter_ns stamps in the log
+        log_stem = os.path.splitext(self.trial_logger.out_path)[0]
+        self.clock.save_anchor(log_stem + "_clock.json")
+        try:
+            self.markers = EventMarkerSender(self.marker_transport, log_stem + "_markers.csv")
+        except RuntimeError as e:
+            # No session without working triggers: stay on the ID screen until the transport is fixed
+            self.trial_logger.close()
+            self.trial_logger = None
+            messagebox.showerror("Event markers", f"{e}\n\nCheck MARKER_TRANSPORT and the trigger hardware.")
+            return
 
         self.show_instructions_screen()
 
@@ -212,55 +381,42 @@ class EEGReadingGUI:
 
     def on_space_pressed(self, event=None):
         if self.current_screen == "trial":
-            self.finish_reading_phase()
+            self.finish_reading_phase(event)
 
-    # ---------------------- Reading screen ------------------------
+    # ---------------------- Trial screens -------------------------
 
-    def show_trial(self):
-        """Show the reading screen for the current trial."""
-        if self.current_trial_idx >= self.n_trials:
-            self.unbind_space()
-            self.show_end_screen()
-            return
-
-        self.current_screen = "trial"
-        self.clear_frame()
-        self.bind_space_for_trial()
-
-        trial_number = self.current_trial_idx + 1
-        paragraph_idx = self.trial_indices[self.current_trial_idx]
-        self.current_paragraph_idx = paragraph_idx
-        row = self.paragraphs[paragraph_idx]
-        paragraph_text = row["text"]
+    def build_reading_screen(self):
+        """One reading screen; returns its frame and the widgets a trial updates."""
+        screen = ctk.CTkFrame(master=self.frame, fg_color="transparent")
+        screen.grid(row=0, column=0, sticky="nsew")
 
         header = ctk.CTkLabel(
-            master=self.frame,
-            text=f"Paragraph {trial_number} of {self.n_trials}",
+            master=screen,
+            text="",
             font=("Open Sans", 22, "bold"),
         )
         header.pack(pady=(20, 5))
 
         instructions = ctk.CTkLabel(
-            master=self.frame,
+            master=screen,
             text="Read silently. Press SPACE or click 'Done' when you are finished.",
             font=("Open Sans", 16),
         )
         instructions.pack(pady=(0, 10))
 
         text_box = ctk.CTkTextbox(
-            master=self.frame,
+            master=screen,
             width=1100,
             height=450,
             wrap="word",
             font=self.text_font,
             corner_radius=10,
         )
-        text_box.insert("1.0", paragraph_text)
         text_box.configure(state="disabled", cursor="arrow")
         text_box.pack(pady=(5, 10), padx=40, fill="both", expand=True)
 
         done_button = ctk.CTkButton(
-            master=self.frame,
+            master=screen,
             text="Done",
             command=self.finish_reading_phase,
             height=self.button_height,
@@ -271,24 +427,179 @@ class EEGReadingGUI:
 
         if self.participant_id_display:
             pid_label = ctk.CTkLabel(
-                master=self.frame,
+                master=screen,
+                text=self.participant_id_display,
+                font=("Open Sans", 12),
+            )
+            pid_label.pack(padx=20, pady=10, anchor="w")
+
+        return {"frame": screen, "header": header, "text_box": text_box, "trial_idx": None}
+
+    def build_trial_screens(self):
+        """
+        Build the trial screens once, stacked in the same grid cell of the
+        main frame: two reading screens (a double buffer, so the next
+        paragraph can be prepared on the hidden one, see
+        prefetch_next_trial) and the question screen. Each trial only
+        updates their content (header, paragraph, question, option labels)
+        and raises one of them with tkraise, so no widget is created,
+        destroyed or laid out again at the paragraph onset.
+        """
+        self.clear_frame()
+        self.frame.grid_rowconfigure(0, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+
+        # ---- Reading screens ----
+        self.reading_buffers = [self.build_reading_screen(), self.build_reading_screen()]
+        self.active_reading_buffer = None
+
+        # ---- Question screen ----
+        self.question_screen = ctk.CTkFrame(master=self.frame, fg_color="transparent")
+        self.question_screen.grid(row=0, column=0, sticky="nsew")
+
+        self.question_header = ctk.CTkLabel(
+            master=self.question_screen,
+            text="",
+            font=("Open Sans", 22, "bold"),
+        )
+        self.question_header.pack(pady=(20, 10))
+
+        self.question_label = ctk.CTkLabel(
+            master=self.question_screen,
+            text="",
+            font=self.text_font,
+            wraplength=1000,
+            justify="left",
+        )
+        self.question_label.pack(pady=(10, 20), padx=40)
+
+        # One radio button per option label; the buttons of options a
+        # question does not have are hidden (see show_question_page)
+        self.option_frame = ctk.CTkFrame(master=self.question_screen, fg_color="transparent")
+        self.option_frame.pack(fill="x")
+        self.option_buttons = {}
+        for opt_label in self.option_labels:
+            self.option_buttons[opt_label] = ctk.CTkRadioButton(
+                master=self.option_frame,
+                text="",
+                value=opt_label,
+                variable=self.mc_response_var,
+                font=self.text_font,
+            )
+        self.visible_options = None
+        self.question_trial_idx = None
+
+        continue_button = ctk.CTkButton(
+            master=self.question_screen,
+            text="Continue",
+            command=self.finish_question_phase,
+            height=self.button_height,
+            width=self.button_width,
+            font=self.button_font,
+        )
+        continue_button.pack(pady=(20, 30))
+
+        if self.participant_id_display:
+            pid_label = ctk.CTkLabel(
+                master=self.question_screen,
                 text=self.participant_id_display,
                 font=("Open Sans", 12),
             )
             pid_label.pack(padx=20, pady=10, anchor="w")
 
-        # Start reading timer
-        self.trial_start_time = time.time()
+    def present_screen(self, screen):
+        """
+        Raise a pre-built screen and process Tk's pending geometry and
+        redraw work, so that the returned perf_counter_ns stamp is taken
+        after the new screen has been drawn (the display's own refresh
+        still follows).
+        """
+        screen.tkraise()
+        self.root.update_idletasks()
+        return self.clock.now_ns()
+
+    # ---------------------- Reading screen ------------------------
+
+    def show_trial(self):
+        """Show the reading screen for the current trial."""
+        if self.current_trial_idx >= self.n_trials:
+            self.unbind_space()
+            self.show_end_screen()
+            return
+
+        request_ns = self.clock.now_ns()
+        if self.current_screen not in ("trial", "question"):
+            self.build_trial_screens()
+        self.current_screen = "trial"
+        self.bind_space_for_trial()
+
+        self.current_paragraph_idx = self.trial_indices[self.current_trial_idx]
+
+        # Use the buffer prepared during the previous question phase if
+        # there is one; otherwise fill the hidden buffer now
+        prefetched = [b for b in self.reading_buffers if b["trial_idx"] == self.current_trial_idx]
+        self.reading_prefetched = bool(prefetched)
+        if prefetched:
+            buffer = prefetched[0]
+        else:
+            buffer = self.hidden_reading_buffer()
+            self.prepare_reading_screen(buffer, self.current_trial_idx)
+        self.active_reading_buffer = buffer
+
+        # Start reading timer at the onset
+        self.trial_start_ns = self.present_screen(buffer["frame"])
+        self.markers.mark("reading_onset", self.current_trial_idx, self.trial_start_ns)
+        self.reading_onset_latency_ms = (self.trial_start_ns - request_ns) / 1e6
         self.current_log_entry = None
 
-    def finish_reading_phase(self):
+        # Lay out this trial's question while the participant reads
+        self.root.after_idle(self.prefetch_question)
+
+    def hidden_reading_buffer(self):
+        """The reading buffer that is not on screen."""
+        return next(b for b in self.reading_buffers if b is not self.active_reading_buffer)
+
+    def prepare_reading_screen(self, buffer, trial_idx):
+        """Fill a reading buffer with the paragraph of trial trial_idx (without raising it)."""
+        row = self.paragraphs[self.trial_indices[trial_idx]]
+        buffer["header"].configure(text=f"Paragraph {trial_idx + 1} of {self.n_trials}")
+        text_box = buffer["text_box"]
+        text_box.configure(state="normal")
+        text_box.delete("1.0", "end")
+        text_box.insert("1.0", row["text"])
+        text_box.see("1.0")
+        text_box.configure(state="disabled")
+        buffer["trial_idx"] = trial_idx
+
+    def prefetch_next_trial(self):
+        """
+        During the question phase, put the next paragraph into the hidden
+        reading buffer and let Tk compute its layout (text wrapping,
+        geometry) now, so that advancing only has to raise it.
+        """
+        next_idx = self.current_trial_idx + 1
+        if self.current_screen != "question" or next_idx >= self.n_trials:
+            return
+        buffer = self.hidden_reading_buffer()
+        if buffer["trial_idx"] != next_idx:
+            self.prepare_reading_screen(buffer, next_idx)
+        self.root.update_idletasks()
+
+    def finish_reading_phase(self, event=None):
         """
         Called when participant finishes reading (SPACE or 'Done').
         Logs reading time and then shows the question screen
         for the same paragraph.
+
+        For a keypress the reading end is the time of the key event
+        itself; for the button (no event) it is the time the handler ran.
         """
-        end_time = time.time()
-        rt = end_time - (self.trial_start_time or end_time)
+        handler_ns = self.clock.now_ns()
+        event_ns = self.clock.event_time_ns(event, handler_ns) if event is not None else None
+        end_ns = event_ns if event_ns is not None else handler_ns
+        self.markers.mark("reading_end", self.current_trial_idx, end_ns)
+        start_ns = self.trial_start_ns if self.trial_start_ns is not None else end_ns
+        rt = (end_ns - start_ns) / 1e9
 
         row = self.paragraphs[self.current_paragraph_idx]
 
@@ -297,9 +608,16 @@ class EEGReadingGUI:
             "participant_id": self.participant_id,
             "trial_index": self.current_trial_idx,
             "stim_index": self.current_paragraph_idx,
-            "reading_start_time_unix": self.trial_start_time,
-            "reading_end_time_unix": end_time,
+            "reading_start_time_unix": self.clock.to_unix(start_ns),
+            "reading_end_time_unix": self.clock.to_unix(end_ns),
             "reading_time_sec": rt,
+            "reading_start_perf_ns": start_ns,
+            "reading_end_perf_ns": end_ns,
+            "reading_end_handler_perf_ns": handler_ns,
+            "reading_end_tk_event_ms": getattr(event, "time", None) if event_ns is not None else None,
+            "reading_end_source": "key_event" if event_ns is not None else "handler",
+            "reading_onset_latency_ms": self.reading_onset_latency_ms,
+            "reading_prefetched": self.reading_prefetched,
         }
 
         # Include all stimulus metadata except text
@@ -316,14 +634,8 @@ class EEGReadingGUI:
 
     # ---------------------- Question screen -----------------------
 
-    def show_question_page(self):
-        """Show a multiple-choice question about the current paragraph."""
-        self.current_screen = "question"
-        self.clear_frame()
-
-        row = self.paragraphs[self.current_paragraph_idx]
-        trial_number = self.current_trial_idx + 1
-
+    def question_content(self, row, trial_number):
+        """Question text and (option text, option label) pairs of a paragraph, or placeholders."""
         # Question text from CSV or placeholder
         question_text = row.get(
             "question",
@@ -352,56 +664,53 @@ class EEGReadingGUI:
                 ("Placeholder option C", "C"),
                 ("Placeholder option D", "D"),
             ]
+        return question_text, options
 
-        header = ctk.CTkLabel(
-            master=self.frame,
-            text=f"Question for Paragraph {trial_number}",
-            font=("Open Sans", 22, "bold"),
-        )
-        header.pack(pady=(20, 10))
+    def prepare_question_screen(self, trial_idx):
+        """Fill the question screen with the question of trial trial_idx (without raising it)."""
+        row = self.paragraphs[self.trial_indices[trial_idx]]
+        trial_number = trial_idx + 1
+        question_text, options = self.question_content(row, trial_number)
 
-        q_label = ctk.CTkLabel(
-            master=self.frame,
-            text=question_text,
-            font=self.text_font,
-            wraplength=1000,
-            justify="left",
-        )
-        q_label.pack(pady=(10, 20), padx=40)
-
-        self.mc_response_var.set("")  # clear previous selection
-
-        # Radio buttons for options
+        self.question_header.configure(text=f"Question for Paragraph {trial_number}")
+        self.question_label.configure(text=question_text)
         for opt_text, opt_label in options:
-            rb = ctk.CTkRadioButton(
-                master=self.frame,
-                text=f"{opt_label}. {opt_text}",
-                value=opt_label,
-                variable=self.mc_response_var,
-                font=self.text_font,
-            )
-            rb.pack(anchor="w", padx=60, pady=5)
+            self.option_buttons[opt_label].configure(text=f"{opt_label}. {opt_text}")
+
+        # Re-pack the radio buttons only if the set of options changed
+        visible = [opt_label for _, opt_label in options]
+        if visible != self.visible_options:
+            for rb in self.option_buttons.values():
+                rb.pack_forget()
+            for opt_label in visible:
+                self.option_buttons[opt_label].pack(anchor="w", padx=60, pady=5)
+            self.visible_options = visible
+        self.question_trial_idx = trial_idx
+
+    def prefetch_question(self):
+        """During the reading phase, fill and lay out the (hidden) question screen of the current trial."""
+        if self.current_screen != "trial" or self.question_trial_idx == self.current_trial_idx:
+            return
+        self.prepare_question_screen(self.current_trial_idx)
+        self.root.update_idletasks()
 
-        continue_button = ctk.CTkButton(
-            master=self.frame,
-            text="Continue",
-            command=self.finish_question_phase,
-            height=self.button_height,
-            width=self.button_width,
-            font=self.button_font,
-        )
-        continue_button.pack(pady=(20, 30))
+    def show_question_page(self):
+        """Show a multiple-choice question about the current paragraph."""
+        request_ns = self.clock.now_ns()
+        self.current_screen = "question"
 
-        if self.participant_id_display:
-            pid_label = ctk.CTkLabel(
-                master=self.frame,
-                text=self.participant_id_display,
-                font=("Open Sans", 12),
-            )
-            pid_label.pack(padx=20, pady=10, anchor="w")
+        self.question_prefetched = self.question_trial_idx == self.current_trial_idx
+        if not self.question_prefetched:
+            self.prepare_question_screen(self.current_trial_idx)
+        self.mc_response_var.set("")  # clear previous selection
+
+        # Start question timer at the onset
+        self.question_start_ns = self.present_screen(self.question_screen)
+        self.markers.mark("question_onset", self.current_trial_idx, self.question_start_ns)
+        self.question_onset_latency_ms = (self.question_start_ns - request_ns) / 1e6
 
-        # Start question timer
-        self.question_start_time = time.time()
+        # Prepare the next paragraph while the participant answers
+        self.root.after_idle(self.prefetch_next_trial)
 
     def finish_question_phase(self):
         """Record MC response and move to the next trial."""
@@ -410,16 +719,22 @@ class EEGReadingGUI:
             messagebox.showinfo("Response required", "Please select an option before continuing.")
             return
 
-        end_time = time.time()
-        q_rt = end_time - (self.question_start_time or end_time)
+        end_ns = self.clock.now_ns()
+        self.markers.mark("response", self.current_trial_idx, end_ns)
+        start_ns = self.question_start_ns if self.question_start_ns is not None else end_ns
+        q_rt = (end_ns - start_ns) / 1e9
 
         if self.current_log_entry is None:
             self.current_log_entry = {}
 
         self.current_log_entry["question_response"] = choice
-        self.current_log_entry["question_start_time_unix"] = self.question_start_time
-        self.current_log_entry["question_end_time_unix"] = end_time
+        self.current_log_entry["question_start_time_unix"] = self.clock.to_unix(start_ns)
+        self.current_log_entry["question_end_time_unix"] = self.clock.to_unix(end_ns)
         self.current_log_entry["question_time_sec"] = q_rt
+        self.current_log_entry["question_start_perf_ns"] = start_ns
+        self.current_log_entry["question_end_perf_ns"] = end_ns
+        self.current_log_entry["question_onset_latency_ms"] = self.question_onset_latency_ms
+        self.current_log_entry["question_prefetched"] = self.question_prefetched
 
         # If CSV has a 'correct_option' column, log correctness
         correct_option = self.paragraphs[self.current_paragraph_idx].get("correct_option")
@@ -427,34 +742,14 @@ class EEGReadingGUI:
             self.current_log_entry["question_correct_option"] = correct_option
             self.current_log_entry["question_is_correct"] = (choice == correct_option)
 
-        # Append this trial to the log
-        self.log_rows.append(self.current_log_entry)
+        # Append this trial to the log file (one row, flushed to disk)
+        self.trial_logger.write_row(self.current_log_entry)
         self.current_log_entry = None
 
-        # Autosave after each trial
-        self.save_log_partial()
-
         # Next trial
         self.current_trial_idx += 1
         self.show_trial()
 
-    # ---------------------- Intermittent saving -------------------
-    def save_log_partial(self):
-        """Write current log_rows to disk without closing the app."""
-        if not self.log_rows:
-            return
-
-        if self.participant_id is None:
-            fname = "EEG_log_unknown.csv"
-        else:
-            fname = f"EEG_log_{self.participant_id}.csv"
-
-        os.makedirs("logs", exist_ok=True)
-        out_path = os.path.join("logs", fname)
-
-        df_log = pd.DataFrame(self.log_rows)
-        df_log.to_csv(out_path, index=False)
-
     # ---------------------- End screen & saving -------------------
 
     def show_end_screen(self):
@@ -498,18 +793,14 @@ class EEGReadingGUI:
             pid_label.pack(padx=20, pady=10, anchor="w")
 
     def save_and_quit(self):
-        # Save log_rows to a CSV
-        if self.participant_id is None:
-            fname = "EEG_log_unknown.csv"
-        else:
-            fname = f"EEG_log_{self.participant_id}.csv"
-
-        os.makedirs("logs", exist_ok=True)
-        out_path = os.path.join("logs", fname)
+        # Send any queued markers, then close the marker log and transport
+        if self.markers is not None:
+            self.markers.close()
 
-        df_log = pd.DataFrame(self.log_rows)
-        df_log.to_csv(out_path, index=False)
-        print(f"Saved trial log to {out_path}")
+        # Every trial is already on disk; just close the log file
+        if self.trial_logger is not None:
+            self.trial_logger.close()
+            print(f"Saved trial log to {self.trial_logger.out_path}")
 
         self.root.destroy()
 
@@ -517,5 +808,13 @@ class EEGReadingGUI:
 if __name__ == "__main__":
     # Point this to your final stimuli CSV
     STIMULI_CSV = "../database_storage/database_18-gpt5_1-full-120_to_150_words.csv"
-    app = EEGReadingGUI(STIMULI_CSV, shuffle_trials=True)
+
+    # Event-marker output (see event_markers.py), e.g.
+    #   UDPTransport("192.168.1.10", 12345), LSLTransport(),
+    #   SerialTTLTransport("COM3"), ParallelPortTTLTransport(0x378);
+    # LocalTransport() / LocalTTLTransport() run without EEG hardware. TTL pulses last pulse_ms (default 2 ms, enough
+    # for 1000 Hz sampling; use e.g. pulse_ms=4 at 500 Hz), and a marker due during a pulse waits for it to end.
+    MARKER_TRANSPORT = LocalTransport()
+
+    app = EEGReadingGUI(STIMULI_CSV, shuffle_trials=True, marker_transport=MARKER_TRANSPORT)
     app.run()
\ No newline at end of file
@@ -0,0 +1,341 @@
+import abc
+import atexit
+import csv
+import importlib
+import io
+import queue
+import socket
+import threading
+import time
+from collections import namedtuple
+
+from log_writer import BackgroundWriter
+
+# Marker codes (one byte, so they also fit a TTL/parallel-port trigger). "test" is sent once when the sender starts,
+# before the first trial, to check that the transport works.
+MARKER_CODES = {
+    "test": 1,
+    "reading_onset": 10,
+    "reading_end": 20,
+    "question_onset": 30,
+    "response": 40,
+}
+
+Marker = namedtuple("Marker", ["index", "label", "code", "trial_index", "event_ns"])
+
+
+def _optional_import(module, package):
+    try:
+        return importlib.import_module(module)
+    except ImportError as err:
+        raise ImportError(f"This marker transport needs the optional package '{package}' "
+                          f"(pip install {package}).") from err
+
+
+# ---------------------- Transports ----------------------
+
+class LocalTransport:
+    """
+    Stand-in transport for running without EEG hardware: keeps every
+    marker in memory (self.sent) and does nothing else.
+    """
+
+    name = "local"
+
+    def __init__(self):
+        self.sent = []
+
+    def open(self):
+        pass
+
+    def send(self, marker):
+        self.sent.append(marker)
+
+    def close(self):
+        pass
+
+
+class UDPTransport:
+    """
+    One UDP datagram per marker ("label,code,trial_index,event_ns"), e.g.
+    to a local marker bus or the recording PC. UDP never waits for the
+    receiver, so a send costs a single system call.
+    """
+
+    name = "udp"
+
+    def __init__(self, host="127.0.0.1", port=12345):
+        self.address = (host, port)
+        self.sock = None
+
+    def open(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, marker):
+        payload = f"{marker.label},{marker.code},{marker.trial_index},{marker.event_ns}"
+        self.sock.sendto(payload.encode("ascii"), self.address)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+
+
+class LSLTransport:
+    """
+    Lab Streaming Layer marker stream (needs pylsl). Each marker is pushed
+    as the string "label,code,trial_index" and back-dated to the time of
+    the event, so the LSL timestamp is that of the event, not of the send.
+    """
+
+    name = "lsl"
+
+    def __init__(self, stream_name="EEGReadingMarkers", source_id="eeg_reading_gui"):
+        self.stream_name = stream_name
+        self.source_id = source_id
+        self.pylsl = None
+        self.outlet = None
+
+    def open(self):
+        self.pylsl = _optional_import("pylsl", "pylsl")
+        info = self.pylsl.StreamInfo(self.stream_name, "Markers", 1, self.pylsl.IRREGULAR_RATE, "string",
+                                     self.source_id)
+        self.outlet = self.pylsl.StreamOutlet(info)
+
+    def send(self, marker):
+        delay_s = (time.perf_counter_ns() - marker.event_ns) / 1e9
+        self.outlet.push_sample([f"{marker.label},{marker.code},{marker.trial_index}"],
+                                self.pylsl.local_clock() - delay_s)
+
+    def close(self):
+        self.outlet = None
+
+
+class TTLTransport(abc.ABC):
+    """
+    TTL trigger: the marker code is put on the trigger lines, held for
+    pulse_ms and reset to 0. Subclasses implement set_lines; the pulse is
+    timed on the marker thread, never on the Tk thread.
+
+    The marker thread sends one marker at a time, so a marker whose event
+    happens while a pulse is held goes out only when that pulse ends, up
+    to pulse_ms late. reading_end and question_onset are a few ms apart,
+    so the question_onset trigger is typically delayed this way. Keep
+    pulse_ms as short as the amplifier allows (at least two samples:
+    2 ms is enough for 1000 Hz, use 4 ms at 500 Hz); the marker log
+    records every delay and the sender warns only when a marker waited
+    longer than two pulses, i.e. behind more than one earlier marker.
+    """
+
+    name = "ttl"
+
+    def __init__(self, pulse_ms=2):
+        self.pulse_ms = pulse_ms
+
+    def open(self):
+        pass
+
+    @abc.abstractmethod
+    def set_lines(self, code):
+        """Put code on the trigger lines (0 resets them)."""
+
+    def send(self, marker):
+        self.set_lines(marker.code)
+        time.sleep(self.pulse_ms / 1000)
+        self.set_lines(0)
+
+    def close(self):
+        pass
+
+
+class SerialTTLTransport(TTLTransport):
+    """TTL through a serial trigger box (e.g. a USB TriggerBox) that sets its lines to each byte written (pyserial)."""
+
+    name = "serial_ttl"
+
+    def __init__(self, port, baudrate=115200, pulse_ms=2):
+        super().__init__(pulse_ms)
+        self.port = port
+        self.baudrate = baudrate
+        self.serial = None
+
+    def open(self):
+        serial = _optional_import("serial", "pyserial")
+        self.serial = serial.Serial(self.port, self.baudrate, write_timeout=0.1)
+        self.set_lines(0)
+
+    def set_lines(self, code):
+        self.serial.write(bytes([code]))
+        self.serial.flush()
+
+    def close(self):
+        if self.serial is not None:
+            self.serial.close()
+
+
+class ParallelPortTTLTransport(TTLTransport):
+    """TTL through the data lines of a parallel port (pyparallel)."""
+
+    name = "parallel_ttl"
+
+    def __init__(self, port=0, pulse_ms=2):
+        super().__init__(pulse_ms)
+        self.port = port
+        self.parallel = None
+
+    def open(self):
+        parallel = _optional_import("parallel", "pyparallel")
+        self.parallel = parallel.Parallel(self.port)
+        self.set_lines(0)
+
+    def set_lines(self, code):
+        self.parallel.setData(code)
+
+
+class LocalTTLTransport(TTLTransport):
+    """
+    Stand-in for a TTL port: records every line change as
+    (perf_counter_ns, code) in self.line_changes, with the same pulse
+    timing as a real port.
+    """
+
+    name = "local_ttl"
+
+    def __init__(self, pulse_ms=2):
+        super().__init__(pulse_ms)
+        self.line_changes = []
+
+    def set_lines(self, code):
+        self.line_changes.append((time.perf_counter_ns(), code))
+
+
+# ---------------------- Sender ----------------------
+
+class EventMarkerSender:
+    """
+    Sends event markers from a dedicated thread.
+
+    mark() only stamps the marker with the event's perf_counter_ns time
+    (or takes the one given), puts it on an unbounded queue and yields the
+    GIL; the marker thread blocks on that queue, so it wakes up as soon as
+    a marker arrives and the send does not wait for the Tk work that
+    follows the event. For every marker the log records the event time,
+    when the thread started and finished the send, the resulting queue,
+    send and total (event to sent) latencies in microseconds, and any
+    transport error. The log is written through a BackgroundWriter.
+
+    Before the thread starts, a "test" marker is sent on the calling
+    thread: a transport that cannot be opened or cannot send raises a
+    RuntimeError there, when the session starts, instead of failing
+    silently at the first trial. Later send errors are logged, and the
+    first one is also printed.
+
+    close() sends everything still queued, then closes the transport and
+    the log; it is also registered with atexit.
+    """
+
+    log_columns = ["marker_index", "label", "code", "trial_index", "transport", "event_perf_ns",
+                   "send_start_perf_ns", "sent_perf_ns", "queue_latency_us", "send_duration_us",
+                   "total_latency_us", "error"]
+
+    _CLOSE = object()
+
+    def __init__(self, transport, log_path):
+        self.transport = transport
+        self.n_marked = 0
+        self.n_errors = 0
+        self.closed = False
+
+        self._log = BackgroundWriter(log_path, mode="w", newline="")
+        self._buffer = io.StringIO()
+        self._formatter = csv.DictWriter(self._buffer, fieldnames=self.log_columns)
+        self._formatter.writeheader()
+        self._flush_log_buffer()
+
+        try:
+            self.transport.open()
+        except Exception as e:
+            self._log.close()
+            raise RuntimeError(f"Could not open the '{transport.name}' marker transport: {e}") from e
+        self._send(Marker(self.n_marked, "test", MARKER_CODES["test"], None, time.perf_counter_ns()))
+        self.n_marked += 1
+        if self.n_errors:
+            self.transport.close()
+            self._log.close()
+            raise RuntimeError(f"The '{transport.name}' marker transport could not send the test marker "
+                               f"(see {log_path}).")
+
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="EventMarkerSender", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def mark(self, label, trial_index=None, event_ns=None):
+        """Queue a marker for an event (label from MARKER_CODES) that happened at event_ns (default: now)."""
+        if event_ns is None:
+            event_ns = time.perf_counter_ns()
+        if self.closed:
+            return
+        self._queue.put(Marker(self.n_marked, label, MARKER_CODES[label], trial_index, event_ns))
+        self.n_marked += 1
+        # Give up the GIL so the marker thread sends now instead of after the
+        # interpreter's next thread switch (up to 5 ms while Tk work runs)
+        time.sleep(0)
+
+    def close(self):
+        """Send the queued markers, then close the transport and the marker log."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(self._CLOSE)
+        self._thread.join()
+        self.transport.close()
+        self._log.close()
+        atexit.unregister(self.close)
+
+    def _flush_log_buffer(self):
+        self._log.write(self._buffer.getvalue())
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def _run(self):
+        while True:
+            marker = self._queue.get()
+            if marker is self._CLOSE:
+                return
+            self._send(marker)
+
+    def _send(self, marker):
+        error = ""
+        send_start_ns = time.perf_counter_ns()
+        try:
+            self.transport.send(marker)
+        except Exception as e:  # a failing trigger port must not stop the experiment
+            error = f"{type(e).__name__}: {e}"
+            if not self.n_errors:
+                print(f"[warn] Marker transport '{self.transport.name}' failed to send '{marker.label}': {error}")
+            self.n_errors += 1
+        sent_ns = time.perf_counter_ns()
+
+        # Waiting for one earlier pulse (slightly over pulse_ms, as sleep overshoots) is expected and only logged;
+        # a marker that waited longer than two pulses was held up by more than the previous marker
+        pulse_ms = getattr(self.transport, "pulse_ms", None)
+        queue_ms = (send_start_ns - marker.event_ns) / 1e6
+        if pulse_ms is not None and queue_ms > 2 * pulse_ms:
+            print(f"[warn] Marker '{marker.label}' (trial {marker.trial_index}) went out {queue_ms:.1f} ms after its "
+                  f"event, longer than two {pulse_ms} ms TTL pulses.")
+
+        self._formatter.writerow({
+            "marker_index": marker.index,
+            "label": marker.label,
+            "code": marker.code,
+            "trial_index": marker.trial_index,
+            "transport": self.transport.name,
+            "event_perf_ns": marker.event_ns,
+            "send_start_perf_ns": send_start_ns,
+            "sent_perf_ns": sent_ns,
+            "queue_latency_us": (send_start_ns - marker.event_ns) / 1e3,
+            "send_duration_us": (sent_ns - send_start_ns) / 1e3,
+            "total_latency_us": (sent_ns - marker.event_ns) / 1e3,
+            "error": error,
+        })
+        self._flush_log_buffer()
@@ -1,4 +1,5 @@
 import itertools
+import sys
 import threading
 import time
 import random
@@ -12,6 +13,7 @@ from customtkinter import CTkImage
 
 import openai_interact_rewrite
 import openai_interact_profile
+from log_writer import BackgroundWriter
 
 
 class GUI:
@@ -172,13 +174,13 @@ class GUI:
                 self.experiment_version = selected_group
                 self.participant_id_display = "ID: " + participant_id
 
-                # Write the participant ID to the output file.
+                # Change the stdout to the output file to capture further output. The file is written by a
+                # background thread, so print() (from the GUI or the GPT threads) never waits on the disk.
                 filename = f"{time.strftime('%Y-%m-%d %H-%M-%S')}" + f" ID-{participant_id}" + ".txt"
-                with open(filename, 'w') as f:
-                    f.write(f"Participant ID: {self.participant_id}\n\n")
+                sys.stdout = BackgroundWriter(filename, mode='w')
 
-                # Change the stdout to the file to capture further output.
-                sys.stdout = open(filename, 'a')
+                # Write the participant ID to the output file.
+                print(f"Participant ID: {self.participant_id}\n")
 
                 # Initialize the file & table:
                 print(f"Group: {self.experiment_version}")
@@ -1035,6 +1037,11 @@ class GUI:
         print(f"\n\n---\nTotal GUI Runtime (From Instructions Screen): {(self.quitGUI - self.startGUI):.8} s")
         self.root.destroy()
 
+        # Write out everything still queued and close the output file.
+        if isinstance(sys.stdout, BackgroundWriter):
+            log_writer, sys.stdout = sys.stdout, sys.__stdout__
+            log_writer.close()
+
     def set_text(self, page_num: int, title: str, text1: str, text2=""):
         '''Set the text for given page.
         Pages:
@@ -1050,7 +1057,5 @@ class GUI:
 
 
 if __name__ == "__main__":
-    import sys
-
     app = GUI()
     app.run()
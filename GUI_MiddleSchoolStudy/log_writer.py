@@ -0,0 +1,104 @@
+import atexit
+import os
+import queue
+import threading
+
+
+class BackgroundWriter:
+    """
+    File-like text writer whose disk I/O happens on a background thread.
+
+    write() only puts the text on a bounded queue, so the Tk main thread
+    never waits on the disk (unless the queue is full, i.e. the disk has
+    fallen more than maxsize writes behind). The writer thread takes
+    everything queued so far in one batch, writes it, flushes the file
+    and, with fsync=True, forces it to disk before taking the next batch.
+
+    close() drains the queue, flushes, fsyncs and closes the file; it is
+    also registered with atexit so that queued text is written even if the
+    window is closed without going through the normal exit path. The
+    object can replace sys.stdout: print() from any thread just enqueues.
+    """
+
+    _CLOSE = object()
+
+    def __init__(self, path, mode="a", maxsize=10000, batch_size=512, fsync=False, encoding="utf-8",
+                 newline=None):
+        self.path = path
+        self.encoding = encoding
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.error = None
+        self.closed = False
+
+        self._file = open(path, mode, encoding=encoding, newline=newline)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, name=f"BackgroundWriter({path})", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------------------- Caller side ----------------------
+
+    def write(self, text):
+        """Queue text for writing; returns its length like io.TextIOBase.write."""
+        if self.closed:
+            raise ValueError(f"I/O operation on closed BackgroundWriter ({self.path}).")
+        if self.error is not None:
+            raise self.error
+        if text:
+            self._queue.put(text)
+        return len(text)
+
+    def flush(self):
+        """No-op for callers: the writer thread flushes after every batch."""
+
+    def isatty(self):
+        return False
+
+    def close(self):
+        """Write everything still queued, flush and fsync, close the file and stop the thread."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(self._CLOSE)
+        self._thread.join()
+        atexit.unregister(self.close)
+        if self.error is not None:
+            raise self.error
+
+    # ---------------------- Writer thread ----------------------
+
+    def _write_batch(self, batch):
+        if self.error is not None:
+            return
+        try:
+            self._file.write("".join(batch))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError as e:
+            self.error = e
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not self._CLOSE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            closing = batch[-1] is self._CLOSE
+            if closing:
+                batch.pop()
+            if batch:
+                self._write_batch(batch)
+
+            if closing:
+                try:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self._file.close()
+                except OSError as e:
+                    self.error = self.error or e
+                return
@@ -0,0 +1,275 @@
+"""Vectorised pairwise association statistics (chi-square, Cramér's V, Bergsma-corrected V) between categorical factors.
+
+All factors are integer-coded once. Every pairwise contingency table is then filled by a single np.bincount over
+combined codes (offset of the pair's table + row level * n_col_levels + col level), in chunks of rows to bound memory.
+The statistics are computed for all tables of the same shape at once, and the tables may carry leading batch
+dimensions: the bootstrap fills the tables of a whole chunk of resamples with one bincount by adding a per-resample
+offset to the combined codes, and the jackknife of its BCa intervals gets every leave-one-out table by subtracting one
+row's cells from the full counts."""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2 as chi2_dist
+from scipy.stats import norm
+
+
+def encode_factors(df, cols):
+    """Integer-code each column (levels sorted, missing values -> -1). Returns (codes (n_rows, n_cols), levels)."""
+    codes = np.empty((len(df), len(cols)), dtype=np.int64)
+    levels = []
+    for j, col in enumerate(cols):
+        codes[:, j], uniques = pd.factorize(df[col], sort=True)
+        levels.append(list(uniques))
+    return codes, levels
+
+
+def table_layout(n_levels, pairs):
+    """Offsets and shapes of the pairwise tables inside one flat count vector."""
+    shapes = [(n_levels[a], n_levels[b]) for a, b in pairs]
+    sizes = np.array([r * c for r, c in shapes], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    return offsets, shapes, int(sizes.sum())
+
+
+def combined_codes(codes, n_levels, pairs, offsets, missing_bin):
+    """Position of every (pair, row) in the flat count vector, shape (n_pairs, n_rows).
+
+    Rows missing either factor of a pair go to missing_bin. The codes are transposed first so that gathering the
+    factor columns of all pairs is a contiguous row copy."""
+    a_idx = np.array([a for a, _ in pairs])
+    b_idx = np.array([b for _, b in pairs])
+    dtype = np.int32 if missing_bin < np.iinfo(np.int32).max else np.int64
+    codes_t = np.ascontiguousarray(codes.T, dtype=dtype)
+
+    combined = codes_t[a_idx] * np.asarray(n_levels, dtype=dtype)[b_idx][:, None]
+    combined += offsets.astype(dtype)[:, None]
+    combined += codes_t[b_idx]
+    if (codes_t < 0).any():
+        combined[(codes_t[a_idx] < 0) | (codes_t[b_idx] < 0)] = missing_bin
+    return combined
+
+
+def contingency_counts(codes, n_levels, pairs, chunk_size=200_000):
+    """Counts of every pairwise contingency table, flattened into one vector (see table_layout)."""
+    offsets, shapes, total = table_layout(n_levels, pairs)
+    counts = np.zeros(total + 1, dtype=np.int64)
+    for start in range(0, codes.shape[0], chunk_size):
+        combined = combined_codes(codes[start:start + chunk_size], n_levels, pairs, offsets, missing_bin=total)
+        counts += np.bincount(combined.ravel(), minlength=total + 1)
+    return counts[:total], offsets, shapes
+
+
+def association_stats(counts, offsets, shapes):
+    """Chi-square statistics for flat table counts of shape (..., total); one result per pair along the last axis.
+
+    Levels that do not occur in a table (zero margin) are dropped, like pd.crosstab does. Returns a dict of arrays
+    (..., n_pairs): chi2, p, dof, v (Cramér's V) and v_corr (Bergsma 2013 bias-corrected V)."""
+    batch_shape = counts.shape[:-1]
+    out = {name: np.full(batch_shape + (len(shapes),), np.nan) for name in ("chi2", "p", "dof", "v", "v_corr")}
+
+    shape_groups = {}
+    for i, shape in enumerate(shapes):
+        shape_groups.setdefault(shape, []).append(i)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for (n_rows, n_cols), idx in shape_groups.items():
+            cells = offsets[idx][:, None] + np.arange(n_rows * n_cols)
+            observed = counts[..., cells].reshape(batch_shape + (len(idx), n_rows, n_cols)).astype(float)
+
+            n = observed.sum(axis=(-2, -1))
+            row_sum = observed.sum(axis=-1)
+            col_sum = observed.sum(axis=-2)
+            expected = row_sum[..., :, None] * col_sum[..., None, :] / n[..., None, None]
+            chi2 = np.where(expected > 0, (observed - expected) ** 2 / expected, 0.0).sum(axis=(-2, -1))
+
+            r = (row_sum > 0).sum(axis=-1)
+            c = (col_sum > 0).sum(axis=-1)
+            dof = (r - 1) * (c - 1)
+
+            # Cramér's V = sqrt((chi2 / n) / (min(r, c) - 1))
+            phi2 = chi2 / n
+            v = np.sqrt(phi2 / (np.minimum(r, c) - 1))
+
+            # Bergsma (2013)'s correction for Cramér's V
+            phi2_corr = np.maximum(0, phi2 - (c - 1) * (r - 1) / (n - 1))
+            r_corr = r - (r - 1) ** 2 / (n - 1)
+            c_corr = c - (c - 1) ** 2 / (n - 1)
+            v_corr = np.sqrt(phi2_corr / np.minimum(c_corr - 1, r_corr - 1))
+
+            out["chi2"][..., idx] = chi2
+            out["p"][..., idx] = chi2_dist.sf(chi2, dof)
+            out["dof"][..., idx] = dof
+            out["v"][..., idx] = v
+            out["v_corr"][..., idx] = v_corr
+    return out
+
+
+def upper_triangle_pairs(n_cols):
+    """All pairs (i, j) with i <= j (the diagonal is included, matching the original all-pairs matrices)."""
+    return [(i, j) for i in range(n_cols) for j in range(i, n_cols)]
+
+
+def to_matrices(stats, pairs, cols):
+    """Mirror per-pair statistics into symmetric DataFrames, one per statistic."""
+    matrices = {}
+    for name, values in stats.items():
+        matrix = np.zeros((len(cols), len(cols)))
+        for (i, j), value in zip(pairs, values):
+            matrix[i, j] = matrix[j, i] = value
+        matrices[name] = pd.DataFrame(matrix, index=cols, columns=cols)
+    return matrices
+
+
+def pairwise_association(df, cols, chunk_size=200_000):
+    """Chi-square p-values, dofs, Cramér's V and Bergsma-corrected V for every pair of cols.
+
+    Returns a dict of symmetric DataFrames with keys "v", "v_corr", "p", "dof" and "chi2"."""
+    codes, levels = encode_factors(df, cols)
+    return association_from_codes(codes, [len(lv) for lv in levels], cols, chunk_size=chunk_size)
+
+
+def association_from_codes(codes, n_levels, cols, chunk_size=200_000):
+    """pairwise_association on factors already coded by encode_factors (e.g. codes[rows] for a subset of rows, so
+    that the whole table is encoded only once). Levels that do not occur in the rows are dropped from the tables."""
+    pairs = upper_triangle_pairs(len(cols))
+    counts, offsets, shapes = contingency_counts(codes, n_levels, pairs, chunk_size=chunk_size)
+    return to_matrices(association_stats(counts, offsets, shapes), pairs, cols)
+
+
+def jackknife_association(combined, total, offsets, shapes, max_cells=20_000_000):
+    """Bergsma-corrected V of every leave-one-row-out sample, shape (n_rows, n_pairs).
+
+    A leave-one-out table is the full table minus the left-out row's cell, so the counts of a chunk of left-out rows
+    are the full counts repeated, with one subtracted at each row's combined code."""
+    n_pairs, n_rows = combined.shape
+    n_bins = total + 1
+    full = np.bincount(combined.ravel(), minlength=n_bins)
+    chunk = max(1, min(n_rows, max_cells // n_bins))
+
+    v_corr_jack = np.empty((n_rows, n_pairs))
+    for start in range(0, n_rows, chunk):
+        rows = np.arange(start, min(start + chunk, n_rows))
+        counts = np.tile(full, (len(rows), 1))
+        np.subtract.at(counts, (np.repeat(np.arange(len(rows)), n_pairs), combined[:, rows].T.ravel()), 1)
+        v_corr_jack[rows] = association_stats(counts[:, :total], offsets, shapes)["v_corr"]
+    return v_corr_jack
+
+
+def bca_interval(boot, estimate, jack, ci=95):
+    """Bias-corrected and accelerated (BCa, Efron 1987) bootstrap interval of every column.
+
+    boot: (n_boot, n_pairs) bootstrap replicates, estimate: (n_pairs,) full-sample values, jack: (n_rows, n_pairs)
+    leave-one-out values. The bias correction z0 comes from the share of replicates below the estimate (ties count
+    half, since V_corr is often exactly 0) and the acceleration from the skewness of the jackknife values. Returns
+    (lower, upper)."""
+    n_boot = boot.shape[0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        valid = (~np.isnan(boot)).sum(axis=0)
+        below = (boot < estimate).sum(axis=0) + 0.5 * (boot == estimate).sum(axis=0)
+        share = np.clip(below / valid, 0.5 / n_boot, 1 - 0.5 / n_boot)
+        z0 = norm.ppf(share)
+
+        dev = np.nanmean(jack, axis=0) - jack
+        accel = (dev ** 3).sum(axis=0) / (6 * ((dev ** 2).sum(axis=0)) ** 1.5)
+        accel = np.where(np.isfinite(accel), accel, 0.0)
+
+        tail = (100 - ci) / 200
+        bounds = []
+        for z_alpha in (norm.ppf(tail), norm.ppf(1 - tail)):
+            q = norm.cdf(z0 + (z0 + z_alpha) / (1 - accel * (z0 + z_alpha)))
+            bounds.append(np.array([
+                np.nanpercentile(boot[:, j], 100 * q[j]) if valid[j] else np.nan for j in range(boot.shape[1])
+            ]))
+    return bounds[0], bounds[1]
+
+
+def bootstrap_association(df, cols, n_boot=10_000, ci=95, max_cells=20_000_000, random_state=0):
+    """BCa bootstrap confidence intervals for the Bergsma-corrected V of every pair of cols.
+
+    Rows are resampled with replacement n_boot times. The combined codes are computed once; a chunk of resamples is
+    an (n_chunk, n_rows) index matrix, and all their tables come from one bincount. n_chunk is chosen so that at most
+    max_cells (pair, resample, row) entries are held in memory at a time. The intervals are bias-corrected and
+    accelerated (bca_interval), with the acceleration from a jackknife over the rows.
+
+    Only V_corr gets an interval. The uncorrected V of a resample is biased upwards, so strongly that for a nearly
+    orthogonal design every resample lies above the estimate (genre x topic_hint in database 19: V = 0.022, bootstrap
+    mean 0.20): neither percentile nor BCa intervals of V then cover the estimate.
+
+    Returns a dict of symmetric DataFrames: v_corr_ci_lower, v_corr_ci_upper."""
+    codes, levels = encode_factors(df, cols)
+    n_levels = [len(lv) for lv in levels]
+    pairs = upper_triangle_pairs(len(cols))
+    offsets, shapes, total = table_layout(n_levels, pairs)
+    n_rows = codes.shape[0]
+
+    combined = combined_codes(codes, n_levels, pairs, offsets, missing_bin=total).astype(np.int64)
+    n_bins = total + 1
+    chunk = max(1, min(n_boot, max_cells // (len(pairs) * n_rows)))
+
+    rng = np.random.default_rng(random_state)
+    v_corr_boot = np.empty((n_boot, len(pairs)))
+    for start in range(0, n_boot, chunk):
+        b = min(chunk, n_boot - start)
+        idx = rng.integers(0, n_rows, size=(b, n_rows))
+        sample_codes = combined[:, idx]                                   # (n_pairs, b, n_rows)
+        sample_codes += (np.arange(b) * n_bins)[None, :, None]
+        counts = np.bincount(sample_codes.ravel(), minlength=b * n_bins).reshape(b, n_bins)[:, :total]
+
+        v_corr_boot[start:start + b] = association_stats(counts, offsets, shapes)["v_corr"]
+
+    estimate = association_stats(np.bincount(combined.ravel(), minlength=n_bins)[:total], offsets, shapes)["v_corr"]
+    v_corr_jack = jackknife_association(combined, total, offsets, shapes, max_cells=max_cells)
+
+    lower, upper = bca_interval(v_corr_boot, estimate, v_corr_jack, ci)
+    return to_matrices({"v_corr_ci_lower": lower, "v_corr_ci_upper": upper}, pairs, cols)
+
+
+def threeway_association(df, cols, chunk_size=200_000):
+    """Cramér's V between every factor k and the joint levels of every pair of other factors (i, j).
+
+    A large value means that knowing i and j together largely determines k, even if no single pair is confounded.
+    Returns a DataFrame with one row per (i, j, k), sorted by decreasing V."""
+    codes, levels = encode_factors(df, cols)
+    n_levels = [len(lv) for lv in levels]
+    n_cols = len(cols)
+
+    # Append one joint column per pair (i, j); missing in either factor -> missing joint code
+    joint_pairs = [(i, j) for i in range(n_cols) for j in range(i + 1, n_cols)]
+    joint_codes = np.column_stack([
+        np.where((codes[:, i] < 0) | (codes[:, j] < 0), -1, codes[:, i] * n_levels[j] + codes[:, j])
+        for i, j in joint_pairs
+    ])
+    all_codes = np.hstack([codes, joint_codes])
+    all_levels = n_levels + [n_levels[i] * n_levels[j] for i, j in joint_pairs]
+
+    triples = [(i, j, k) for i, j in joint_pairs for k in range(n_cols) if k not in (i, j)]
+    pairs = [(n_cols + joint_pairs.index((i, j)), k) for i, j, k in triples]
+    counts, offsets, shapes = contingency_counts(all_codes, all_levels, pairs, chunk_size=chunk_size)
+    stats = association_stats(counts, offsets, shapes)
+
+    return pd.DataFrame({
+        "factor_i": [cols[i] for i, _, _ in triples],
+        "factor_j": [cols[j] for _, j, _ in triples],
+        "factor_k": [cols[k] for _, _, k in triples],
+        "v": stats["v"],
+        "v_corr": stats["v_corr"],
+    }).sort_values("v", ascending=False, ignore_index=True)
+
+
+def design_confounding(design_df, cols):
+    """Pairwise and three-way confounding summary of a design matrix (one row per planned paragraph).
+
+    Returns a dict with the largest off-diagonal pairwise V and its pair, the largest three-way V and its triple, and
+    the full pairwise V matrix / three-way table."""
+    pairwise = pairwise_association(design_df, cols)["v"]
+    off_diag = pairwise.where(~np.eye(len(cols), dtype=bool))
+    worst_pair = off_diag.stack().idxmax()
+    threeway = threeway_association(design_df, cols)
+    return {
+        "max_pairwise_v": off_diag.loc[worst_pair],
+        "worst_pair": worst_pair,
+        "max_threeway_v": threeway.loc[0, "v"],
+        "worst_triple": tuple(threeway.loc[0, ["factor_i", "factor_j", "factor_k"]]),
+        "pairwise_v": pairwise,
+        "threeway": threeway,
+    }
@@ -0,0 +1,114 @@
+#%% Goal: check that each paragraph actually realises the style labels it was requested with. The generators only
+# assert that the model echoed the labels in its JSON; here every factor is estimated from the text itself.
+#
+# Cheap local features (sentence/word length, lexical density, pronoun and hedge rates, optional sentiment and
+# concreteness lexicons, TF-IDF words) give an out-of-fold estimate of every label. Local agreements are kept only for
+# factors whose local model is accurate and calibrated enough; everything else (including every local disagreement)
+# is sent to an LLM judge, several paragraphs per request. A factor that fails the check is judged in full: on database
+# 21 predictability and emotional_valence are not recoverable from surface features, so every paragraph still goes to
+# the judge once, but only for the factors not settled locally. See label_audit.py.
+
+import os
+
+import pandas as pd
+from openai import OpenAI
+
+from label_audit import audit_labels, judge_batch
+from results_store import cached_result, file_hash
+from text_features import load_lexicon, text_features
+
+database_number = 21
+database_name = "gpt5_2-full-120_to_150_words"
+csv_path = f"../database_storage/database_{database_number}-{database_name}.csv"
+
+factors = ["genre", "difficulty", "predictability", "emotional_valence", "concreteness", "tone", "topic_hint"]
+
+# Optional word norms (skipped if the file is missing):
+#   Brysbaert, Warriner & Kuperman (2014) concreteness ratings: columns "Word", "Conc.M" (1 = abstract, 5 = concrete)
+#   NRC VAD lexicon (Mohammad 2018): tab-separated columns "Word", "Valence" (0 = negative, 1 = positive)
+concreteness_norms = ("../database_storage/lexicons/concreteness_brysbaert2014.csv", "Word", "Conc.M", ",")
+sentiment_norms = ("../database_storage/lexicons/NRC-VAD-Lexicon.txt", "Word", "Valence", "\t")
+
+confident = 0.7         # local P(requested level) needed to accept a label without the judge
+min_accuracy = 0.8      # out-of-fold accuracy a factor's local model needs before its agreements are accepted
+max_calibration_error = 0.1
+use_judge = True        # False: items not accepted locally stay unresolved (no API calls)
+judge_batch_size = 10
+gpt_model = "gpt-5.1-2025-11-13"
+
+JUDGE_PROMPT = """You are auditing short paragraphs written for a reading study. For every paragraph in the input,
+classify it on each requested field using only the text, and return one judgement per paragraph_id.
+
+- genre: 'narrative' (story or scene with a character and an outcome or decision) or 'expository' (factual
+  explanation or analysis of a concept, process, or situation).
+- difficulty: 'low' (middle school-level clarity, short simple sentences, little jargon) or 'high' (dense, advanced
+  undergraduate/graduate-level content, longer sentences, technical terms).
+- predictability: 'low' (main outcome or point is logical but non-obvious or surprising) or 'high' (main outcome or
+  point is expected from the setup).
+- emotional_valence: 'negative' (mild setbacks or concerns), 'neutral' (factual, uncoloured) or 'positive'
+  (curiosity, progress, satisfaction or hope).
+- concreteness: 'abstract' (ideas, theories, principles) or 'concrete' (specifics, tangible objects, sensory detail).
+- tone: 'plain' (neutral, textbook-like, direct) or 'reflective' (introspective, discusses experiences, challenges
+  or implications).
+- topic_hint: the subject area the paragraph belongs to.
+
+Judge what the text actually does, not what it was meant to do. Output only the JSON object."""
+
+#%% Local features (vectorised over the whole corpus)
+df = pd.read_csv(csv_path)
+data_hash = file_hash(csv_path)
+
+
+def optional_lexicon(path, word_col, score_col, sep):
+    if not os.path.exists(path):
+        print(f"[info] Lexicon {path} not found; skipping this feature.")
+        return None
+    return load_lexicon(path, word_col, score_col, sep=sep)
+
+
+features = text_features(
+    df["text"],
+    sentiment_lexicon=optional_lexicon(*sentiment_norms),
+    concreteness_lexicon=optional_lexicon(*concreteness_norms),
+)
+print(features.describe().T[["mean", "std", "min", "max"]].round(3).to_string())
+
+#%% Audit (judge verdicts are stored, so re-running does not repeat API calls)
+judge = None
+if use_judge:
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY_MCA"))
+
+    def judge(texts, factor_levels):
+        return judge_batch(client, gpt_model, JUDGE_PROMPT, texts, factor_levels)
+
+audit_params = {
+    "factors": factors,
+    "features": list(features.columns),
+    "confident": confident,
+    "min_accuracy": min_accuracy,
+    "max_calibration_error": max_calibration_error,
+    "judge_model": gpt_model if use_judge else None,
+    "judge_batch_size": judge_batch_size,
+}
+report, items = cached_result(
+    "label_audit", data_hash, audit_params,
+    lambda: audit_labels(df, factors, features, confident=confident, min_accuracy=min_accuracy,
+                         max_calibration_error=max_calibration_error, judge=judge,
+                         judge_batch_size=judge_batch_size),
+    database=f"database_{database_number}",
+)
+
+print("\n=== Requested vs. realised labels ===")
+print(report.drop(columns="flagged_ids").to_string(index=False))
+n_local = (items["source"] == "local").sum()
+n_judged_paragraphs = items.loc[items["source"] != "local", "paragraph_id"].nunique()
+print(f"\nJudge workload: {len(items) - n_local} of {len(items)} items ({n_local} settled locally), "
+      f"from {n_judged_paragraphs} of {len(df)} paragraphs")
+print("\n=== Flagged paragraph IDs (row positions in the database CSV) ===")
+for factor, ids in zip(report["factor"], report["flagged_ids"]):
+    print(f"{factor}: {ids}")
+
+out_dir = "../database_storage/label_audit"
+os.makedirs(out_dir, exist_ok=True)
+report.to_csv(f"{out_dir}/label_audit_report_database{database_number}.csv", index=False)
+items.to_csv(f"{out_dir}/label_audit_items_database{database_number}.csv", index=False)
@@ -6,7 +6,9 @@ these effects in the EEG analysis later."""
 import pandas as pd
 import numpy as np
 from scipy.stats import chi2_contingency
-from scipy.stats.contingency import association
+
+from association_engine import bootstrap_association, pairwise_association
+from results_store import cached_result, file_hash
 
 def cramers_v(x, y):
     cross_table = pd.crosstab(x, y)
@@ -20,10 +22,6 @@ def cramers_v(x, y):
 
     v = np.sqrt((chi2 / n_samples) / min_dim_minus_one)
 
-    v_association = association(cross_table.values, method="cramer", correction=False)
-
-    assert v_association==v
-
     # Optionally apply Bergsma (2013)'s correction for Cramer's V
     phi2 = chi2 / n_samples
     phi2_corr = max(0, phi2 - ((n_cols - 1) * (n_rows - 1)) / (n_samples - 1))
@@ -31,16 +29,26 @@ def cramers_v(x, y):
     c_corr = n_cols - ((n_cols - 1) ** 2) / (n_samples - 1)
     v_corr = np.sqrt(phi2_corr / min((c_corr - 1), (r_corr - 1)))
 
-    print(v)
-    print(v_corr)
-
     return v, v_corr, p, dof
 
+
+def association_matrices(df, cat_cols):
+    """Cramér's V, Bergsma-corrected V, chi-square p-values and dofs for every pair of cat_cols.
+
+    Uses the vectorised engine (one bincount for all contingency tables); cramers_v above gives the same numbers for
+    a single pair."""
+    return pairwise_association(df, cat_cols)
+
+
 if __name__ == "__main__":
     # 1. Load your CSV
     database_number = 19
     database_name = 'gpt5_1-full-120_to_150_words'
-    df = pd.read_csv(f"../database_storage/database_{database_number}-{database_name}.csv")
+
+    # Bootstrap resamples for the 95% confidence intervals of V_corrected (0 to skip)
+    n_bootstrap = 10000
+    csv_path = f"../database_storage/database_{database_number}-{database_name}.csv"
+    df = pd.read_csv(csv_path)
 
     # 2. List the categorical factors you care about
     cat_cols = [
@@ -53,21 +61,16 @@ if __name__ == "__main__":
         "topic_hint",
     ]
 
-    # 3. Initialize empty matrices for V, V_corrected and p-values
-    n = len(cat_cols)
-    v_matrix = pd.DataFrame(np.zeros((n, n)), index=cat_cols, columns=cat_cols)
-    v_corr_matrix = pd.DataFrame(np.zeros((n, n)), index=cat_cols, columns=cat_cols)
-    p_matrix = pd.DataFrame(np.zeros((n, n)), index=cat_cols, columns=cat_cols)
-    dof_matrix = pd.DataFrame(np.zeros((n, n)), index=cat_cols, columns=cat_cols)
-
-    # 4. Compute Cramér's V for each pair
-    for i, col_i in enumerate(cat_cols):
-        for j, col_j in enumerate(cat_cols):
-            v, v_corr, p, dof = cramers_v(df[col_i], df[col_j])
-            v_matrix.loc[col_i, col_j] = v
-            v_corr_matrix.loc[col_j, col_i] = v_corr
-            p_matrix.loc[col_i, col_j] = p
-            dof_matrix.loc[col_i, col_j] = dof
+    # 3-4. Compute Cramér's V, V_corrected, p-values and dofs for each pair. The matrices are kept in the results
+    # store under a hash of the CSV contents and cat_cols, so rerunning with unchanged inputs loads them instantly.
+    matrices = cached_result(
+        "cramers_v",
+        file_hash(csv_path),
+        {"cat_cols": cat_cols},
+        lambda: association_matrices(df, cat_cols),
+        database=f"database_{database_number}",
+    )
+    v_matrix, v_corr_matrix, p_matrix, dof_matrix = (matrices[k] for k in ("v", "v_corr", "p", "dof"))
 
     # 5. Print results
     print("Cramér's V matrix:\n", v_matrix.round(3))
@@ -80,3 +83,22 @@ if __name__ == "__main__":
     p_matrix.to_csv(f"../database_storage/associations/cramers_v_pvalues_database{database_number}.csv")
     dof_matrix.to_csv(f"../database_storage/associations/cramers_v_dofs_database{database_number}.csv")
 
+    # 7. Bootstrap confidence intervals. With ~63 paragraphs a point estimate of V is very noisy, so resample the
+    # rows with replacement and report a 95% BCa interval of V_corrected for each pair. The uncorrected V is biased
+    # upwards in every resample, so its bootstrap intervals can exclude the estimate and are not reported.
+    if n_bootstrap:
+        ci_matrices = cached_result(
+            "cramers_v_bootstrap",
+            file_hash(csv_path),
+            {"cat_cols": cat_cols, "n_bootstrap": n_bootstrap, "ci": 95, "seed": 0, "method": "bca_v_corr"},
+            lambda: bootstrap_association(df, cat_cols, n_boot=n_bootstrap, ci=95, random_state=0),
+            database=f"database_{database_number}",
+        )
+        print(f"\n\n\nCramér's V (Bergsma) 95% BCa bootstrap CI ({n_bootstrap} resamples), lower:\n",
+              ci_matrices["v_corr_ci_lower"].round(3))
+        print("\nupper:\n", ci_matrices["v_corr_ci_upper"].round(3))
+
+        for name, matrix in ci_matrices.items():
+            # cramers_v_corr_ci_lower_database19.csv, cramers_v_corr_ci_upper_database19.csv
+            matrix.to_csv(f"../database_storage/associations/cramers_{name}_database{database_number}.csv")
+
@@ -0,0 +1,38 @@
+"""Check every paragraph of a database against the formal constraints of the generation prompt (word count, single
+paragraph, no lists, no em-dashes) and its readability against the requested difficulty. Violating rows are written
+to the database's regeneration queue, which the last cell of the generator consumes to regenerate only those rows."""
+
+import pandas as pd
+
+from text_constraints import constraint_violations, queue_violations
+
+if __name__ == "__main__":
+    database_number = 21
+    database_name = "gpt5_2-full-120_to_150_words"
+    csv_path = f"../database_storage/database_{database_number}-{database_name}.csv"
+    queue_path = f"../database_storage/regeneration_queue_database_{database_number}.jsonl"
+
+    min_words, max_words = 120, 150
+    control_cols = ["genre", "difficulty", "predictability", "emotional_valence", "concreteness", "tone", "topic_hint"]
+    write_queue = True
+
+    df = pd.read_csv(csv_path)
+    stats = constraint_violations(df["text"], min_words=min_words, max_words=max_words, difficulty=df["difficulty"])
+
+    print(f"=== Text statistics for database {database_number} ({len(df)} paragraphs) ===")
+    print(stats.drop(columns="violations").describe().T[["mean", "std", "min", "max"]].round(2).to_string())
+
+    print("\n=== Readability (Flesch-Kincaid grade) by requested difficulty ===")
+    print(stats.groupby(df["difficulty"])["flesch_kincaid_grade"].describe().round(1).to_string())
+
+    counts = stats["violations"].explode().value_counts()
+    print("\n=== Constraint violations ===")
+    print(counts.to_string() if len(counts) else "none")
+    for i, violations in enumerate(stats["violations"]):
+        if violations:
+            print(f"  row {i}: {violations} ({stats.at[i, 'n_words']} words, "
+                  f"grade {stats.at[i, 'flesch_kincaid_grade']:.1f}, difficulty={df.at[i, 'difficulty']})")
+
+    if write_queue:
+        n_queued = queue_violations(queue_path, df, stats, control_cols)
+        print(f"\nQueued {n_queued} rows for regeneration in {queue_path}")
@@ -0,0 +1,66 @@
+#%% Goal: compare how well each style label can be decoded from the embeddings of each database, and whether a
+# decoder trained on one database transfers to another (e.g. train on 19 / gpt-5.1, test on 21 / gpt-5.2).
+#
+# Diagonal entries of each matrix are the within-database 5-fold CV accuracy; off-diagonal entries are train on the
+# row database (all rows) and test on the column database. Every database's embeddings are loaded once through the
+# memory-mapped store, all PCA projections are computed once, and the logistic regressions run in parallel.
+
+import pandas as pd
+
+from decoding_tools import embedding_csv_path, ensure_embedding_memmap, load_embedding_memmap, transfer_decode
+from results_store import cached_result, file_hash
+
+#%% Registered databases (see ../database_storage/database_notes.txt)
+databases = {
+    18: "gpt5_1-full-120_to_150_words",
+    19: "gpt5_1-full-120_to_150_words",
+    20: "gpt5_2-full-120_to_150_words",
+    21: "gpt5_2-full-120_to_150_words",
+}
+embedding_size = "large"
+
+label_columns = [
+    "topic_hint",
+    "genre",
+    "difficulty",
+    "predictability",
+    "emotional_valence",
+    "concreteness",
+    "tone",
+]
+
+n_pca_components = 28
+C = 1.0
+n_jobs = -1
+
+#%% Load embeddings (parsed once, then memory-mapped)
+datasets = {}
+data_hashes = []
+for database_number, database_name in databases.items():
+    csv_path = embedding_csv_path(database_number, database_name, embedding_size)
+    datasets[f"database_{database_number:02d}"] = (
+        pd.read_csv(csv_path).drop(columns="embedding"),
+        load_embedding_memmap(ensure_embedding_memmap(csv_path)),
+    )
+    data_hashes.append(file_hash(csv_path))
+    print(f"Loaded database {database_number:02d}: {datasets[f'database_{database_number:02d}'][1].shape}")
+
+#%% Within- and cross-database decoding
+report = cached_result(
+    "transfer_decoding",
+    "+".join(data_hashes),
+    {"databases": databases, "label_columns": label_columns, "n_pca_components": n_pca_components, "C": C,
+     "n_splits": 5, "cv_seed": 0},
+    lambda: {"report": transfer_decode(datasets, label_columns, n_pca_components=n_pca_components, C=C,
+                                       n_splits=5, random_state=0, n_jobs=n_jobs)},
+    database="+".join(datasets),
+)["report"]
+
+#%% Print one train x test matrix per label and save the full report
+for col in label_columns:
+    matrix = report[report["label"] == col].pivot(index="train", columns="test", values="accuracy_mean")
+    print(f"\n=== {col} (rows=train, cols=test) ===")
+    print(matrix.round(3).to_string())
+
+report.to_csv("../database_storage/cross_database_decoding.csv", index=False)
+print("\nSaved ../database_storage/cross_database_decoding.csv")
@@ -0,0 +1,635 @@
+"""Helpers for decoding style labels from text embeddings (see embedding_classification.py).
+
+The embeddings are stored once as a .npy file next to the embeddings CSV and opened read-only with mmap_mode="r".
+joblib hands a np.memmap to its worker processes by file name, so all workers share the same pages instead of each
+receiving a pickled copy of X. Every label x fold x hyperparameter cell is an independent task, and the out-of-fold
+predictions are gathered back into one report per (label, hyperparameters).
+
+Each training fold's SVD is computed once and cached (fold_svd, a bounded LRU cache per process), so any number of PCA
+components is a column slice of the same projection. The permutation test uses those projections with a closed-form ridge classifier, which lets a
+whole batch of shuffled label vectors be solved at once, and the (n_components, C) sweep fits every grid cell from
+the same SVD, warm-starting LogisticRegression along the C path."""
+
+import hashlib
+import os
+from ast import literal_eval
+from collections import OrderedDict
+from itertools import product
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from sklearn.preprocessing import LabelEncoder
+from sklearn.model_selection import KFold, StratifiedKFold, StratifiedShuffleSplit
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import balanced_accuracy_score, confusion_matrix, f1_score
+from sklearn.pipeline import Pipeline
+from sklearn.decomposition import PCA
+
+
+# ---------------------- Memory-mapped embedding store ----------------------
+
+def embedding_csv_path(database_number, database_name, embedding_size="large"):
+    return f"../database_storage/database_{database_number:02d}-{database_name}__embeddings-{embedding_size}.csv"
+
+
+def ensure_embedding_memmap(csv_path):
+    """Parse the 'embedding' column of csv_path once and save it as a .npy file next to the CSV.
+
+    The .npy file is rebuilt only when it is missing or older than the CSV. Returns the path to the .npy file."""
+    npy_path = os.path.splitext(csv_path)[0] + ".npy"
+    if not os.path.exists(npy_path) or os.path.getmtime(npy_path) < os.path.getmtime(csv_path):
+        df = pd.read_csv(csv_path, usecols=["embedding"])
+        X = np.array(df["embedding"].apply(literal_eval).to_list())
+        np.save(npy_path, X)
+    return npy_path
+
+
+def load_embedding_memmap(npy_path):
+    """Open a saved embedding matrix read-only (pages are shared between processes by the OS)."""
+    return np.load(npy_path, mmap_mode="r")
+
+
+# ---------------------- Cached fold projections ----------------------
+
+# Most recently used fold projections, per process. Each entry holds Vt (rank x n_features) and the projected rows, so
+# the cache is bounded; a sweep reuses the same few folds many times and never needs more than a few dozen.
+FOLD_SVD_CACHE_SIZE = 64
+_fold_svd_cache = OrderedDict()
+
+
+def clear_fold_svd_cache():
+    _fold_svd_cache.clear()
+
+
+def data_key(X):
+    """Identify an embedding matrix: file name + modification time for a memmap, content hash otherwise."""
+    if isinstance(X, np.memmap) and X.filename is not None:
+        return f"{X.filename}:{os.path.getmtime(X.filename)}"
+    return hashlib.sha1(np.ascontiguousarray(X).view(np.uint8)).hexdigest()
+
+
+def fold_svd(X, train_idx, test_idx, key=None, cache=True):
+    """Project the train and test rows of X onto all principal axes of the (centred) training rows.
+
+    One thin SVD per training fold; the first k columns of Z_train / Z_test are exactly the k-component PCA
+    projection, so sweeping the number of components never refits. mean and Vt are kept so that rows of another
+    matrix can be projected onto the same axes. With cache=True results are kept per (X, train, test) in an LRU cache
+    of FOLD_SVD_CACHE_SIZE entries; pass cache=False for splits that are used only once."""
+    if not cache:
+        return _compute_fold_svd(X, train_idx, test_idx)
+    key = key or data_key(X)
+    cache_key = (key, hashlib.sha1(np.asarray(train_idx).tobytes()).hexdigest(),
+                 hashlib.sha1(np.asarray(test_idx).tobytes()).hexdigest())
+    if cache_key in _fold_svd_cache:
+        _fold_svd_cache.move_to_end(cache_key)
+    else:
+        _fold_svd_cache[cache_key] = _compute_fold_svd(X, train_idx, test_idx)
+        if len(_fold_svd_cache) > FOLD_SVD_CACHE_SIZE:
+            _fold_svd_cache.popitem(last=False)
+    return _fold_svd_cache[cache_key]
+
+
+def _compute_fold_svd(X, train_idx, test_idx):
+    X_train = np.asarray(X[train_idx], dtype=float)
+    mean = X_train.mean(axis=0)
+    U, S, Vt = np.linalg.svd(X_train - mean, full_matrices=False)
+    return {
+        "mean": mean,
+        "Vt": Vt,
+        "S": S,
+        "Z_train": U * S,
+        "Z_test": (np.asarray(X[test_idx], dtype=float) - mean) @ Vt.T,
+    }
+
+
+# ---------------------- Worker side ----------------------
+
+def build_classifier(n_pca_components=None, C=1.0, max_iter=2000):
+    """PCA (optional) followed by L2 logistic regression, matching STEP 3 of embedding_classification.py."""
+    logreg = LogisticRegression(solver="lbfgs", penalty="l2", C=C, max_iter=max_iter)
+    if n_pca_components is None:
+        return logreg
+    return Pipeline([
+        ("pca", PCA(n_components=n_pca_components, random_state=0)),
+        ("logreg", logreg),
+    ])
+
+
+def _decode_cell(X, task):
+    """Fit one (label, fold, hyperparameters) cell on the shared memory-mapped X and return out-of-fold predictions."""
+    train_idx, test_idx = task["train_idx"], task["test_idx"]
+
+    clf = build_classifier(**task["params"])
+    clf.fit(X[train_idx], task["y_train"])
+
+    return {
+        "label": task["label"],
+        "params": task["params"],
+        "fold": task["fold"],
+        "test_idx": test_idx,
+        "y_pred": clf.predict(X[test_idx]),
+    }
+
+
+# ---------------------- Driver ----------------------
+
+def encode_label(df, col):
+    """Return (row indices with a usable label, integer-coded labels, fitted LabelEncoder) for one label column."""
+    y_raw = df[col].astype(str).str.strip()
+    mask = ((y_raw != "nan") & (y_raw != "")).to_numpy()
+    le = LabelEncoder()
+    y = le.fit_transform(y_raw[mask])
+    return np.flatnonzero(mask), y, le
+
+
+def param_grid_cells(param_grid):
+    """Expand {"n_pca_components": [...], "C": [...]} into a list of parameter dicts."""
+    keys = list(param_grid.keys())
+    return [dict(zip(keys, values)) for values in product(*(param_grid[k] for k in keys))]
+
+
+def parallel_decode(df, npy_path, label_columns, param_grid=None, n_splits=5, random_state=0, n_jobs=-1):
+    """Decode every label x fold x hyperparameter cell in parallel worker processes.
+
+    The workers read X from the memory-mapped file at npy_path (rows of X must line up with the rows of df). Returns
+    (report, details) where report is a DataFrame with one row per (label, hyperparameters) and details maps
+    (label, params tuple) to the confusion matrix and out-of-fold predictions."""
+    if param_grid is None:
+        param_grid = {"n_pca_components": [None], "C": [1.0]}
+    cells = param_grid_cells(param_grid)
+
+    tasks = []
+    encoded = {}
+    for col in label_columns:
+        rows, y, le = encode_label(df, col)
+        if len(le.classes_) < 2:
+            print(f"[{col}] Skipping: only {len(le.classes_)} class present.")
+            continue
+        encoded[col] = (rows, y, le)
+
+        cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+        for fold, (train, test) in enumerate(cv.split(rows, y)):
+            for params in cells:
+                tasks.append({
+                    "label": col,
+                    "params": params,
+                    "fold": fold,
+                    "train_idx": rows[train],
+                    "test_idx": rows[test],
+                    "y_train": y[train],
+                })
+
+    X = load_embedding_memmap(npy_path)
+    results = Parallel(n_jobs=n_jobs)(delayed(_decode_cell)(X, task) for task in tasks)
+
+    return gather_decoding_results(results, encoded)
+
+
+def gather_decoding_results(results, encoded):
+    """Collect per-fold predictions into one summary row per (label, hyperparameters)."""
+    grouped = {}
+    for res in results:
+        key = (res["label"], tuple(sorted(res["params"].items())))
+        grouped.setdefault(key, []).append(res)
+
+    report_rows = []
+    details = {}
+    for (col, params_key), fold_results in grouped.items():
+        rows, y, le = encoded[col]
+        n_classes = len(le.classes_)
+        y_by_row = pd.Series(y, index=rows)
+
+        fold_acc, fold_bal_acc = [], []
+        y_pred_cv = pd.Series(-1, index=rows)
+        for res in sorted(fold_results, key=lambda r: r["fold"]):
+            y_true_fold = y_by_row.loc[res["test_idx"]].to_numpy()
+            fold_acc.append(np.mean(res["y_pred"] == y_true_fold))
+            fold_bal_acc.append(balanced_accuracy_score(y_true_fold, res["y_pred"]))
+            y_pred_cv.loc[res["test_idx"]] = res["y_pred"]
+
+        y_pred_cv = y_pred_cv.to_numpy()
+        cm = confusion_matrix(y, y_pred_cv, labels=np.arange(n_classes))
+
+        row = {"label": col, **dict(params_key)}
+        row.update({
+            "n_classes": n_classes,
+            "chance_level": 1.0 / n_classes,
+            "accuracy_mean": np.mean(fold_acc),
+            "accuracy_std": np.std(fold_acc),
+            "balanced_accuracy_mean": np.mean(fold_bal_acc),
+            "balanced_accuracy_std": np.std(fold_bal_acc),
+            "f1_macro": f1_score(y, y_pred_cv, average="macro"),
+        })
+        report_rows.append(row)
+        details[(col, params_key)] = {
+            "classes": list(le.classes_),
+            "confusion_matrix": pd.DataFrame(cm, index=le.classes_, columns=le.classes_),
+            "y_true": y,
+            "y_pred": y_pred_cv,
+        }
+
+    return pd.DataFrame(report_rows), details
+
+
+# ---------------------- Permutation test ----------------------
+
+def ridge_cv_accuracy(folds, Y, n_classes, alpha=1.0):
+    """Cross-validated accuracy of a one-vs-rest ridge classifier for many label vectors at once.
+
+    folds: list of (train positions, test positions, Z_train, Z_test) with PCA projections from fold_svd.
+    Y: (n_samples, n_targets) integer labels (one column per permutation). Because the columns of Z_train are
+    orthogonal, the ridge solution is a diagonal rescaling of Z_train.T @ Y, so every target is solved in one einsum.
+    Returns the pooled out-of-fold accuracy for each column of Y."""
+    classes = np.arange(n_classes)
+    correct = np.zeros(Y.shape[1])
+    for train, test, Z_train, Z_test in folds:
+        onehot = (Y[train][:, :, None] == classes).astype(float)      # (n_train, n_targets, n_classes)
+        prior = onehot.mean(axis=0)
+        shrink = 1.0 / ((Z_train ** 2).sum(axis=0) + alpha)
+        W = np.einsum("nk,ntc->ktc", Z_train, onehot - prior) * shrink[:, None, None]
+        scores = np.einsum("mk,ktc->mtc", Z_test, W) + prior
+        correct += (scores.argmax(axis=2) == Y[test]).sum(axis=0)
+    return correct / Y.shape[0]
+
+
+def _permutation_batch(folds, y, n_classes, alpha, seed, n_perm):
+    rng = np.random.default_rng(seed)
+    Y_perm = np.column_stack([rng.permutation(y) for _ in range(n_perm)])
+    return ridge_cv_accuracy(folds, Y_perm, n_classes, alpha)
+
+
+def permutation_test_decoding(X, df, label_columns, n_pca_components=28, alpha=1.0, n_permutations=5000,
+                              n_splits=5, random_state=0, batch_size=500, n_jobs=-1):
+    """Permutation test of decoding accuracy against a shuffled-label null, for every label.
+
+    The observed and permuted accuracies use the same folds, the same cached fold projections and the same ridge
+    classifier, so the null distribution reflects the actual class balance (unlike 1 / n_classes). Permutations are
+    solved in batches, spread over worker processes. Returns (report, null_distributions)."""
+    key = data_key(X)
+    report_rows = []
+    null_distributions = {}
+    for col in label_columns:
+        rows, y, le = encode_label(df, col)
+        n_classes = len(le.classes_)
+        if n_classes < 2:
+            print(f"[{col}] Skipping: only {n_classes} class present.")
+            continue
+
+        cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+        folds = []
+        for train, test in cv.split(rows, y):
+            proj = fold_svd(X, rows[train], rows[test], key=key)
+            folds.append((train, test, proj["Z_train"][:, :n_pca_components], proj["Z_test"][:, :n_pca_components]))
+
+        observed = ridge_cv_accuracy(folds, y[:, None], n_classes, alpha)[0]
+
+        batch_sizes = [batch_size] * (n_permutations // batch_size)
+        if n_permutations % batch_size:
+            batch_sizes.append(n_permutations % batch_size)
+        seeds = np.random.SeedSequence([random_state, label_columns.index(col)]).spawn(len(batch_sizes))
+        null = np.concatenate(Parallel(n_jobs=n_jobs)(
+            delayed(_permutation_batch)(folds, y, n_classes, alpha, seed, size)
+            for seed, size in zip(seeds, batch_sizes)
+        ))
+
+        null_distributions[col] = null
+        report_rows.append({
+            "label": col,
+            "n_classes": n_classes,
+            "accuracy": observed,
+            "null_mean": null.mean(),
+            "null_std": null.std(),
+            "null_95th_percentile": np.percentile(null, 95),
+            "naive_chance_level": 1.0 / n_classes,
+            "p_value": (1 + np.sum(null >= observed)) / (1 + n_permutations),
+        })
+
+    return pd.DataFrame(report_rows), null_distributions
+
+
+# ---------------------- Hyperparameter sweep (n_components x C) ----------------------
+
+def _grid_scores(X, train_idx, test_idx, y_train, y_test, n_components_grid, C_grid, key):
+    """Accuracy for every (n_components, C) cell on one split, from a single SVD of the training rows.
+
+    For each n_components the projection is a column slice; along the (ascending) C path the previous solution is the
+    starting point for the next fit (warm_start), so each extra C value costs only a few lbfgs iterations."""
+    proj = fold_svd(X, train_idx, test_idx, key=key)
+    scores = np.zeros((len(n_components_grid), len(C_grid)))
+    for i, k in enumerate(n_components_grid):
+        Z_train, Z_test = proj["Z_train"][:, :k], proj["Z_test"][:, :k]
+        clf = LogisticRegression(solver="lbfgs", max_iter=2000, warm_start=True)
+        for j, C in enumerate(C_grid):
+            clf.set_params(C=C)
+            clf.fit(Z_train, y_train)
+            scores[i, j] = np.mean(clf.predict(Z_test) == y_test)
+    return scores
+
+
+def _nested_outer_fold(X, rows, y, outer_train, outer_test, n_components_grid, C_grid, n_inner_splits,
+                       random_state, key):
+    """Select (n_components, C) by inner CV on the outer training rows, then score the choice on the outer test rows."""
+    inner_cv = StratifiedKFold(n_splits=n_inner_splits, shuffle=True, random_state=random_state)
+    inner_scores = np.mean([
+        _grid_scores(X, rows[outer_train][tr], rows[outer_train][te], y[outer_train][tr], y[outer_train][te],
+                     n_components_grid, C_grid, key)
+        for tr, te in inner_cv.split(outer_train, y[outer_train])
+    ], axis=0)
+
+    i, j = np.unravel_index(np.argmax(inner_scores), inner_scores.shape)
+    outer_scores = _grid_scores(X, rows[outer_train], rows[outer_test], y[outer_train], y[outer_test],
+                                [n_components_grid[i]], [C_grid[j]], key)
+    return inner_scores, n_components_grid[i], C_grid[j], outer_scores[0, 0]
+
+
+def sweep_pca_and_C(X, df, label_columns, n_components_grid, C_grid, n_outer_splits=5, n_inner_splits=3,
+                    random_state=0, n_jobs=-1):
+    """Nested cross-validated sweep over the number of PCA components and the logistic regression C.
+
+    The inner CV picks (n_components, C) on each outer training set and the outer folds give an unbiased accuracy
+    for that selection procedure. Outer folds of every label run in parallel. Returns (report, inner_grids) where
+    inner_grids[label] is a DataFrame of mean inner-CV accuracy (rows=n_components, cols=C)."""
+    C_grid = sorted(C_grid)
+    key = data_key(X)
+
+    jobs = []
+    for col in label_columns:
+        rows, y, le = encode_label(df, col)
+        if len(le.classes_) < 2:
+            print(f"[{col}] Skipping: only {len(le.classes_)} class present.")
+            continue
+        # Components beyond the rank of the smallest inner training set are all identical
+        max_rank = int(len(rows) * (1 - 1 / n_outer_splits) * (1 - 1 / n_inner_splits))
+        grid = sorted({min(k, max_rank) for k in n_components_grid})
+        outer_cv = StratifiedKFold(n_splits=n_outer_splits, shuffle=True, random_state=random_state)
+        for outer_train, outer_test in outer_cv.split(rows, y):
+            jobs.append((col, grid, rows, y, outer_train, outer_test))
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_nested_outer_fold)(X, rows, y, outer_train, outer_test, grid, C_grid, n_inner_splits,
+                                    random_state, key)
+        for col, grid, rows, y, outer_train, outer_test in jobs
+    )
+
+    report_rows = []
+    inner_grids = {}
+    for col in dict.fromkeys(job[0] for job in jobs):
+        col_results = [res for job, res in zip(jobs, results) if job[0] == col]
+        grid = next(job[1] for job in jobs if job[0] == col)
+        outer_acc = [res[3] for res in col_results]
+        selected = pd.Series([(res[1], res[2]) for res in col_results]).value_counts()
+
+        inner_grids[col] = pd.DataFrame(np.mean([res[0] for res in col_results], axis=0),
+                                        index=pd.Index(grid, name="n_components"),
+                                        columns=pd.Index(C_grid, name="C"))
+        report_rows.append({
+            "label": col,
+            "nested_accuracy_mean": np.mean(outer_acc),
+            "nested_accuracy_std": np.std(outer_acc),
+            "most_selected_n_components": selected.index[0][0],
+            "most_selected_C": selected.index[0][1],
+            "times_selected": selected.iloc[0],
+        })
+
+    return pd.DataFrame(report_rows), inner_grids
+
+
+# ---------------------- Closed-form multi-label ridge probe ----------------------
+
+def one_hot_labels(df, label_columns):
+    """One-hot encode every label column into a single target matrix.
+
+    Returns (Y, blocks) where blocks[col] = (column slice of Y, class names). Missing labels give an all-zero block."""
+    blocks = {}
+    parts = []
+    start = 0
+    for col in label_columns:
+        y_raw = df[col].astype(str).str.strip()
+        classes = sorted(set(y_raw) - {"nan", ""})
+        parts.append((y_raw.to_numpy()[:, None] == np.array(classes)).astype(float))
+        blocks[col] = (slice(start, start + len(classes)), classes)
+        start += len(classes)
+    return np.hstack(parts), blocks
+
+
+def _gcv_alpha(U, S, Y_centred, alphas):
+    """Pick the ridge alpha with the lowest generalised cross-validation error, for all targets jointly.
+
+    With the thin SVD X = U S V', the hat matrix is U diag(S^2 / (S^2 + alpha)) U', so the GCV error of every alpha
+    only needs U' Y (computed once)."""
+    n = Y_centred.shape[0]
+    UtY_sq = (U.T @ Y_centred) ** 2                                    # (rank, n_targets)
+    outside_ss = (Y_centred ** 2).sum() - UtY_sq.sum()                 # part of Y orthogonal to the column space of X
+    shrink = S[None, :] ** 2 / (S[None, :] ** 2 + np.asarray(alphas)[:, None])   # (n_alphas, rank)
+    residual_ss = outside_ss + ((1 - shrink) ** 2 @ UtY_sq).sum(axis=1)
+    # Effective degrees of freedom: trace of the hat matrix plus one for the intercept (Y and X are centred)
+    dof = 1 + shrink.sum(axis=1)
+    gcv = residual_ss / (n * (1 - dof / n) ** 2)
+    return alphas[int(np.argmin(gcv))]
+
+
+def ridge_probe(X, df, label_columns, alphas=None, n_splits=5, random_state=0):
+    """Decode all labels at once with a closed-form ridge classifier on the one-hot target matrix.
+
+    Each fold needs a single thin SVD of the centred training rows (cached by fold_svd; for n < d this costs
+    O(n^2 d), i.e. the dual/kernel form). alpha is chosen per fold by GCV on the training rows, then every label's
+    prediction is the argmax over its block of columns. Returns one row per label with the cross-validated accuracy
+    and the majority-class baseline."""
+    Y, blocks = one_hot_labels(df, label_columns)
+    return ridge_probe_targets(X, Y, blocks, alphas=alphas, n_splits=n_splits, random_state=random_state)
+
+
+def ridge_probe_targets(X, Y, blocks, alphas=None, n_splits=5, random_state=0, cache=True):
+    """ridge_probe on a precomputed one-hot target matrix (see one_hot_labels).
+
+    Lets a caller encode the labels of the whole corpus once and probe subsets of rows with X[rows], Y[rows]; classes
+    that do not occur in the subset are not counted in n_classes. cache=False keeps the fold SVDs out of the fold_svd
+    cache, for subsets whose folds are not reused."""
+    if alphas is None:
+        alphas = np.logspace(-3, 5, 33)
+    alphas = np.asarray(alphas, dtype=float)
+    label_columns = list(blocks)
+    key = data_key(X) if cache else None
+
+    fold_acc = {col: [] for col in label_columns}
+    chosen_alphas = []
+    cv = KFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    for train, test in cv.split(Y):
+        proj = fold_svd(X, train, test, key=key, cache=cache)
+        S = proj["S"]
+        keep = S > S[0] * 1e-10
+        S, Z_train, Z_test = S[keep], proj["Z_train"][:, keep], proj["Z_test"][:, keep]
+        U = Z_train / S
+
+        Y_mean = Y[train].mean(axis=0)
+        Y_centred = Y[train] - Y_mean
+        alpha = _gcv_alpha(U, S, Y_centred, alphas)
+        chosen_alphas.append(alpha)
+
+        # Ridge in the (rotated) PCA basis: W = diag(S / (S^2 + alpha)) U' Y
+        W = (S / (S ** 2 + alpha))[:, None] * (U.T @ Y_centred)
+        scores = Z_test @ W + Y_mean
+
+        for col in label_columns:
+            block, _ = blocks[col]
+            labelled = Y[test, block].sum(axis=1) > 0
+            y_true = Y[test, block][labelled].argmax(axis=1)
+            y_pred = scores[labelled, block].argmax(axis=1)
+            fold_acc[col].append(np.mean(y_pred == y_true))
+
+    report_rows = []
+    for col in label_columns:
+        block, _ = blocks[col]
+        counts = Y[:, block].sum(axis=0)
+        report_rows.append({
+            "label": col,
+            "n_classes": int((counts > 0).sum()),
+            "accuracy_mean": np.mean(fold_acc[col]),
+            "accuracy_std": np.std(fold_acc[col]),
+            "majority_baseline": counts.max() / counts.sum(),
+            "alpha_median": np.median(chosen_alphas),
+        })
+    return pd.DataFrame(report_rows)
+
+
+# ---------------------- Cross-database transfer decoding ----------------------
+
+def _fit_score_folds(folds, C):
+    """Fit logistic regression on each (Z_train, y_train, Z_test, y_test) and return the test accuracies."""
+    scores = []
+    for Z_train, y_train, Z_test, y_test in folds:
+        clf = LogisticRegression(solver="lbfgs", C=C, max_iter=2000).fit(Z_train, y_train)
+        scores.append(np.mean(clf.predict(Z_test) == y_test))
+    return scores
+
+
+def _transfer_projections(X, n_pca_components, n_splits, random_state):
+    """The first n_pca_components PCA scores of every KFold split of X (the train and test rows of each fold, on the
+    training rows' axes) and of all rows, with the mean and axes of the latter to project other databases."""
+    folds = []
+    for train, test in KFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X):
+        proj = _compute_fold_svd(X, train, test)
+        folds.append((train, test, proj["Z_train"][:, :n_pca_components], proj["Z_test"][:, :n_pca_components]))
+    full = _compute_fold_svd(X, np.arange(X.shape[0]), np.arange(0))
+    return folds, full["Z_train"][:, :n_pca_components], full["mean"], full["Vt"][:n_pca_components].T
+
+
+def transfer_decode(datasets, label_columns, n_pca_components=28, C=1.0, n_splits=5, random_state=0, n_jobs=-1):
+    """Within-database CV and cross-database (train on one, test on another) decoding for every label.
+
+    datasets maps a name to (df, X). Every database gets one KFold split shared by all labels, so its PCA projections
+    (one SVD per fold and one of all rows, whose axes also project the other databases) are computed once, in
+    parallel across databases; each label only keeps its labelled rows of them, and the workers then fit logistic
+    regressions on small projected matrices. Test rows whose label was never seen in the training database are
+    dropped (e.g. difficulty="medium" exists only in database 18). Returns a long DataFrame with one row per
+    (label, train database, test database); train == test rows are the within-database CV accuracy."""
+    projections = dict(zip(datasets, Parallel(n_jobs=n_jobs)(
+        delayed(_transfer_projections)(X, n_pca_components, n_splits, random_state) for _, X in datasets.values()
+    )))
+
+    jobs = []
+    for col in label_columns:
+        for train_name, (df_train, _) in datasets.items():
+            if col not in df_train.columns:
+                continue
+            rows, y, le = encode_label(df_train, col)
+            if len(le.classes_) < 2:
+                continue
+            fold_projections, Z_full, mean, axes = projections[train_name]
+            y_all = np.full(len(df_train), -1)
+            y_all[rows] = y
+
+            folds = []
+            for train, test, Z_train, Z_test in fold_projections:
+                train_keep, test_keep = y_all[train] >= 0, y_all[test] >= 0
+                folds.append((Z_train[train_keep], y_all[train][train_keep], Z_test[test_keep], y_all[test][test_keep]))
+            jobs.append((col, train_name, train_name, folds))
+
+            for test_name, (df_test, X_test) in datasets.items():
+                if test_name == train_name or col not in df_test.columns:
+                    continue
+                y_test_raw = df_test[col].astype(str).str.strip()
+                keep = np.flatnonzero(y_test_raw.isin(le.classes_).to_numpy())
+                if len(keep) == 0:
+                    continue
+                Z_test = (np.asarray(X_test[keep], dtype=float) - mean) @ axes
+                jobs.append((col, train_name, test_name,
+                             [(Z_full[rows], y, Z_test, le.transform(y_test_raw.iloc[keep]))]))
+
+    results = Parallel(n_jobs=n_jobs)(delayed(_fit_score_folds)(folds, C) for *_, folds in jobs)
+
+    return pd.DataFrame([
+        {
+            "label": col,
+            "train": train_name,
+            "test": test_name,
+            "accuracy_mean": np.mean(scores),
+            "accuracy_std": np.std(scores),
+            "n_test": sum(len(fold[3]) for fold in folds),
+        }
+        for (col, train_name, test_name, folds), scores in zip(jobs, results)
+    ])
+
+
+# ---------------------- Learning curves ----------------------
+
+def stratified_order(y, rng):
+    """Order the positions 0..len(y)-1 so that every prefix is (as nearly as possible) stratified by y."""
+    rank = np.empty(len(y))
+    for cls in np.unique(y):
+        idx = np.flatnonzero(y == cls)
+        rank[rng.permutation(idx)] = (np.arange(len(idx)) + rng.random()) / len(idx)
+    return np.argsort(rank, kind="stable")
+
+
+def _learning_curve_cell(X, train_rows, test_rows, y_train, y_test, n_pca_components, C):
+    """Accuracy of one (subsample, test set) cell: SVD of the subsample (used once, so not cached) and a fit."""
+    proj = fold_svd(X, train_rows, test_rows, cache=False)
+    k = proj["Z_train"].shape[1] if n_pca_components is None else min(n_pca_components, proj["Z_train"].shape[1])
+    return _fit_score_folds([(proj["Z_train"][:, :k], y_train, proj["Z_test"][:, :k], y_test)], C)[0]
+
+
+def learning_curve_decoding(X, df, label_columns, train_sizes, n_repeats=20, test_size=0.2, n_pca_components=28,
+                            C=1.0, random_state=0, n_jobs=-1):
+    """Decoding accuracy as a function of the number of training paragraphs, for every label.
+
+    Each repeat holds out a stratified test set; the training sizes are nested stratified subsamples of the remaining
+    rows. Every subsample is used once, so its SVD is computed in the worker together with the logistic regression
+    fit and is not cached; only row indices are sent to the workers (X is shared as a memmap). With
+    n_pca_components=None every component of the subsample is kept (no dimensionality reduction). Returns one row per
+    (label, train size) with the mean accuracy over repeats and a 95% band (2.5th-97.5th percentile across repeats)."""
+    rng = np.random.default_rng(random_state)
+    jobs = []
+    for col in label_columns:
+        rows, y, le = encode_label(df, col)
+        if len(le.classes_) < 2:
+            print(f"[{col}] Skipping: only {len(le.classes_)} class present.")
+            continue
+
+        splitter = StratifiedShuffleSplit(n_splits=n_repeats, test_size=test_size, random_state=random_state)
+        for train, test in splitter.split(rows, y):
+            order = train[stratified_order(y[train], rng)]
+            for size in train_sizes:
+                sub = order[:size]
+                if size > len(train) or len(np.unique(y[sub])) < 2:
+                    continue
+                jobs.append((col, size, rows[sub], rows[test], y[sub], y[test]))
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(_learning_curve_cell)(X, train_rows, test_rows, y_train, y_test, n_pca_components, C)
+        for _, _, train_rows, test_rows, y_train, y_test in jobs
+    )
+
+    scores = pd.DataFrame([
+        {"label": col, "train_size": size, "accuracy": acc}
+        for (col, size, *_), acc in zip(jobs, results)
+    ])
+    return scores.groupby(["label", "train_size"], sort=False)["accuracy"].agg(
+        accuracy_mean="mean",
+        accuracy_std="std",
+        ci_lower=lambda a: np.percentile(a, 2.5),
+        ci_upper=lambda a: np.percentile(a, 97.5),
+        n_repeats="count",
+    ).reset_index()
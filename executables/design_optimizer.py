@@ -0,0 +1,160 @@
+"""Choose the control rows of a stimulus design from the full factorial so that the factors are as close to balanced and
+mutually orthogonal as the paragraph budget allows, while keeping t-way coverage.
+
+The design is improved by simulated annealing over exchanges (remove one design row, add one row of the full factorial
+that is not in the design). The objective is the chi-square distance of every table of up to balance_order factors
+(one-, two- and three-factor tables by default) from a perfectly balanced table:
+
+    sum over tables g, cells u of (O_gu - e_g)^2 / e_g,     e_g = N / n_cells_g
+
+It is zero exactly when the design is an orthogonal array of strength balance_order, which is also when the
+main-effects D-efficiency is 100% and every pairwise and three-way Cramér's V is 0. Because the expected counts do not
+depend on the design, exchanging row x for row y changes a table only if x and y fall in different cells u and v, and
+then by 2 * (O_v - O_u + 1) / e_g. Every exchange is therefore an O(1) update per table, and at each step the deltas of
+all candidate rows are evaluated at once from the current cell counts. The t-way coverage constraint is kept with the
+same kind of cell counts over all t-subsets of factors: an exchange is allowed only if it does not empty a t-way
+cell."""
+
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def full_factorial(factors):
+    """All level combinations of factors (dict name -> levels), one row per combination."""
+    names = list(factors)
+    return pd.DataFrame(list(itertools.product(*factors.values())), columns=names)
+
+
+def cell_index(codes, n_levels, groups):
+    """Position of every (row, group) in one flat count vector over the contingency tables of all factor groups
+    (tuples of column indices), and the number of cells of each group's table."""
+    sizes = np.array([np.prod([n_levels[j] for j in group]) for group in groups], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    cells = np.zeros((codes.shape[0], len(groups)), dtype=np.int64)
+    for g, group in enumerate(groups):
+        for j in group:
+            cells[:, g] = cells[:, g] * n_levels[j] + codes[:, j]
+    return cells + offsets, sizes
+
+
+def _codes(df, factors):
+    return np.column_stack([
+        pd.Categorical(df[name], categories=levels).codes for name, levels in factors.items()
+    ]).astype(np.int64)
+
+
+def d_efficiency(design_df, factors):
+    """Main-effects D-efficiency (in %) of a design, with contrasts scaled so that a balanced orthogonal design scores
+    100."""
+    codes = _codes(design_df, factors)
+    columns = [np.ones(len(design_df))]
+    for j, levels in enumerate(factors.values()):
+        n = len(levels)
+        # Orthonormal basis of the contrasts of an n-level factor, scaled to unit variance under balance
+        q, _ = np.linalg.qr(np.column_stack([np.ones(n), np.eye(n)[:, :n - 1]]))
+        contrasts = q[:, 1:] * np.sqrt(n)
+        columns.extend(contrasts[codes[:, j]].T)
+    X = np.column_stack(columns)
+    sign, logdet = np.linalg.slogdet(X.T @ X / len(design_df))
+    return float(100 * np.exp(logdet / X.shape[1])) if sign > 0 else 0.0
+
+
+def optimize_design(factors, initial_rows, strength=3, balance_order=3, n_steps=20_000, t_start=1.0, t_end=1e-3,
+                    random_state=0):
+    """Improve a design (list of row dicts, e.g. a covering array) by exchanges with the rest of the full factorial.
+
+    initial_rows must already cover every strength-way level combination; the design size stays len(initial_rows) and
+    rows stay unique. At each of the n_steps steps a random design row is picked and one replacement (or itself) is
+    drawn among all allowed rows with probability proportional to exp(-delta / T), where T decays geometrically from
+    t_start to t_end. balance_order sets the largest factor subsets whose tables enter the objective.
+
+    Returns (rows, info): the best design found as a list of row dicts, and a dict with the objective and D-efficiency
+    before and after, the number of evaluated exchanges and the run time."""
+    names = list(factors)
+    n_levels = [len(levels) for levels in factors.values()]
+    pool = full_factorial(factors)
+    pool_codes = _codes(pool, factors)
+
+    initial = pd.DataFrame(initial_rows)[names]
+    initial_codes = _codes(initial, factors)
+    if (initial_codes < 0).any():
+        raise ValueError("initial_rows contain levels that are not in factors.")
+    radix = np.cumprod([1] + n_levels[:0:-1])[::-1]
+    in_design = np.zeros(len(pool), dtype=bool)
+    in_design[initial_codes @ radix] = True              # pool rows are in itertools.product order
+    n_design = int(in_design.sum())
+    if n_design != len(initial):
+        raise ValueError("initial_rows contain duplicate rows.")
+
+    # Balance tables: every subset of up to balance_order factors
+    groups = [group for order in range(1, balance_order + 1)
+              for group in itertools.combinations(range(len(names)), order)]
+    cells, sizes = cell_index(pool_codes, n_levels, groups)
+    expected = n_design / sizes
+    weight = 2 / expected                                 # per-table weight of 2 * (O_v - O_u + 1)
+
+    # Coverage tables: every strength-subset of factors
+    cover_cells, _ = cell_index(pool_codes, n_levels, list(itertools.combinations(range(len(names)), strength)))
+
+    counts = np.bincount(cells[in_design].ravel(), minlength=sizes.sum())
+    cover_counts = np.bincount(cover_cells[in_design].ravel(), minlength=cover_cells.max() + 1)
+    if (cover_counts == 0).any():
+        raise ValueError(f"initial_rows do not cover every {strength}-way level combination.")
+
+    cell_expected = np.repeat(expected, sizes)
+
+    rng = np.random.default_rng(random_state)
+    temperatures = t_start * (t_end / t_start) ** (np.arange(n_steps) / max(1, n_steps - 1))
+    current = start = float(((counts - cell_expected) ** 2 / cell_expected).sum())
+    best, best_design = current, in_design.copy()
+    n_evaluated = 0
+
+    t0 = time.perf_counter()
+    for temperature in temperatures:
+        design_idx = np.flatnonzero(in_design)
+        out_idx = np.flatnonzero(~in_design)
+        x = design_idx[rng.integers(n_design)]
+
+        # Coverage: a t-way cell that only x covers must be covered by the replacement too
+        critical = cover_counts[cover_cells[x]] == 1
+        allowed = (cover_cells[np.ix_(out_idx, critical)] == cover_cells[x, critical]).all(axis=1)
+        candidates = out_idx[allowed]
+        if candidates.size == 0:
+            continue
+
+        cells_y = cells[candidates]
+        changed = cells_y != cells[x]
+        delta = (weight * (counts[cells_y] - counts[cells[x]] + 1) * changed).sum(axis=1)
+        n_evaluated += candidates.size
+
+        # Heat-bath choice among the candidates and keeping x (delta 0)
+        delta = np.append(delta, 0.0)
+        logits = -(delta - delta.min()) / temperature
+        probs = np.exp(logits)
+        choice = rng.choice(delta.size, p=probs / probs.sum())
+        if choice == candidates.size:
+            continue
+
+        y = candidates[choice]
+        counts[cells[x]] -= 1
+        counts[cells[y]] += 1
+        cover_counts[cover_cells[x]] -= 1
+        cover_counts[cover_cells[y]] += 1
+        in_design[x], in_design[y] = False, True
+        current += delta[choice]
+        if current < best - 1e-9:
+            best, best_design = current, in_design.copy()
+
+    rows = pool[best_design].to_dict(orient="records")
+    info = {
+        "objective_start": start,
+        "objective_end": float(best),
+        "d_efficiency_start": d_efficiency(initial, factors),
+        "d_efficiency_end": d_efficiency(pool[best_design], factors),
+        "n_exchanges_evaluated": n_evaluated,
+        "seconds": time.perf_counter() - t0,
+    }
+    return rows, info
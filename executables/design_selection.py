@@ -0,0 +1,95 @@
+"""Choice of the covering-array design of a generator before any API call.
+
+A design is the merged, deduplicated rows of num_runs t=strength covering arrays, each built for a random order of the
+factors and of their levels (covering_design); a seed gives the same design in every process. Different seeds give
+designs of different sizes, so the paragraph budget caps the candidates (one per seed): a design with more rows than
+n_rows (by default the size of the base_seed design) is never chosen, whatever its confounding. Among the others the
+least confounded one is kept, scored by its largest pairwise Cramér's V and its largest three-way V (a factor vs. the joint levels of two others,
+see association_engine.design_confounding)."""
+
+import random
+
+import pandas as pd
+from testflows.combinatorics import CoveringArray
+
+from association_engine import design_confounding
+
+
+def covering_design(factors, strength, num_runs, design_seed):
+    """Rows of num_runs t=strength covering arrays over factors (dict name -> levels), merged and deduplicated.
+
+    Returns (rows, seen_keys): the rows as dicts and their keys ((name, level) tuples in the order of factors)."""
+    canonical_names = list(factors)
+    rows = []
+    seen_keys = set()
+
+    for run in range(num_runs):
+        rng = random.Random(design_seed + run)
+
+        # randomize factor order and each factor's level order
+        name_order = canonical_names[:]
+        rng.shuffle(name_order)
+        value_orders = {k: factors[k][:] for k in canonical_names}
+        for k in canonical_names:
+            rng.shuffle(value_orders[k])
+
+        # build a t=strength covering array for this ordering, over level positions: CoveringArray puts each
+        # factor's values through a set, which would replace the shuffled order by the (per-process) string hash order
+        params = {name: list(range(len(value_orders[name]))) for name in name_order}
+        ca = CoveringArray(params, strength=strength)
+        assert ca.check()  # t=strength coverage
+
+        # merge + dedupe immediately
+        for positions in ca:
+            r = {name: value_orders[name][positions[name]] for name in name_order}
+            key = tuple((k, r[k]) for k in canonical_names)  # canonical key order
+            if key not in seen_keys:
+                seen_keys.add(key)
+                rows.append(r)
+
+    return rows, seen_keys
+
+
+def select_design(factors, strength=3, num_runs=2, base_seed=23498, n_seed_candidates=50, n_rows=None):
+    """Least confounded covering design of at most n_rows rows among the seeds base_seed .. base_seed +
+    n_seed_candidates - 1 (n_rows defaults to the size of the base_seed design, which is then always a candidate).
+
+    Returns (rows, seen_keys, confounding, design_seed)."""
+    canonical_names = list(factors)
+    best = None
+    n_over_budget = 0
+    for design_seed in range(base_seed, base_seed + n_seed_candidates):
+        rows, seen_keys = covering_design(factors, strength, num_runs, design_seed)
+        if n_rows is None:
+            n_rows = len(rows)
+        if len(rows) > n_rows:
+            n_over_budget += 1
+            continue
+        confounding = design_confounding(pd.DataFrame(rows)[canonical_names], canonical_names)
+        score = (confounding["max_pairwise_v"], confounding["max_threeway_v"])
+        if best is None or score < best[0]:
+            best = (score, rows, seen_keys, confounding, design_seed)
+
+    if best is None:
+        raise RuntimeError(f"None of the {n_seed_candidates} candidate designs has at most {n_rows} rows. "
+                           f"Increase n_seed_candidates, change base_seed or n_rows.")
+    _, rows, seen_keys, confounding, design_seed = best
+    print(f"Design from seed {design_seed}: {len(rows)} unique rows for a budget of {n_rows} (best of "
+          f"{n_seed_candidates - n_over_budget} candidates; {n_over_budget} over the budget skipped)")
+    return rows, seen_keys, confounding, design_seed
+
+
+def check_confounding(confounding, max_pairwise_v, max_threeway_v, strict=True):
+    """Print the design's worst pairwise and three-way V and compare them with the thresholds.
+
+    Above a threshold, raises a RuntimeError with strict=True (before any paragraph is requested) and only warns
+    otherwise, e.g. when the design was not searched for (a single seed candidate)."""
+    print(f"  max pairwise V  = {confounding['max_pairwise_v']:.3f} {confounding['worst_pair']}")
+    print(f"  max three-way V = {confounding['max_threeway_v']:.3f} {confounding['worst_triple']}")
+    if confounding["max_pairwise_v"] <= max_pairwise_v and confounding["max_threeway_v"] <= max_threeway_v:
+        return
+    message = f"The design exceeds pairwise V <= {max_pairwise_v} or three-way V <= {max_threeway_v}."
+    if not strict:
+        print(f"[warn] {message}")
+        return
+    raise RuntimeError(f"{message} Increase n_seed_candidates, change base_seed or relax the thresholds.")
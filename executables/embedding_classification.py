@@ -20,9 +20,10 @@
 # our text embeddings?"
 
 #%% Implementation
+import time
+
 import pandas as pd
 import numpy as np
-from ast import literal_eval
 
 from sklearn.preprocessing import LabelEncoder
 from sklearn.model_selection import StratifiedKFold, cross_val_score, cross_val_predict
@@ -39,6 +40,22 @@ from sklearn.decomposition import PCA
 
 import matplotlib.pyplot as plt
 
+from decoding_tools import (
+    build_classifier,
+    embedding_csv_path,
+    encode_label,
+    learning_curve_decoding,
+    ensure_embedding_memmap,
+    load_embedding_memmap,
+    parallel_decode,
+    permutation_test_decoding,
+    ridge_probe,
+    sweep_pca_and_C,
+)
+from pca_variance import variance_profile
+from plot_rendering import FIGURE_DIR, show_or_save
+from results_store import cached_result, file_hash
+
 # STEP 1. Load embeddings database and set other parameters
 
 database_number = 21
@@ -49,10 +66,45 @@ embedding_size = "large"
 use_pca = True
 min_cum_variance_pca = 0.8
 
-df = pd.read_csv(f"../database_storage/database_{database_number:02d}-{database_name}__embeddings-{embedding_size}.csv")
-
-# Convert embeddings to numeric matrix
-X = np.array(df["embedding"].apply(literal_eval).to_list())
+# Closed-form ridge probe of all labels at once (STEP 2b; fast first-pass check)
+run_ridge_probe = True
+
+# Decode every label x fold in parallel worker processes (set to False to run the serial loop in STEP 4 instead)
+use_parallel_decoding = True
+n_jobs = -1
+
+# Permutation test of decoding accuracy against a shuffled-label null (STEP 5)
+run_permutation_test = True
+n_permutations = 5000
+
+# Nested-CV sweep over the number of PCA components and the logistic regression C (STEP 6)
+run_hyperparameter_sweep = True
+n_components_grid = list(range(2, 41, 2))
+C_grid = list(np.logspace(-3, 2, 10))
+
+# Learning curve: accuracy vs number of training paragraphs (STEP 7)
+run_learning_curve = True
+learning_curve_sizes = [10, 15, 20, 25, 30, 35, 40, 45, 50]
+learning_curve_repeats = 50
+
+# Results of each step are stored under a hash of (embeddings file, step, parameters); rerunning a cell with unchanged
+# inputs loads them from ../database_storage/results_store. Set to True to recompute and overwrite.
+refresh_results_store = False
+
+# Headless batch mode: save the figures (PCA variance, learning curves) to files instead of showing windows
+batch_render = False
+figure_formats = ("png", "svg")
+
+embeddings_csv = embedding_csv_path(database_number, database_name, embedding_size)
+df = pd.read_csv(embeddings_csv)
+data_hash = file_hash(embeddings_csv)
+database_label = f"database_{database_number:02d}"
+figure_dir = f"{FIGURE_DIR}/{database_label}"
+
+# Convert embeddings to numeric matrix. The parsed matrix is cached as a .npy next to the CSV and opened memory-mapped,
+# so the parallel workers in STEP 4 share it instead of each receiving a copy.
+embeddings_npy = ensure_embedding_memmap(embeddings_csv)
+X = load_embedding_memmap(embeddings_npy)
 print("Embeddings shape:", X.shape)
 
 # Define which labels to test
@@ -69,15 +121,18 @@ label_columns = [
 
 #%% STEP 2. Inspect PCA explained variance (global, across all texts)
 
-# Choose an upper limit on number of components to inspect
-max_components = min(X.shape[1], X.shape[0] - 1)
-print(f"Fitting PCA with up to {max_components} components for variance plot...")
+# Randomised truncated SVD, streamed over chunks of rows: the number of components grows until
+# min_cum_variance_pca is reached, and the variance left in the remaining components (the tail) comes from the
+# Frobenius norm of the centred data, so no full decomposition is needed.
+print(f"Estimating leading PCA components until {min_cum_variance_pca:.0%} of the variance is explained...")
 
-pca_plot = PCA(n_components=max_components, random_state=0)
-pca_plot.fit(X)
+profile = variance_profile(X, target=min_cum_variance_pca, random_state=0)
 
-explained_var_ratio = pca_plot.explained_variance_ratio_
-cum_explained = np.cumsum(explained_var_ratio)
+explained_var_ratio = profile["explained_variance_ratio"]
+cum_explained = profile["cum_explained"]
+max_components = len(cum_explained)
+print(f"Estimated {max_components} components; variance in the remaining components: "
+      f"{profile['tail_variance_ratio']:.4f}")
 
 # Print a quick textual summary
 print("\nFirst 10 components' explained variance ratio:")
@@ -90,13 +145,18 @@ for k in [10, 20, 50, 100]:
         print(f"  {k:3d} PCs: {cum_explained[k-1]:.4f}")
 
 # Decide how many PCA components to use in the logistic regression based on the cumulative explained variance:
-n_pca_components = np.searchsorted(cum_explained, min_cum_variance_pca) + 1  # +1 because indices start at 0
+n_pca_components = profile["n_components_for_target"]
+if n_pca_components is None:
+    # The target is only out of reach when every component has been estimated, i.e. at the full rank of the data
+    n_pca_components = max_components
+    print(f"[warn] All {max_components} components explain only {cum_explained[-1]:.1%} of the variance "
+          f"(< {min_cum_variance_pca:.0%}); using all of them.")
 
 print(f"\nNumber of PCs to reach >= {min_cum_variance_pca:.0%} variance: {n_pca_components}")
 print(f"Cumulative variance at {n_pca_components} PCs: {cum_explained[n_pca_components-1]:.4f}")
 
 # Plot cumulative explained variance
-plt.figure(figsize=(8, 5))
+fig = plt.figure(figsize=(8, 5))
 plt.plot(
     np.arange(1, max_components + 1),
     cum_explained,
@@ -104,14 +164,32 @@ plt.plot(
     markersize=2,
     linewidth=1,
 )
+plt.axhline(min_cum_variance_pca, color="gray", linestyle="--", linewidth=1)
 #plt.axvline(50)
-#plt.axhline(0.8)
 plt.xlabel("Number of PCA components")
 plt.ylabel("Cumulative explained variance")
 plt.title("PCA cumulative explained variance of text embeddings")
 plt.grid(True, alpha=0.3)
 plt.tight_layout()
-plt.show()
+show_or_save(fig, "pca_cumulative_variance", batch_render, figure_dir, figure_formats)
+
+#%% STEP 2b. Fast first-pass probe: closed-form ridge classifier for all labels at once
+
+# All labels are one-hot encoded into a single target matrix and solved together with one SVD per fold, with alpha
+# picked by generalised cross-validation. This takes milliseconds, so it can also be used as a quick check while
+# generating new databases; the logistic regression below is the main analysis.
+if run_ridge_probe:
+    probe_start = time.perf_counter()
+    probe_report = cached_result(
+        "ridge_probe",
+        data_hash,
+        {"label_columns": label_columns, "n_splits": 5, "cv_seed": 0},
+        lambda: {"report": ridge_probe(X, df, label_columns, n_splits=5, random_state=0)},
+        database=database_label,
+        refresh=refresh_results_store,
+    )["report"]
+    print(f"\n=== Ridge probe ({(time.perf_counter() - probe_start) * 1000:.0f} ms) ===")
+    print(probe_report.round(3).to_string(index=False))
 
 #%% STEP 3. Set up classifier and cross-validation
 
@@ -146,57 +224,208 @@ bal_acc_scorer = make_scorer(balanced_accuracy_score)
 
 #%% STEP 4. Loop over labels
 
-for col in label_columns:
-    y_raw = df[col].astype(str).str.strip()
-
-    # Drop rows with missing/unknown labels if needed
-    mask = (y_raw != "nan") & (y_raw != "")
-    X_sub = X[mask]
-    y_sub_raw = y_raw[mask]
-
-    # Encode string labels to integers
-    le = LabelEncoder()
-    y = le.fit_transform(y_sub_raw)
-
-    n_classes = len(le.classes_)
-    if n_classes < 2:
-        print(f"\n[{col}] Skipping: only {n_classes} class present.")
-        continue
-
-    print(f"\n=== Label: {col} ===")
-    print("Classes:", list(le.classes_))
-    print("Class counts:", y_sub_raw.value_counts().to_dict())
-
-    # Compute cross-validated accuracy
-    acc_scores = cross_val_score(clf, X_sub, y, cv=cv, scoring=acc_scorer)
-    bal_acc_scores = cross_val_score(clf, X_sub, y, cv=cv, scoring=bal_acc_scorer)
-
-    chance_level = 1.0 / n_classes
-
-    print(f"Chance level: {chance_level:.3f}")
-    print(f"Accuracy: mean={acc_scores.mean():.3f}, std={acc_scores.std():.3f}")
-    print(f"Balanced accuracy: mean={bal_acc_scores.mean():.3f}, std={bal_acc_scores.std():.3f}")
-
-
-# Cross-validated predictions for confusion matrix & other metrics
-
-    # cross_val_predict trains/validates like cross_val_score, but returns
-    # the out-of-fold predictions for each sample
-    y_pred_cv = cross_val_predict(clf, X_sub, y, cv=cv)
+if use_parallel_decoding:
+    # Every label x fold is fit in a separate worker; results are gathered into one report.
+    def run_decoding():
+        report, details = parallel_decode(
+            df,
+            embeddings_npy,
+            label_columns,
+            param_grid={"n_pca_components": [n_pca_components if use_pca else None], "C": [1.0]},
+            n_splits=5,
+            random_state=0,
+            n_jobs=n_jobs,
+        )
+        # Keep a model fit on all labelled rows alongside the cross-validated metrics
+        models = {}
+        for col in report["label"]:
+            rows, y, _ = encode_label(df, col)
+            models[col] = build_classifier(n_pca_components if use_pca else None, C=1.0).fit(X[rows], y)
+        return {"report": report, "details": details, "models": models}
+
+    decoding = cached_result(
+        "decoding",
+        data_hash,
+        {"label_columns": label_columns, "n_pca_components": n_pca_components if use_pca else None, "C": 1.0,
+         "n_splits": 5, "cv_seed": 0},
+        run_decoding,
+        database=database_label,
+        refresh=refresh_results_store,
+    )
+    report, details = decoding["report"], decoding["details"]
 
-    # Confusion matrix (using integer labels 0,...,n_classes-1)
-    cm = confusion_matrix(y, y_pred_cv, labels=np.arange(n_classes))
+    # report rows and details are in the same (label) order
+    for (_, res), det in zip(report.iterrows(), details.values()):
+        col = res["label"]
 
-    # Wrap it in a DataFrame with class names for readability
-    cm_df = pd.DataFrame(cm, index=le.classes_, columns=le.classes_)
+        print(f"\n=== Label: {col} ===")
+        print("Classes:", det["classes"])
+        print("Class counts:", df[col].astype(str).str.strip().value_counts().to_dict())
+        print(f"Chance level: {res['chance_level']:.3f}")
+        print(f"Accuracy: mean={res['accuracy_mean']:.3f}, std={res['accuracy_std']:.3f}")
+        print(f"Balanced accuracy: mean={res['balanced_accuracy_mean']:.3f}, std={res['balanced_accuracy_std']:.3f}")
 
-    print("\nConfusion matrix (rows=true, cols=predicted):")
-    print(cm_df.to_string())
+        print("\nConfusion matrix (rows=true, cols=predicted):")
+        print(det["confusion_matrix"].to_string())
+        print(f"\nMacro F1 score: {res['f1_macro']:.3f}")
+        print("\nClassification report:")
+        print(classification_report(det["y_true"], det["y_pred"], target_names=det["classes"]))
 
-    # Additional summary metrics (macro F1 is nice with class imbalance)
-    f1_macro = f1_score(y, y_pred_cv, average="macro")
-    print(f"\nMacro F1 score: {f1_macro:.3f}")
+    print("\n=== Summary (all labels) ===")
+    print(report.round(3).to_string(index=False))
 
-    # Full classification report (per-class precision/recall/F1)
-    print("\nClassification report:")
-    print(classification_report(y, y_pred_cv, target_names=le.classes_))
\ No newline at end of file
+else:
+    for col in label_columns:
+        y_raw = df[col].astype(str).str.strip()
+
+        # Drop rows with missing/unknown labels if needed
+        mask = (y_raw != "nan") & (y_raw != "")
+        X_sub = X[mask]
+        y_sub_raw = y_raw[mask]
+
+        # Encode string labels to integers
+        le = LabelEncoder()
+        y = le.fit_transform(y_sub_raw)
+
+        n_classes = len(le.classes_)
+        if n_classes < 2:
+            print(f"\n[{col}] Skipping: only {n_classes} class present.")
+            continue
+
+        print(f"\n=== Label: {col} ===")
+        print("Classes:", list(le.classes_))
+        print("Class counts:", y_sub_raw.value_counts().to_dict())
+
+        # Compute cross-validated accuracy
+        acc_scores = cross_val_score(clf, X_sub, y, cv=cv, scoring=acc_scorer)
+        bal_acc_scores = cross_val_score(clf, X_sub, y, cv=cv, scoring=bal_acc_scorer)
+
+        chance_level = 1.0 / n_classes
+
+        print(f"Chance level: {chance_level:.3f}")
+        print(f"Accuracy: mean={acc_scores.mean():.3f}, std={acc_scores.std():.3f}")
+        print(f"Balanced accuracy: mean={bal_acc_scores.mean():.3f}, std={bal_acc_scores.std():.3f}")
+
+
+    # Cross-validated predictions for confusion matrix & other metrics
+
+        # cross_val_predict trains/validates like cross_val_score, but returns
+        # the out-of-fold predictions for each sample
+        y_pred_cv = cross_val_predict(clf, X_sub, y, cv=cv)
+
+        # Confusion matrix (using integer labels 0,...,n_classes-1)
+        cm = confusion_matrix(y, y_pred_cv, labels=np.arange(n_classes))
+
+        # Wrap it in a DataFrame with class names for readability
+        cm_df = pd.DataFrame(cm, index=le.classes_, columns=le.classes_)
+
+        print("\nConfusion matrix (rows=true, cols=predicted):")
+        print(cm_df.to_string())
+
+        # Additional summary metrics (macro F1 is nice with class imbalance)
+        f1_macro = f1_score(y, y_pred_cv, average="macro")
+        print(f"\nMacro F1 score: {f1_macro:.3f}")
+
+        # Full classification report (per-class precision/recall/F1)
+        print("\nClassification report:")
+        print(classification_report(y, y_pred_cv, target_names=le.classes_))
+
+#%% STEP 5. Permutation test against a shuffled-label null
+
+# 1 / n_classes is only the chance level for balanced classes. Here the labels are shuffled n_permutations times and
+# decoded with the same folds and PCA projections; the p-value is the fraction of shuffles that do at least as well.
+# A closed-form ridge classifier on the fold PCA projections is used so that all shuffles can be solved in batches.
+if run_permutation_test:
+    perm_result = cached_result(
+        "permutation_test",
+        data_hash,
+        {"label_columns": label_columns, "n_pca_components": n_pca_components if use_pca else None,
+         "n_permutations": n_permutations, "n_splits": 5, "cv_seed": 0},
+        lambda: dict(zip(("report", "null_distributions"), permutation_test_decoding(
+            X,
+            df,
+            label_columns,
+            n_pca_components=n_pca_components if use_pca else None,
+            n_permutations=n_permutations,
+            n_splits=5,
+            random_state=0,
+            n_jobs=n_jobs,
+        ))),
+        database=database_label,
+        refresh=refresh_results_store,
+    )
+    perm_report, null_distributions = perm_result["report"], perm_result["null_distributions"]
+    print(f"\n=== Permutation test (ridge classifier, {n_permutations} shuffles) ===")
+    print(perm_report.round(4).to_string(index=False))
+
+#%% STEP 6. Sweep the number of PCA components and C with nested cross-validation
+
+# The fixed n_pca_components / C=1.0 above are a single point of this grid. Each training fold is decomposed once and
+# every n_components is a slice of that SVD; C values are fit in increasing order, warm-starting from the previous fit.
+# The outer folds give an unbiased accuracy for "pick the best (n_components, C) by inner CV".
+if run_hyperparameter_sweep:
+    sweep_result = cached_result(
+        "pca_C_sweep",
+        data_hash,
+        {"label_columns": label_columns, "n_components_grid": n_components_grid, "C_grid": C_grid,
+         "n_outer_splits": 5, "n_inner_splits": 3, "cv_seed": 0},
+        lambda: dict(zip(("report", "inner_grids"), sweep_pca_and_C(
+            X,
+            df,
+            label_columns,
+            n_components_grid=n_components_grid,
+            C_grid=C_grid,
+            n_outer_splits=5,
+            n_inner_splits=3,
+            random_state=0,
+            n_jobs=n_jobs,
+        ))),
+        database=database_label,
+        refresh=refresh_results_store,
+    )
+    sweep_report, inner_grids = sweep_result["report"], sweep_result["inner_grids"]
+    print(f"\n=== Nested CV sweep ({len(n_components_grid)} x {len(C_grid)} grid) ===")
+    print(sweep_report.round(4).to_string(index=False))
+
+#%% STEP 7. Learning curve: how many paragraphs does decoding need?
+
+# Each repeat holds out a stratified 20% test set and trains on nested stratified subsamples of the rest. The band is
+# the 2.5th-97.5th percentile over repeats. Use it to judge whether adding paragraphs to the stimulus set would still
+# improve decoding (curve still rising) or not (curve flat).
+if run_learning_curve:
+    curve = cached_result(
+        "learning_curve",
+        data_hash,
+        {"label_columns": label_columns, "train_sizes": learning_curve_sizes, "n_repeats": learning_curve_repeats,
+         "test_size": 0.2, "use_pca": use_pca, "n_pca_components": n_pca_components if use_pca else None, "C": 1.0,
+         "seed": 0},
+        lambda: {"report": learning_curve_decoding(
+            X,
+            df,
+            label_columns,
+            train_sizes=learning_curve_sizes,
+            n_repeats=learning_curve_repeats,
+            test_size=0.2,
+            n_pca_components=n_pca_components if use_pca else None,
+            C=1.0,
+            random_state=0,
+            n_jobs=n_jobs,
+        )},
+        database=database_label,
+        refresh=refresh_results_store,
+    )["report"]
+    print(f"\n=== Learning curve ({learning_curve_repeats} repeats per size) ===")
+    print(curve.round(3).to_string(index=False))
+
+    fig = plt.figure(figsize=(8, 5))
+    for col, curve_col in curve.groupby("label", sort=False):
+        plt.plot(curve_col["train_size"], curve_col["accuracy_mean"], marker="o", markersize=3, label=col)
+        plt.fill_between(curve_col["train_size"], curve_col["ci_lower"], curve_col["ci_upper"], alpha=0.15)
+    plt.xlabel("Number of training paragraphs")
+    plt.ylabel("Test accuracy")
+    pca_title, pca_tag = (f"{n_pca_components} PCs", f"{n_pca_components}pcs") if use_pca else ("no PCA", "nopca")
+    plt.title(f"Learning curves (database {database_number:02d}, {pca_title})")
+    plt.legend(fontsize=8)
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    show_or_save(fig, f"learning_curves_{pca_tag}", batch_render, figure_dir, figure_formats)
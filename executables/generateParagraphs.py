@@ -1,9 +1,10 @@
 import os
-import json, random
+import json
 from openai import OpenAI
 import time
 import pandas as pd
-from testflows.combinatorics import CoveringArray
+
+from design_selection import check_confounding, select_design
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY_MCA"))
 
@@ -63,34 +64,17 @@ canonical_names = list(FACTORS.keys())
 num_runs = 2          # bump this to 10–20 if you want a bigger, richer pool
 base_seed = 23498     # change to vary the sequence
 
-rows_all = []
-seen = set()
-
-for run in range(num_runs):
-    rng = random.Random(base_seed + run)
-
-    # randomize factor order and each factor's level order
-    name_order = canonical_names[:]
-    rng.shuffle(name_order)
-    value_orders = {k: FACTORS[k][:] for k in canonical_names}
-    for k in canonical_names:
-        rng.shuffle(value_orders[k])
-
-    # build a t=3 covering array for this ordering
-    params = {name: value_orders[name] for name in name_order}
-    ca = CoveringArray(params, strength=3)
-    assert ca.check()  # t=3 coverage
-
-    # merge + dedupe immediately
-    added = 0
-    for r in ca:
-        key = tuple((k, r[k]) for k in canonical_names)  # canonical key order
-        if key not in seen:
-            seen.add(key)
-            rows_all.append(r)
-            added += 1
-
-    print(f"Run {run+1}/{num_runs}: added {added} unique rows (pool so far: {len(rows_all)})")
+# Design choice and confound check: see design_selection.select_design and check_confounding
+n_seed_candidates = 1  # 1: the base_seed design of this existing database; e.g. 50 for a new database
+n_design_rows = None
+max_pairwise_v = 0.25
+max_threeway_v = 0.4
+
+rows_all, seen, confounding, design_seed = select_design(
+    FACTORS, strength=3, num_runs=num_runs, base_seed=base_seed, n_seed_candidates=n_seed_candidates,
+    n_rows=n_design_rows,
+)
+check_confounding(confounding, max_pairwise_v, max_threeway_v, strict=n_seed_candidates > 1)
 
 #%% Inspect coverage
 
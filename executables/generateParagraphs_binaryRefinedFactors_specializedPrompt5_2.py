@@ -3,10 +3,14 @@ import json, random
 from openai import OpenAI
 import time
 import pandas as pd
-from testflows.combinatorics import CoveringArray
 import itertools
 import random
 
+from association_engine import design_confounding
+from design_selection import check_confounding, select_design
+from design_optimizer import optimize_design
+from text_constraints import constraint_violations, load_regeneration_queue, queue_regeneration
+
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY_MCA"))
 
 database_number = 21
@@ -73,37 +77,37 @@ ca_strength = 3       # Defines a t = ca_strength covering array
 num_runs = 2          # bump this to 10–20 if you want a bigger, richer pool
 base_seed = 23498     # change to vary the sequence
 
-rows_all = []
-seen = set()
-
-for run in range(num_runs):
-    rng = random.Random(base_seed + run)
-
-    # randomize factor order and each factor's level order
-    name_order = canonical_names[:]
-    rng.shuffle(name_order)
-    value_orders = {k: FACTORS[k][:] for k in canonical_names}
-    for k in canonical_names:
-        rng.shuffle(value_orders[k])
-
-    # build a t=ca_strength covering array for this ordering
-    params = {name: value_orders[name] for name in name_order}
-    ca = CoveringArray(params, strength=ca_strength)
-    assert ca.check()  # t=ca_strength coverage
-
-    # merge + dedupe immediately
-    added = 0
-    for r in ca:
-        key = tuple((k, r[k]) for k in canonical_names)  # canonical key order
-        if key not in seen:
-            seen.add(key)
-            rows_all.append(r)
-            added += 1
-
-    print(f"Run {run+1}/{num_runs}: added {added} unique rows (pool so far: {len(rows_all)})")
+# Design choice and confound check: see design_selection.select_design and check_confounding
+n_seed_candidates = 1  # 1: the base_seed design of this existing database; e.g. 50 for a new database
+n_design_rows = None
+max_pairwise_v = 0.25
+max_threeway_v = 0.4
+
+# Orthogonality optimisation: starting from the selected covering array, rows are exchanged with the rest of the full
+# factorial (simulated annealing) to balance every one-, two- and three-factor table, keeping t=ca_strength coverage and
+# the number of paragraphs. The practice rows below are then drawn from the combinations left out of the design.
+optimize_rows = True
+n_anneal_steps = 20000
+
+rows_all, seen, confounding, design_seed = select_design(
+    FACTORS, strength=ca_strength, num_runs=num_runs, base_seed=base_seed, n_seed_candidates=n_seed_candidates,
+    n_rows=n_design_rows,
+)
+
+if optimize_rows:
+    print(f"  before optimisation: max pairwise V = {confounding['max_pairwise_v']:.3f}, "
+          f"max three-way V = {confounding['max_threeway_v']:.3f}")
+    rows_all, optimization = optimize_design(FACTORS, rows_all, strength=ca_strength, n_steps=n_anneal_steps,
+                                             random_state=design_seed)
+    seen = {tuple((k, r[k]) for k in canonical_names) for r in rows_all}
+    confounding = design_confounding(pd.DataFrame(rows_all)[canonical_names], canonical_names)
+    print(f"  optimised: D-efficiency {optimization['d_efficiency_start']:.1f}% -> "
+          f"{optimization['d_efficiency_end']:.1f}% ({optimization['n_exchanges_evaluated']:,} exchanges evaluated "
+          f"in {optimization['seconds']:.1f}s)")
+check_confounding(confounding, max_pairwise_v, max_threeway_v, strict=n_seed_candidates > 1)
 
 # === Add practice (warm-up) rows with random *unique* combinations ===
-num_practice = 2 # The covering array generates 63 combinations with t=3, so add 2 to get total 65 paragraphs
+num_practice = 2 # practice paragraphs, generated on top of the len(rows_all) design paragraphs
 practice_rows = []
 
 rng_practice = random.Random(base_seed + 198)  # different seed from CA runs
@@ -174,25 +178,14 @@ with open("../executables/paragraph_output_schema__single_binary-refined-factors
 MAX_RETRIES = 4
 BACKOFF_SEC = [0.5, 1, 2, 4]  # wait times of retries in case of errors associated with rate limits, etc.
 
-duration_total = 0.0
-N_total = num_practice
+# Local constraint check of every generated paragraph (word count, single paragraph, no lists/em-dashes, readability
+# vs. difficulty). Violating rows are still saved, but queued so that only they are regenerated (last cell).
+min_words, max_words = 120, 150
+queue_path = f"../database_storage/regeneration_queue_database_{database_number}.jsonl"
 
-global_start = time.time()
 
-# generate practice trials and save in a separate file
-for i, r in enumerate(practice_rows, 1):
-    startTime = time.time()
-    controls = {
-        "genre": r["genre"],
-        "difficulty": r["difficulty"],
-        "predictability": r["predictability"],
-        "emotional_valence": r["emotional_valence"],
-        "concreteness": r["concreteness"],
-        "tone": r["tone"],
-        "topic_hint": r["topic_hint"],
-    }
-
-    success = False
+def request_paragraph(controls, i):
+    """Generate one paragraph for the given controls; returns the parsed JSON object, or None after MAX_RETRIES."""
     raw = None  # for debug saves
 
     for attempt in range(MAX_RETRIES):
@@ -252,8 +245,7 @@ for i, r in enumerate(practice_rows, 1):
             # (optional) sanity checks
             assert obj.get("genre") == controls["genre"], "Genre mismatch"
             assert obj.get("difficulty") == controls["difficulty"], "Difficulty mismatch"
-            assert obj.get("predictability") == controls[
-                "predictability"], "Predictability mismatch"
+            assert obj.get("predictability") == controls["predictability"], "Predictability mismatch"
             assert obj.get("emotional_valence") == controls["emotional_valence"], "Emotional valence mismatch"
             assert obj.get("concreteness") == controls["concreteness"], "Concreteness mismatch"
             assert obj.get("tone") == controls["tone"], "Tone mismatch"
@@ -261,12 +253,7 @@ for i, r in enumerate(practice_rows, 1):
             assert isinstance(obj.get("text"), str) and len(obj["text"]) > 0, "Missing text"
             assert resp.incomplete_details is None
 
-            # Save result
-            with open(f"../database_storage/paragraphs_{database_name}__practice.jsonl", "a", encoding="utf-8") as f:
-                f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-
-            success = True
-            break  # exit retry loop
+            return obj
 
         except json.JSONDecodeError as e:
             dbg_path = f"debug_response_{i}_try{attempt+1}.txt"
@@ -283,6 +270,37 @@ for i, r in enumerate(practice_rows, 1):
             print(f"[warn] API error at item {i} (try {attempt+1}): {e}")
             time.sleep(BACKOFF_SEC[min(attempt, len(BACKOFF_SEC)-1)])
 
+    return None
+
+
+def paragraph_violations(obj):
+    return constraint_violations([obj["text"]], min_words=min_words, max_words=max_words,
+                                 difficulty=[obj["difficulty"]])["violations"][0]
+
+
+def controls_of(r):
+    return {name: r[name] for name in canonical_names}
+
+
+duration_total = 0.0
+N_total = num_practice
+
+global_start = time.time()
+
+# generate practice trials and save in a separate file
+for i, r in enumerate(practice_rows, 1):
+    startTime = time.time()
+
+    obj = request_paragraph(controls_of(r), i)
+    success = obj is not None
+    if success:
+        with open(f"../database_storage/paragraphs_{database_name}__practice.jsonl", "a", encoding="utf-8") as f:
+            f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+
+        violations = paragraph_violations(obj)
+        if violations:
+            print(f"[warn] Practice item {i} violates {violations}.")
+
     endTime = time.time()
     duration = endTime - startTime
     duration_total += duration
@@ -303,113 +321,44 @@ df.to_csv(f"../database_storage/database_{database_number}-{database_name}__prac
 
 #%% generate for main dataset
 
-duration_total = 0.0
-N_total = len(rows_all)
+jsonl_path = f"../database_storage/paragraphs_{database_name}"
+database_csv = f"../database_storage/database_{database_number}-{database_name}.csv"
 
-global_start = time.time()
-for i, r in enumerate(rows_all, 1):
-    startTime = time.time()
 
-    controls = {
-        # CORE
-        "genre": r["genre"],
-        "difficulty": r["difficulty"],
-        "predictability": r["predictability"],
-        "emotional_valence": r["emotional_valence"],
-        "concreteness": r["concreteness"],
-        "tone": r["tone"],
-        "topic_hint": r["topic_hint"]
-    }
-
-    success = False
-    raw = None  # for debug saves
+def read_paragraphs(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
 
-    for attempt in range(MAX_RETRIES):
-        try:
-            resp = client.responses.create(
-                model=gpt_model,
-                instructions=SYSTEM_PROMPT,
-                input=json.dumps({"controls": controls}),
-                reasoning={
-                    "effort": "medium"
-                },
-                text={
-                    "format": {
-                        "type": "json_schema",
-                        "name": "eeg_paragraph",
-                        "schema": output_schema,
-                        "strict": True
-                    }
-                }
-            )
 
-            # ---- robust extraction across response shapes ----
-            obj = None
-            raw = getattr(resp, "output_text", None)
+def save_database_csv():
+    # The JSONL is the source of truth: the database CSV is always rebuilt from it (one row per line, in order)
+    df = pd.json_normalize(read_paragraphs(jsonl_path))
+    df.to_csv(database_csv, index=False)
+    return df
 
-            # New Responses shape
-            out_list = getattr(resp, "output", None)
-            if obj is None and isinstance(out_list, list) and out_list:
-                content = getattr(out_list[0], "content", None)
-                if isinstance(content, list) and content:
-                    frag = content[0]
-                    parsed = getattr(frag, "parsed", None)
-                    if parsed is not None:
-                        obj = parsed
-                    else:
-                        raw = getattr(frag, "text", raw)
-
-            # Legacy chat-like fallback
-            if obj is None and (raw is None) and hasattr(resp, "choices"):
-                msg = getattr(resp.choices[0], "message", None)
-                if msg is not None:
-                    parsed = getattr(msg, "parsed", None)
-                    if parsed is not None:
-                        obj = parsed
-                    else:
-                        raw = getattr(msg, "content", raw)
-
-            # Final parse
-            if obj is None:
-                if raw is None:
-                    raise ValueError("No JSON text available in response.")
-                if isinstance(raw, (bytes, bytearray)):
-                    raw = raw.decode("utf-8", "replace")
-                obj = json.loads(raw)
-            # ---- end extraction ----
-
-            # (optional) sanity checks
-            assert obj.get("genre") == controls["genre"], "Genre mismatch"
-            assert obj.get("difficulty") == controls["difficulty"], "Difficulty mismatch"
-            assert obj.get("predictability") == controls["predictability"], "Predictability mismatch"
-            assert obj.get("emotional_valence") == controls["emotional_valence"], "Emotional valence mismatch"
-            assert obj.get("concreteness") == controls["concreteness"], "Concreteness mismatch"
-            assert obj.get("tone") == controls["tone"], "Tone mismatch"
-            assert obj.get("topic_hint") == controls["topic_hint"], "Topic hint mismatch"
-            assert isinstance(obj.get("text"), str) and len(obj["text"]) > 0, "Missing text"
-            assert resp.incomplete_details is None
 
-            # Save result
-            with open(f"../database_storage/paragraphs_{database_name}", "a", encoding="utf-8") as f:
-                f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+duration_total = 0.0
+N_total = len(rows_all)
+# Row of the next saved paragraph in the database CSV. The JSONL is appended to, so a resumed or repeated run
+# continues after the paragraphs that are already there.
+n_saved = len(read_paragraphs(jsonl_path)) if os.path.exists(jsonl_path) else 0
 
-            success = True
-            break  # exit retry loop
+global_start = time.time()
+for i, r in enumerate(rows_all, 1):
+    startTime = time.time()
 
-        except json.JSONDecodeError as e:
-            dbg_path = f"debug_response_{i}_try{attempt+1}.txt"
-            try:
-                with open(dbg_path, "w", encoding="utf-8") as dbg:
-                    dbg.write(raw if raw is not None else "<no raw text available>")
-                print(f"[warn] JSON parse failed at item {i} (try {attempt+1}): {e}. Saved {dbg_path}")
-            except Exception:
-                print(f"[warn] JSON parse failed at item {i} (try {attempt+1}): {e}. (Could not save debug file.)")
-            time.sleep(BACKOFF_SEC[min(attempt, len(BACKOFF_SEC)-1)])
+    controls = controls_of(r)
+    obj = request_paragraph(controls, i)
+    success = obj is not None
+    if success:
+        with open(jsonl_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(obj, ensure_ascii=False) + "\n")
 
-        except Exception as e:
-            # Network/timeout/rate-limit/etc.
-            print(f"[warn] API error at item {i} (try {attempt+1}): {e}")
-            time.sleep(BACKOFF_SEC[min(attempt, len(BACKOFF_SEC)-1)])
+        violations = paragraph_violations(obj)
+        if violations:
+            queue_regeneration(queue_path, n_saved, controls, violations)
+            print(f"[warn] Item {i} violates {violations}; queued for regeneration.")
+        n_saved += 1
 
     endTime = time.time()
     duration = endTime - startTime
@@ -428,5 +377,42 @@ for i, r in enumerate(rows_all, 1):
 
 
 #%% Load JSONL, flatten nested fields (e.g., style.*), and save to CSV
-df = pd.json_normalize(pd.read_json(f"../database_storage/paragraphs_{database_name}", lines=True).to_dict(orient="records"))
-df.to_csv(f"../database_storage/database_{database_number}-{database_name}.csv", index=False)
\ No newline at end of file
+df = save_database_csv()
+
+
+#%% Regenerate only the queued rows (from the inline check above or checkTextConstraints_database.py)
+# Queued rows are line positions in the JSONL (= rows of the database CSV). Replacements are written back to the
+# JSONL and the CSV is rebuilt from it, so the cell above never undoes a fix.
+paragraphs = read_paragraphs(jsonl_path)
+queue = load_regeneration_queue(queue_path)
+still_failing = []
+
+for k, (row, entry) in enumerate(sorted(queue.items()), 1):
+    obj = request_paragraph(entry["controls"], f"regen{row}")
+    if obj is None:
+        still_failing.append(entry)
+        print(f"[skip] Row {row} could not be regenerated; left in the queue.")
+        continue
+
+    # Keep the new paragraph only if it breaks no more constraints than the one it replaces
+    violations = paragraph_violations(obj)
+    if len(violations) <= len(entry["violations"]):
+        paragraphs[row] = obj
+    else:
+        violations = entry["violations"]
+    if violations:
+        still_failing.append({"row": row, "controls": entry["controls"], "violations": violations})
+    print(f"Regenerated row {row} ({k}/{len(queue)}): {violations or 'ok'}")
+    time.sleep(0.1)
+
+with open(jsonl_path + ".tmp", "w", encoding="utf-8") as f:
+    for obj in paragraphs:
+        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+os.replace(jsonl_path + ".tmp", jsonl_path)
+df = save_database_csv()
+
+with open(queue_path + ".tmp", "w", encoding="utf-8") as f:
+    for entry in still_failing:
+        f.write(json.dumps(entry) + "\n")
+os.replace(queue_path + ".tmp", queue_path)
+print(f"{len(queue) - len(still_failing)} of {len(queue)} queued rows fixed; {len(still_failing)} still queued.")
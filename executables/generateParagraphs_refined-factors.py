@@ -3,9 +3,10 @@ import json, random
 from openai import OpenAI
 import time
 import pandas as pd
-from testflows.combinatorics import CoveringArray
 import itertools
 
+from design_selection import check_confounding, select_design
+
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY_MCA"))
 
 database_number = 18
@@ -88,37 +89,20 @@ ca_strength = 3       # Defines a t = ca_strength covering array
 num_runs = 1          # bump this to 10–20 if you want a bigger, richer pool
 base_seed = 23498     # change to vary the sequence
 
-rows_all = []
-seen = set()
-
-for run in range(num_runs):
-    rng = random.Random(base_seed + run)
-
-    # randomize factor order and each factor's level order
-    name_order = canonical_names[:]
-    rng.shuffle(name_order)
-    value_orders = {k: FACTORS[k][:] for k in canonical_names}
-    for k in canonical_names:
-        rng.shuffle(value_orders[k])
-
-    # build a t=ca_strength covering array for this ordering
-    params = {name: value_orders[name] for name in name_order}
-    ca = CoveringArray(params, strength=ca_strength)
-    assert ca.check()  # t=ca_strength coverage
-
-    # merge + dedupe immediately
-    added = 0
-    for r in ca:
-        key = tuple((k, r[k]) for k in canonical_names)  # canonical key order
-        if key not in seen:
-            seen.add(key)
-            rows_all.append(r)
-            added += 1
+# Design choice and confound check: see design_selection.select_design and check_confounding
+n_seed_candidates = 1  # 1: the base_seed design of this existing database; e.g. 50 for a new database
+n_design_rows = None
+max_pairwise_v = 0.25
+max_threeway_v = 0.4
 
-    print(f"Run {run+1}/{num_runs}: added {added} unique rows (pool so far: {len(rows_all)})")
+rows_all, seen, confounding, design_seed = select_design(
+    FACTORS, strength=ca_strength, num_runs=num_runs, base_seed=base_seed, n_seed_candidates=n_seed_candidates,
+    n_rows=n_design_rows,
+)
+check_confounding(confounding, max_pairwise_v, max_threeway_v, strict=n_seed_candidates > 1)
 
 # === Add practice (warm-up) rows with random *unique* combinations ===
-num_practice = 2 # The covering array generates 63 combinations with t=3, so add 2 to get total 65 paragraphs
+num_practice = 2 # practice paragraphs, generated on top of the len(rows_all) design paragraphs
 practice_rows = []
 
 rng_practice = random.Random(base_seed + 198)  # different seed from CA runs
@@ -0,0 +1,241 @@
+"""Audit of realised vs. requested factor labels of generated paragraphs.
+
+The generators only check that the model echoed the requested labels back in its JSON, which says nothing about the
+text itself. Here each factor is estimated from the text instead:
+
+1. Local estimate: cheap text features (text_features.text_features, optionally with TF-IDF word features) feed a
+   logistic regression whose out-of-fold class probabilities say how much a paragraph looks like its requested level
+   compared with the other paragraphs of the corpus. Its C and the weight of the word block against the standardised
+   features are chosen per factor by an inner cross-validation on log loss (topic needs the words, style factors
+   mostly do not).
+2. Local check: the classifier is trained on the very labels it audits, so its verdicts are only used for a factor
+   whose out-of-fold accuracy and calibration (expected calibration error) meet min_accuracy / max_calibration_error.
+   Factors with a level that occurs only once get no local model at all.
+3. Triage: a paragraph agrees locally if P(requested level) >= confident, disagrees locally if another level has
+   probability >= confident, and is ambiguous otherwise.
+4. The judge: an LLM sees every item that is not a local agreement of a checked factor, several paragraphs per
+   request. A local disagreement is never final, since it may be the classifier's error rather than the label's, and
+   a factor whose local model fails the check goes to the judge in full. Only the paragraphs of the corpus are
+   judged, so the judge calls drop only once every factor of a paragraph is settled locally; the report counts the
+   items kept from the judge (accepted_locally) and sent to it (sent_to_judge).
+
+The final estimate of an item is the local one for the agreements of checked factors and the judge's label otherwise;
+items without a judge verdict stay unresolved and do not count towards the agreement rate."""
+
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GridSearchCV, StratifiedKFold, cross_val_predict
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+MAX_RETRIES = 4
+BACKOFF_SEC = [0.5, 1, 2, 4]
+
+C_GRID = np.logspace(-2, 3, 6)
+WORD_WEIGHTS = [1.0, 3.0, 10.0]
+
+
+def audit_design_matrix(features, texts=None, max_words=2000):
+    """Standardised feature matrix for the local estimators, with TF-IDF unigrams appended when texts are given."""
+    dense = StandardScaler().fit_transform(features.fillna(features.mean()).fillna(0.0))
+    if texts is None:
+        return dense
+    tfidf = TfidfVectorizer(max_features=max_words, min_df=2, sublinear_tf=True, stop_words="english")
+    return sparse.hstack([sparse.csr_matrix(dense), tfidf.fit_transform(texts)]).tocsr()
+
+
+class _WordBlockWeight(BaseEstimator, TransformerMixin):
+    """Multiplies the word columns of an audit_design_matrix (all columns from n_dense on) by weight."""
+
+    def __init__(self, n_dense=0, weight=1.0):
+        self.n_dense = n_dense
+        self.weight = weight
+
+    def fit(self, X, y=None):
+        return self
+
+    def transform(self, X):
+        scale = np.ones(X.shape[1])
+        scale[self.n_dense:] = self.weight
+        return X @ sparse.diags(scale) if sparse.issparse(X) else X * scale
+
+
+def local_label_probabilities(X, labels, n_splits=5, n_dense=None, C=1.0, random_state=0):
+    """Out-of-fold class probabilities of one factor, as a DataFrame with one column per level.
+
+    Within each training fold, C (and the word block weight, if X has word columns after its first n_dense ones) is
+    chosen by an inner stratified CV on log loss; C is used as is when the rarest level is too rare for inner splits.
+    Returns None when the rarest level occurs fewer than 2 times, so that no stratified split is possible."""
+    labels = pd.Series(labels).reset_index(drop=True)
+    min_count = labels.value_counts().min()
+    n_splits = min(n_splits, min_count)
+    if n_splits < 2:
+        return None
+    cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    clf = LogisticRegression(C=C, max_iter=2000)
+    n_inner_splits = min(3, min_count - -(-min_count // n_splits))  # rarest level's count in a training fold
+    if n_inner_splits >= 2:
+        n_dense = X.shape[1] if n_dense is None else n_dense
+        grid = {"clf__C": C_GRID}
+        if n_dense < X.shape[1]:
+            grid["words__weight"] = WORD_WEIGHTS
+        clf = GridSearchCV(Pipeline([("words", _WordBlockWeight(n_dense)), ("clf", clf)]), grid,
+                           cv=StratifiedKFold(n_splits=n_inner_splits, shuffle=True, random_state=random_state),
+                           scoring="neg_log_loss")
+    proba = cross_val_predict(clf, X, labels, cv=cv, method="predict_proba")
+    return pd.DataFrame(proba, columns=np.sort(labels.unique()))
+
+
+def calibration_error(proba, labels, n_bins=10):
+    """Expected calibration error of the most probable level: the |confidence - accuracy| gap of n_bins equal-width
+    confidence bins, weighted by the share of paragraphs in each bin."""
+    labels = pd.Series(labels).reset_index(drop=True)
+    confidence = proba.max(axis=1).to_numpy()
+    correct = (proba.idxmax(axis=1) == labels).to_numpy()
+    bins = np.minimum((confidence * n_bins).astype(int), n_bins - 1)
+    counts = np.bincount(bins, minlength=n_bins)
+    gap = np.abs(np.bincount(bins, confidence, n_bins) - np.bincount(bins, correct, n_bins))
+    return gap.sum() / counts.sum()
+
+
+def triage(proba, requested, confident=0.7):
+    """Per-paragraph local verdict ("agree", "disagree" or "ambiguous"), P(requested) and the most probable level."""
+    requested = pd.Series(requested).reset_index(drop=True)
+    p_requested = proba.to_numpy()[np.arange(len(proba)), proba.columns.get_indexer(requested)]
+    p_other = proba.where(proba.columns.to_numpy()[None, :] != requested.to_numpy()[:, None]).max(axis=1)
+    verdict = np.where(p_requested >= confident, "agree", np.where(p_other >= confident, "disagree", "ambiguous"))
+    return pd.DataFrame({
+        "requested": requested,
+        "local_estimate": proba.idxmax(axis=1),
+        "p_requested": p_requested,
+        "local_verdict": verdict,
+    })
+
+
+def judge_schema(factor_levels):
+    """JSON schema of one judge response: a list of {paragraph_id, <factor>: <level>, ...}."""
+    item = {
+        "type": "object",
+        "properties": {"paragraph_id": {"type": "integer"},
+                       **{f: {"type": "string", "enum": levels} for f, levels in factor_levels.items()}},
+        "required": ["paragraph_id", *factor_levels],
+        "additionalProperties": False,
+    }
+    return {
+        "type": "object",
+        "properties": {"judgements": {"type": "array", "items": item}},
+        "required": ["judgements"],
+        "additionalProperties": False,
+    }
+
+
+def judge_batch(client, model, instructions, texts, factor_levels, reasoning_effort="low"):
+    """Ask the judge for the levels of factor_levels for several paragraphs at once (texts: paragraph_id -> text).
+
+    Returns {paragraph_id: {factor: level}}; paragraphs missing from the response are left out."""
+    payload = json.dumps({"paragraphs": [{"paragraph_id": int(pid), "text": text} for pid, text in texts.items()]},
+                         ensure_ascii=False)
+    for attempt in range(MAX_RETRIES):
+        try:
+            resp = client.responses.create(
+                model=model,
+                instructions=instructions,
+                input=payload,
+                reasoning={"effort": reasoning_effort},
+                text={"format": {"type": "json_schema", "name": "label_audit",
+                                 "schema": judge_schema(factor_levels), "strict": True}},
+            )
+            assert resp.incomplete_details is None
+            obj = json.loads(resp.output_text)
+            return {j["paragraph_id"]: {f: j[f] for f in factor_levels} for j in obj["judgements"]
+                    if j["paragraph_id"] in texts}
+        except Exception as e:
+            print(f"[warn] Judge request failed (try {attempt+1}): {e}")
+            time.sleep(BACKOFF_SEC[min(attempt, len(BACKOFF_SEC)-1)])
+    return {}
+
+
+def audit_labels(df, factors, features, text_col="text", use_words=True, confident=0.7, min_accuracy=0.8,
+                 max_calibration_error=0.1, judge=None, judge_batch_size=10, random_state=0):
+    """Estimate every factor of every paragraph and compare with the requested labels.
+
+    df holds the texts and requested labels (one row per paragraph; paragraph_id = row position), features the
+    matching text_features rows. A factor's local agreements are final only if its out-of-fold accuracy is at least
+    min_accuracy and its calibration error at most max_calibration_error; every other item (local disagreements,
+    ambiguous items, all items of an unchecked factor) goes to the judge. judge, if given, is called as
+    judge(texts, factor_levels) with a dict of at most judge_batch_size paragraph_id -> text and returns
+    {paragraph_id: {factor: level}} (see judge_batch); without a judge, these items stay unresolved.
+
+    Returns (report, items): per factor the local model's accuracy and calibration error, whether its verdicts were
+    used, the counts (accepted_locally items never reach the judge), agreement rate over the resolved items and flagged paragraph IDs (resolved items that disagree),
+    and one row per (paragraph, factor) with the requested label, local and final estimates and where the final
+    estimate came from ("local", "judge" or "unresolved")."""
+    df = df.reset_index(drop=True)
+    X = audit_design_matrix(features.reset_index(drop=True), df[text_col] if use_words else None)
+    n_dense = features.shape[1]
+
+    items, checks = [], []
+    for factor in factors:
+        proba = local_label_probabilities(X, df[factor], n_dense=n_dense, random_state=random_state)
+        if proba is None:
+            print(f"[info] '{factor}' has a level with a single paragraph; no local model, every item is judged.")
+            verdict = pd.DataFrame({"requested": df[factor], "local_estimate": np.nan, "p_requested": np.nan,
+                                    "local_verdict": "no_model"})
+            accuracy, ece = np.nan, np.nan
+        else:
+            verdict = triage(proba, df[factor], confident=confident)
+            accuracy = (verdict["local_estimate"] == verdict["requested"]).mean()
+            ece = calibration_error(proba, df[factor])
+        trusted = accuracy >= min_accuracy and ece <= max_calibration_error
+        checks.append({"factor": factor, "local_accuracy": accuracy, "calibration_error": ece,
+                       "local_trusted": trusted})
+        verdict["local_final"] = trusted & (verdict["local_verdict"] == "agree")
+        verdict.insert(0, "factor", factor)
+        verdict.insert(0, "paragraph_id", df.index)
+        items.append(verdict)
+    items = pd.concat(items, ignore_index=True)
+    checks = pd.DataFrame(checks)
+
+    local = items.pop("local_final").to_numpy(dtype=bool)
+    items["final_estimate"] = items["local_estimate"].where(local)
+    items["source"] = np.where(local, "local", "unresolved")
+
+    to_judge = items[~local]
+    if judge is not None and len(to_judge):
+        factor_levels = {f: sorted(df[f].dropna().unique().tolist()) for f in to_judge["factor"].unique()}
+        ids = to_judge["paragraph_id"].unique()
+        judgements = {}
+        for start in range(0, len(ids), judge_batch_size):
+            batch = ids[start:start + judge_batch_size]
+            judgements.update(judge({int(pid): df.at[pid, text_col] for pid in batch}, factor_levels))
+
+        for row in to_judge.itertuples():
+            label = judgements.get(row.paragraph_id, {}).get(row.factor)
+            if label is not None:
+                items.at[row.Index, "final_estimate"] = label
+                items.at[row.Index, "source"] = "judge"
+
+    items["agrees"] = (items["final_estimate"] == items["requested"]).where(items["source"] != "unresolved")
+    report = items.groupby("factor", sort=False).agg(
+        n=("agrees", "size"),
+        local_agree=("local_verdict", lambda v: (v == "agree").sum()),
+        local_disagree=("local_verdict", lambda v: (v == "disagree").sum()),
+        ambiguous=("local_verdict", lambda v: (v == "ambiguous").sum()),
+        accepted_locally=("source", lambda s: (s == "local").sum()),
+        sent_to_judge=("source", lambda s: (s != "local").sum()),
+        judged=("source", lambda s: (s == "judge").sum()),
+        unresolved=("source", lambda s: (s == "unresolved").sum()),
+        agreement=("agrees", "mean"),
+    ).reset_index()
+    report = checks.merge(report, on="factor")
+    report["flagged_ids"] = [
+        items.loc[(items["factor"] == f) & items["agrees"].eq(False), "paragraph_id"].tolist() for f in report["factor"]
+    ]
+    return report, items
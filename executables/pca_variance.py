@@ -0,0 +1,76 @@
+"""Cumulative explained-variance diagnostic for (possibly very large) embedding matrices.
+
+Instead of a full PCA, the leading principal components are estimated with randomised subspace iteration on the
+covariance matrix, streaming over chunks of rows (so a np.memmap larger than RAM works). The rank is doubled until the
+target cumulative variance is reached. The total variance comes from the Frobenius norm of the centred data, so the
+variance in the components that were never computed (the tail) is known exactly."""
+
+import numpy as np
+
+
+def _chunks(X, chunk_size):
+    for start in range(0, X.shape[0], chunk_size):
+        yield np.array(X[start:start + chunk_size], dtype=float)
+
+
+def _centred_gram_times(X, mean, Q, chunk_size):
+    """Return (X - mean).T @ (X - mean) @ Q, one chunk of rows at a time."""
+    out = np.zeros_like(Q)
+    for chunk in _chunks(X, chunk_size):
+        chunk -= mean
+        out += chunk.T @ (chunk @ Q)
+    return out
+
+
+def variance_profile(X, target=0.8, initial_rank=16, oversample=10, n_power_iter=2, chunk_size=4096,
+                     random_state=0):
+    """Estimate the explained-variance ratios of the leading principal components of X.
+
+    The rank starts at initial_rank and doubles until the first `rank` components explain at least `target` of the
+    total variance (or the rank of the data is reached). Memory use is O(chunk_size * d + d * rank).
+
+    Returns a dict with explained_variance_ratio and cum_explained (one entry per estimated component),
+    n_components_for_target, tail_variance_ratio (variance not captured by the estimated components) and
+    total_variance."""
+    n_samples, n_features = X.shape
+    max_rank = min(n_samples - 1, n_features)
+    rng = np.random.default_rng(random_state)
+
+    # Pass 1: mean and total variance (squared Frobenius norm of the centred data)
+    col_sum = np.zeros(n_features)
+    sum_sq = 0.0
+    for chunk in _chunks(X, chunk_size):
+        col_sum += chunk.sum(axis=0)
+        sum_sq += np.einsum("ij,ij->", chunk, chunk)
+    mean = col_sum / n_samples
+    total_ss = sum_sq - n_samples * (mean @ mean)
+
+    rank = min(initial_rank, max_rank)
+    Q = None
+    while True:
+        block = min(rank + oversample, max_rank)
+        omega = rng.standard_normal((n_features, block))
+        if Q is not None:
+            # Reuse the subspace found at the previous rank as a warm start
+            omega[:, :Q.shape[1]] = Q
+        Q, _ = np.linalg.qr(omega)
+        for _ in range(n_power_iter):
+            Q, _ = np.linalg.qr(_centred_gram_times(X, mean, Q, chunk_size))
+
+        # Rayleigh-Ritz: eigenvalues of Q.T C Q approximate the leading eigenvalues of C = Xc.T Xc
+        eigvals = np.linalg.eigvalsh(Q.T @ _centred_gram_times(X, mean, Q, chunk_size))[::-1]
+        explained = np.clip(eigvals[:rank], 0, None) / total_ss
+        cum_explained = np.cumsum(explained)
+
+        if cum_explained[-1] >= target or rank >= max_rank:
+            break
+        rank = min(2 * rank, max_rank)
+
+    reached = cum_explained[-1] >= target
+    return {
+        "explained_variance_ratio": explained,
+        "cum_explained": cum_explained,
+        "n_components_for_target": int(np.searchsorted(cum_explained, target) + 1) if reached else None,
+        "tail_variance_ratio": max(0.0, 1.0 - cum_explained[-1]),
+        "total_variance": total_ss / (n_samples - 1),
+    }
@@ -0,0 +1,114 @@
+"""Scatter panels of 2-D projections coloured by a category, drawn either interactively or in headless batch mode.
+
+A panel is described by a plain dict (see scatter_panel), so the same description can be shown with plt.show() or
+sent to a worker process. Batch mode never touches pyplot: every panel is drawn on a matplotlib Figure with the Agg
+canvas in a joblib worker and written straight to PNG/SVG, and all panels are then combined into one composite grid.
+This works on machines without a display and does not block on interactive windows."""
+
+import os
+
+import numpy as np
+from joblib import Parallel, delayed
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+FIGURE_DIR = "../database_storage/figures"
+
+
+def scatter_panel(coords, codes, labels, colors, title, legend_title, name, axis_label="t-SNE"):
+    """Description of one panel: coords (n, 2), integer category codes (-1 = unknown) with their labels and colours,
+    and the file name stem used in batch mode."""
+    return {
+        "coords": np.asarray(coords),
+        "codes": np.asarray(codes),
+        "labels": list(labels),
+        "colors": list(colors),
+        "title": title,
+        "legend_title": legend_title,
+        "name": name,
+        "axis_label": axis_label,
+    }
+
+
+def draw_scatter(ax, panel, fontsize=10):
+    """Draw a panel on a matplotlib Axes."""
+    codes = panel["codes"]
+    colors = panel["colors"]
+    point_colors = np.array(colors + ["lightgray"], dtype=object)[np.where(codes < 0, len(colors), codes)]
+    ax.scatter(panel["coords"][:, 0], panel["coords"][:, 1], c=list(point_colors), alpha=0.85)
+    ax.set_title(panel["title"], fontsize=fontsize)
+    ax.set_xlabel(f"{panel['axis_label']} 1")
+    ax.set_ylabel(f"{panel['axis_label']} 2")
+
+    legend_elements = [
+        Line2D([0], [0], marker="o", linestyle="", markerfacecolor=color, markeredgecolor="none", label=label)
+        for label, color in zip(panel["labels"], colors)
+    ]
+    if (codes < 0).any():
+        legend_elements.append(Line2D([0], [0], marker="o", linestyle="", markerfacecolor="lightgray",
+                                      markeredgecolor="none", label="unknown"))
+    ax.legend(handles=legend_elements, title=panel["legend_title"], loc="best", fontsize=8, title_fontsize=9)
+
+
+def _render_panel(panel, out_dir, formats, figsize, dpi):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    draw_scatter(fig.add_subplot(), panel)
+    fig.tight_layout()
+    paths = []
+    for fmt in formats:
+        path = os.path.join(out_dir, f"{panel['name']}.{fmt}")
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+def render_grid(panels, path_stem, n_cols=None, formats=("png", "svg"), panel_size=(4, 3), dpi=150):
+    """Draw all panels into one composite figure (row-major, n_cols per row) and save it in every format."""
+    n_cols = n_cols or int(np.ceil(np.sqrt(len(panels))))
+    n_rows = int(np.ceil(len(panels) / n_cols))
+    fig = Figure(figsize=(panel_size[0] * n_cols, panel_size[1] * n_rows))
+    FigureCanvasAgg(fig)
+    for k, panel in enumerate(panels):
+        draw_scatter(fig.add_subplot(n_rows, n_cols, k + 1), panel, fontsize=7)
+    fig.tight_layout()
+    paths = []
+    for fmt in formats:
+        fig.savefig(f"{path_stem}.{fmt}", dpi=dpi)
+        paths.append(f"{path_stem}.{fmt}")
+    return paths
+
+
+def render_panels(panels, out_dir, formats=("png", "svg"), grid_name="composite", n_cols=None, figsize=(8, 6),
+                  dpi=150, n_jobs=-1):
+    """Render every panel to out_dir/<name>.<fmt> in parallel worker processes, plus a composite grid of all panels
+    (skipped if grid_name is None). Returns the list of written files."""
+    os.makedirs(out_dir, exist_ok=True)
+    written = Parallel(n_jobs=n_jobs)(
+        delayed(_render_panel)(panel, out_dir, formats, figsize, dpi) for panel in panels
+    )
+    paths = [path for panel_paths in written for path in panel_paths]
+    if grid_name is not None and panels:
+        paths += render_grid(panels, os.path.join(out_dir, grid_name), n_cols=n_cols, formats=formats, dpi=dpi)
+    return paths
+
+
+def show_or_save(fig, name, batch_render, out_dir, formats=("png", "svg"), dpi=150):
+    """Show a pyplot figure interactively, or in batch mode write it to out_dir/<name>.<fmt> and close it.
+
+    Without a display matplotlib falls back to the non-interactive Agg backend, so batch mode also runs headless."""
+    import matplotlib.pyplot as plt
+
+    if not batch_render:
+        plt.show()
+        return []
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for fmt in formats:
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    plt.close(fig)
+    print(f"Saved {', '.join(paths)}")
+    return paths
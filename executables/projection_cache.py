@@ -0,0 +1,150 @@
+"""On-disk cache of 2-D projections (e.g. t-SNE coordinates) of embedding matrices.
+
+A projection is identified by the content hash of the embedding matrix it was computed from and its parameters (PCA
+dimensions, perplexity, init, seed, ...), and is stored as a small .npy file in PROJECTION_DIR. Plotting scripts can
+therefore colour the same projection by any number of categories, and re-running a script with unchanged data and
+parameters loads the coordinates instead of refitting.
+
+project() computes the coordinates with one of several backends (PROJECTION_BACKENDS), all going through the same
+cache:
+
+- "tsne": sklearn's Barnes-Hut t-SNE;
+- "fft_tsne": FFT-accelerated interpolation t-SNE (FIt-SNE, via openTSNE), which scales to tens of thousands of points;
+- "umap": UMAP (umap-learn);
+- "pca": the first two principal components.
+
+openTSNE and umap-learn are optional: they are only imported when their backend has to fit a projection, so cached
+coordinates load without them and the other backends work if they are not installed."""
+
+import hashlib
+import importlib
+import importlib.util
+import os
+
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+
+from results_store import result_key
+
+PROJECTION_DIR = "../database_storage/projections"
+
+
+def array_hash(X):
+    """sha256 of an array's shape, dtype and contents."""
+    X = np.ascontiguousarray(X)
+    h = hashlib.sha256(f"{X.shape}:{X.dtype}".encode())
+    h.update(X.view(np.uint8))
+    return h.hexdigest()
+
+
+def cached_projection(data_hash, params, compute, cache_dir=PROJECTION_DIR, refresh=False):
+    """Return the stored coordinates for (data_hash, params), or call compute(), store its result and return it."""
+    path = os.path.join(cache_dir, f"{result_key(data_hash, 'projection', params)}.npy")
+    if os.path.exists(path) and not refresh:
+        return np.load(path)
+
+    coords = np.asarray(compute())
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, coords)
+    os.replace(tmp_path, path)
+    return coords
+
+
+def pca_reduce(X, pca_dims, random_state=0):
+    """Randomised PCA of X to at most pca_dims components (no more than n_samples - 1). Returns (X_pca, pca)."""
+    n_components = min(pca_dims, X.shape[0] - 1, X.shape[1])
+    pca = PCA(n_components=n_components, svd_solver="randomized", random_state=random_state)
+    return pca.fit_transform(np.asarray(X, dtype=float)), pca
+
+
+def _optional_import(module, package):
+    try:
+        return importlib.import_module(module)
+    except ImportError as err:
+        raise ImportError(f"This projection backend needs the optional package '{package}' (pip install {package}); "
+                          f"available backends: {available_backends()}") from err
+
+
+def _fit_sklearn_tsne(Z, seed, n_jobs, perplexity, init, learning_rate):
+    tsne = TSNE(n_components=2, perplexity=perplexity, init=init, learning_rate=learning_rate, random_state=seed)
+    return tsne.fit_transform(Z)
+
+
+def _fit_fft_tsne(Z, seed, n_jobs, perplexity, init, learning_rate):
+    openTSNE = _optional_import("openTSNE", "openTSNE")
+    tsne = openTSNE.TSNE(n_components=2, perplexity=perplexity, initialization=init, learning_rate=learning_rate,
+                         negative_gradient_method="fft", random_state=seed, n_jobs=n_jobs)
+    return np.asarray(tsne.fit(Z))
+
+
+def _fit_umap(Z, seed, n_jobs, n_neighbors, min_dist, metric):
+    umap = _optional_import("umap", "umap-learn")
+    # a fixed random_state makes UMAP reproducible but single-threaded, so n_jobs only applies with seed=None
+    reducer = umap.UMAP(n_components=2, n_neighbors=n_neighbors, min_dist=min_dist, metric=metric, random_state=seed,
+                        n_jobs=n_jobs if seed is None else 1)
+    return reducer.fit_transform(Z)
+
+
+def _fit_pca(Z, seed, n_jobs):
+    return PCA(n_components=2, random_state=seed).fit_transform(Z)
+
+
+# name -> (fit function, default parameters, optional module it needs, axis label for plots)
+PROJECTION_BACKENDS = {
+    "tsne": (_fit_sklearn_tsne, {"perplexity": 30, "init": "pca", "learning_rate": "auto"}, None, "t-SNE"),
+    "fft_tsne": (_fit_fft_tsne, {"perplexity": 30, "init": "pca", "learning_rate": "auto"}, "openTSNE", "t-SNE"),
+    "umap": (_fit_umap, {"n_neighbors": 15, "min_dist": 0.1, "metric": "euclidean"}, "umap", "UMAP"),
+    "pca": (_fit_pca, {}, None, "PC"),
+}
+
+
+def available_backends():
+    """Names of the projection backends whose dependencies are installed."""
+    return [name for name, (_, _, module, _) in PROJECTION_BACKENDS.items()
+            if module is None or importlib.util.find_spec(module) is not None]
+
+
+def backend_axis_label(backend):
+    """Axis label prefix for plots of a backend's coordinates ("t-SNE", "UMAP", "PC")."""
+    return PROJECTION_BACKENDS[backend][3]
+
+
+def project(X, backend="tsne", pca_dims=None, seed=0, data_hash=None, X_pca=None, cache_dir=PROJECTION_DIR,
+            refresh=False, n_jobs=1, **params):
+    """2-D coordinates of X from a projection backend (see PROJECTION_BACKENDS), optionally after a PCA to pca_dims
+    components, cached on disk.
+
+    params override the backend's defaults (e.g. perplexity for the t-SNE backends, n_neighbors for UMAP) and, with
+    the backend name, pca_dims and seed, make up the cache key; n_jobs only sets the number of threads of a fit.
+    data_hash defaults to array_hash(X). X_pca may hold the PCA of X already computed by the caller (pca_reduce with
+    the same pca_dims), so that it is not recomputed on a cache miss."""
+    if backend not in PROJECTION_BACKENDS:
+        raise ValueError(f"Unknown projection backend '{backend}'; expected one of {list(PROJECTION_BACKENDS)}")
+    fit, defaults, _, _ = PROJECTION_BACKENDS[backend]
+    unknown = set(params) - set(defaults)
+    if unknown:
+        raise ValueError(f"Unknown parameters for backend '{backend}': {sorted(unknown)}; "
+                         f"expected a subset of {sorted(defaults)}")
+    params = {**defaults, **params}
+
+    data_hash = data_hash or array_hash(X)
+    key_params = {"method": backend, "pca_dims": pca_dims, "seed": seed, **params}
+
+    def compute():
+        Z = X
+        if pca_dims is not None:
+            Z = X_pca if X_pca is not None else pca_reduce(X, pca_dims)[0]
+        return fit(np.asarray(Z, dtype=float), seed, n_jobs, **params)
+
+    return cached_projection(data_hash, key_params, compute, cache_dir=cache_dir, refresh=refresh)
+
+
+def tsne_projection(X, pca_dims=None, perplexity=30, init="pca", seed=0, learning_rate="auto", data_hash=None,
+                    X_pca=None, cache_dir=PROJECTION_DIR, refresh=False):
+    """2-D sklearn t-SNE coordinates of X, optionally after a PCA to pca_dims components, cached on disk (project()
+    with the "tsne" backend)."""
+    return project(X, backend="tsne", pca_dims=pca_dims, seed=seed, data_hash=data_hash, X_pca=X_pca,
+                   cache_dir=cache_dir, refresh=refresh, perplexity=perplexity, init=init,
+                   learning_rate=learning_rate)
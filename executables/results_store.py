@@ -0,0 +1,175 @@
+"""On-disk store of analysis results, so re-running a cell with unchanged inputs returns instantly.
+
+A result is keyed by a hash of (dataset content hash, stage name, parameters, code version). Results are pickled (so
+they can hold DataFrames, confusion matrices and fitted sklearn models) into STORE_DIR, and every stored result gets a
+line in index.jsonl so that results from different databases can be listed and compared without rerunning anything.
+
+The code version (code_version) hashes the source of the stage's compute function and the source files of the
+functions and classes it calls from other modules, so editing the analysis code invalidates the results it made,
+without renaming the stage. An explicit version string can be given instead, e.g. to keep results across edits that
+do not change the output."""
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import time
+
+import pandas as pd
+
+STORE_DIR = "../database_storage/results_store"
+
+
+def file_hash(path):
+    """sha256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def dataframe_hash(df):
+    """sha256 of a DataFrame's values, index and column names."""
+    h = hashlib.sha256(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    h.update(json.dumps(list(map(str, df.columns))).encode())
+    return h.hexdigest()
+
+
+def _to_json(obj):
+    # numpy scalars/arrays -> plain Python, anything else -> str
+    return obj.tolist() if hasattr(obj, "tolist") else str(obj)
+
+
+def _source(obj):
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):  # defined interactively: fall back to the bytecode
+        return obj.__code__.co_code.hex()
+
+
+def _referenced_names(code):
+    # Global names used by a code object and by the functions/lambdas nested in it
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _referenced_names(const)
+    return names
+
+
+def code_version(compute):
+    """sha256 of the code behind compute: its own source, the source of the functions and classes of its own module
+    that it calls, and the source files of those it calls from other modules (resolved through its globals and
+    closure)."""
+    h = hashlib.sha256()
+    code = getattr(compute, "__code__", None)
+    if code is None:  # e.g. a functools.partial
+        h.update(repr(compute).encode())
+        return h.hexdigest()
+    h.update(_source(compute).encode())
+
+    scope = dict(compute.__globals__)
+    if compute.__closure__:
+        scope.update(zip(code.co_freevars, (cell.cell_contents for cell in compute.__closure__)))
+    module_files = set()
+    for name in sorted(_referenced_names(code) | set(code.co_freevars)):
+        obj = scope.get(name)
+        if not (inspect.isfunction(obj) or inspect.isclass(obj)):
+            continue
+        module = inspect.getmodule(obj)
+        if module is None or module.__name__ == compute.__module__:
+            h.update(_source(obj).encode())
+        elif getattr(module, "__file__", None):
+            module_files.add(module.__file__)
+    for path in sorted(module_files):
+        h.update(file_hash(path).encode())
+    return h.hexdigest()
+
+
+def result_key(data_hash, stage, params, version=None):
+    payload = json.dumps({"data": data_hash, "stage": stage, "params": params, "version": version}, sort_keys=True,
+                         default=_to_json)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cached_result(stage, data_hash, params, compute, database=None, refresh=False, store_dir=STORE_DIR,
+                  version=None):
+    """Return the stored result for (data_hash, stage, params, version), or call compute(), store its result and
+    return it.
+
+    database is a free-form label (e.g. "database_19") recorded in the index to make later queries readable.
+    version defaults to code_version(compute), so a stored result is not returned once the code behind compute has
+    changed. refresh=True recomputes and overwrites the stored result."""
+    if version is None:
+        version = code_version(compute)
+    key = result_key(data_hash, stage, params, version)
+    path = os.path.join(store_dir, f"{key}.pkl")
+    if os.path.exists(path) and not refresh:
+        print(f"[results_store] Loaded '{stage}' for {database or data_hash[:12]} from the store.")
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    result = compute()
+
+    os.makedirs(store_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(result, f)
+    os.replace(tmp_path, path)
+
+    entry = {
+        "key": key,
+        "stage": stage,
+        "database": database,
+        "data_hash": data_hash,
+        "params": json.loads(json.dumps(params, default=_to_json)),
+        "version": version,
+        "created_unix": time.time(),
+    }
+    with open(os.path.join(store_dir, "index.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+    return result
+
+
+def load_result(key, store_dir=STORE_DIR):
+    with open(os.path.join(store_dir, f"{key}.pkl"), "rb") as f:
+        return pickle.load(f)
+
+
+def query_results(stage=None, database=None, store_dir=STORE_DIR, **params):
+    """List stored results as a DataFrame (one row per result, parameters flattened into params.* columns).
+
+    Filter by stage, database label and any parameter values, e.g. query_results("decoding", n_pca_components=28).
+    A parameter that none of the selected results has raises a ValueError listing the known ones."""
+    index_path = os.path.join(store_dir, "index.jsonl")
+    if not os.path.exists(index_path):
+        return pd.DataFrame()
+    with open(index_path, "r", encoding="utf-8") as f:
+        entries = pd.json_normalize([json.loads(line) for line in f if line.strip()])
+    entries = entries.drop_duplicates("key", keep="last")
+    if stage is not None:
+        entries = entries[entries["stage"] == stage]
+    if database is not None:
+        entries = entries[entries["database"] == database]
+    if entries.empty:
+        return entries.reset_index(drop=True)
+    known = sorted(c[len("params."):] for c in entries.columns if c.startswith("params.") and entries[c].notna().any())
+    unknown = sorted(name for name in params if name not in known)
+    if unknown:
+        raise ValueError(f"Unknown parameter(s) {unknown} for stage {stage!r}; known parameters: {known}")
+    for name, value in params.items():
+        entries = entries[entries[f"params.{name}"] == value]
+    return entries.reset_index(drop=True)
+
+
+def compare_reports(stage, report_name="report", store_dir=STORE_DIR, **params):
+    """Concatenate the report DataFrames (result[report_name]) of every matching stored result, e.g. to compare
+    decoding accuracy across databases."""
+    entries = query_results(stage, store_dir=store_dir, **params)
+    reports = []
+    for _, entry in entries.iterrows():
+        report = load_result(entry["key"], store_dir)[report_name].copy()
+        report.insert(0, "database", entry["database"])
+        reports.append(report)
+    return pd.concat(reports, ignore_index=True) if reports else pd.DataFrame()
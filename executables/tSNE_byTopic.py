@@ -1,32 +1,50 @@
-# Goal: visualize embeddings with t-SNE and color points by a chosen category,
-#       one topic_hint at a time.
+# Goal: visualize embeddings with t-SNE (or another 2-D projection backend) and color points by each chosen category,
+#       one topic_hint at a time. The projection of each topic is computed once (and cached on disk, see
+#       projection_cache.py) and rendered for every category.
 
-#%% Choose which category to color points by
+#%% Choose which categories to color points by
 # Logical options:
 #   "genre", "difficulty", "coherence_predictability",
 #   "emotional_valence", "concreteness", "tone"
-color_by = "tone"  # <-- change this to recolor
+list_categories = ["genre", "difficulty", "coherence_predictability", "emotional_valence", "concreteness", "tone"]
 
 #%% Imports and data loading
 import pandas as pd
-from sklearn.manifold import TSNE
-from sklearn.decomposition import PCA
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib
-from matplotlib.lines import Line2D
-from ast import literal_eval
+
+from decoding_tools import embedding_csv_path, ensure_embedding_memmap, load_embedding_memmap
+from plot_rendering import FIGURE_DIR, draw_scatter, render_panels, scatter_panel
+from projection_cache import array_hash, backend_axis_label, pca_reduce, project
+from topic_analysis import category_codes, group_indices
+from tsne_sweep import summarise_sweep, tsne_sweep
 
 database_number = 13
 database_name = "gpt5_1-full"
 embedding_size = "large"
 
-database = pd.read_csv(
-    f"../database_storage/database_{database_number:02d}-{database_name}__embeddings-{embedding_size}.csv"
-)
+# Headless batch mode: render all figures to PNG/SVG files in worker processes instead of showing windows
+batch_render = False
+figure_formats = ("png", "svg")
+figure_dir = f"{FIGURE_DIR}/database_{database_number:02d}"
+
+# Projection backend: "tsne" (sklearn), "fft_tsne" (FFT-accelerated t-SNE, needs openTSNE), "umap" (needs
+# umap-learn) or "pca". For tens of thousands of paragraphs use "fft_tsne" or "umap".
+projection_backend = "tsne"
+
+# Stability check: t-SNE for every perplexity x seed (random init) in parallel, scored by trustworthiness and kNN
+# overlap with the original embedding space, plus the kNN agreement between seeds (see tsne_sweep.py)
+run_sweep = False
+sweep_perplexities = [5, 10, 15, 30, 50]
+sweep_seeds = list(range(5))
+sweep_k = 5
+n_jobs = -1
 
-# Embeddings column assumed to be a stringified list (e.g. "[0.1, 0.2, ...]")
-embedding_matrix = np.array(database.embedding.apply(literal_eval).to_list())
+csv_path = embedding_csv_path(database_number, database_name, embedding_size)
+database = pd.read_csv(csv_path)
+
+# Embeddings column is a stringified list (e.g. "[0.1, 0.2, ...]"); it is parsed once and memory-mapped afterwards
+embedding_matrix = load_embedding_memmap(ensure_embedding_memmap(csv_path))
 
 #%% Map logical category names to actual DataFrame column names
 
@@ -40,8 +58,6 @@ column_map = {
     "topic_hint": "topic_hint",
 }
 
-color_column = column_map[color_by]
-
 #%% Define category enums and color palettes
 
 category_values = {
@@ -74,102 +90,119 @@ category_colors = {
     "tone": ["tab:blue", "tab:orange", "tab:green"]
 }
 
-labels = category_values[color_by]
-colors_for_category = category_colors[color_by]
-
 #%% Get list of topics to loop over
 topics = ["life_sciences", "physical_sciences", "engineering", "computing"]
 # or: topics = sorted(database["topic_hint"].unique())
 
-#%% Loop over topics and make a t-SNE plot for each
+# Row positions of every topic and the codes of every category, computed once for the whole corpus (no per-topic
+# DataFrame copies); see topicAnalysis_database.py for the full per-topic report
+topic_rows = group_indices(database["topic_hint"])
+color_codes = category_codes(database, column_map, {c: category_values[c] for c in list_categories})
+
+#%% Loop over topics: one projection per topic, one t-SNE plot per (topic, category)
+
+
+def category_panel(coords, rows, topic, color_by, params, seed=None):
+    labels = category_values[color_by]
+    color_indices = color_codes[rows, list_categories.index(color_by)]
+
+    settings = {**params, **({} if seed is None else {"seed": seed})}
+    setting_text = "".join(f", {k}={v}" for k, v in settings.items())
+    setting_tag = "".join(f"_{k}{v}" for k, v in settings.items())
+    return scatter_panel(
+        coords,
+        color_indices,
+        labels,
+        category_colors[color_by],
+        title=f"2-D {projection_backend} (topic={topic}{setting_text})\n"
+              f"Database: {database_name} | Colored by: {color_by}",
+        legend_title=color_by,
+        name=f"{projection_backend}_{topic}{setting_tag}_{color_by}",
+        axis_label=backend_axis_label(projection_backend),
+    )
+
 
+panels = []
+sweep_summaries = []
 for topic in topics:
-    # Subset dataframe and embeddings to this topic
-    mask = database["topic_hint"] == topic
-    df_topic = database.loc[mask].reset_index(drop=True)
-    emb_topic = embedding_matrix[mask]
+    # Subset the embeddings to this topic
+    rows = topic_rows.get(topic, np.array([], dtype=np.int64))
+    emb_topic = np.asarray(embedding_matrix[rows])
+    topic_hash = array_hash(emb_topic)
 
     n_samples = emb_topic.shape[0]
     if n_samples < 10:
         print(f"Skipping topic '{topic}' (too few samples: {n_samples})")
         continue
 
-    # Encode the chosen category within this topic
-    dtype = pd.api.types.CategoricalDtype(categories=labels, ordered=True)
-    df_topic[f"{color_by}_id"] = (
-        df_topic[color_column]
-        .astype(str)
-        .str.strip()
-        .astype(dtype)
-        .cat.codes
-    )
-
-    color_indices = df_topic[f"{color_by}_id"]
+    # ----- PCA -> 2-D projection for this topic -----
+    # PCA to denoise / compress first (up to 50 PCs, but no more than n_samples-1). The randomized solver only
+    # computes the requested components; the explained-variance ratios are still relative to the total variance.
+    pca_dims = 50
+    emb_pca, pca = pca_reduce(emb_topic, pca_dims)
+    print(f"[{topic}] {pca.n_components_} PCs explain {pca.explained_variance_ratio_.sum():.3f} of the variance "
+          f"(tail: {1 - pca.explained_variance_ratio_.sum():.3f})")
 
-    # ----- PCA -> t-SNE for this topic -----
-    # PCA to denoise / compress first (up to 50 PCs, but no more than n_samples-1)
-    pca_components = min(50, n_samples - 1)
-    pca = PCA(n_components=pca_components, random_state=0)
-    emb_pca = pca.fit_transform(emb_topic)
-
-    # t-SNE hyperparams
+    # Projection hyperparams
     final_dims = 2
     # perplexity must be < n_samples; use min(30, n_samples//3) as a safe heuristic
     perplex = min(30, max(5, n_samples // 3))
-    tsne = TSNE(
-        n_components=final_dims,
-        perplexity=perplex,
-        init="pca",
-        learning_rate="auto",
-        random_state=17,
-    )
-
-    emb_tsne = tsne.fit_transform(emb_pca)
-    print(f"[{topic}] t-SNE shape: {emb_tsne.shape}, n={n_samples}, perplexity={perplex}")
-
-    # ----- Plot -----
-    x_data = emb_tsne[:, 0]
-    y_data = emb_tsne[:, 1]
-
-    colormap = matplotlib.colors.ListedColormap(colors_for_category)
-
-    plt.figure(figsize=(8, 6))
-    plt.scatter(x_data, y_data, c=color_indices, cmap=colormap, alpha=0.85)
-
-    plt.title(
-        f"{final_dims}-D t-SNE (topic={topic}, perplexity={perplex})\n"
-        f"Database: {database_name} | Colored by: {color_by}",
-        fontsize=10,
+    backend_params = {
+        "tsne": {"perplexity": perplex, "init": "pca", "learning_rate": "auto"},
+        "fft_tsne": {"perplexity": perplex, "init": "pca", "learning_rate": "auto"},
+        "umap": {"n_neighbors": min(15, n_samples - 1), "min_dist": 0.1},
+        "pca": {},
+    }
+    projection_params = backend_params[projection_backend]
+    emb_2d = project(
+        emb_topic,
+        backend=projection_backend,
+        pca_dims=pca_dims,
+        seed=17,
+        data_hash=topic_hash,
+        X_pca=emb_pca,
+        n_jobs=n_jobs,
+        **projection_params,
     )
-    plt.xlabel("t-SNE 1")
-    plt.ylabel("t-SNE 2")
-
-    # Legend
-    legend_elements = []
-    for idx, label in enumerate(labels):
-        legend_elements.append(
-            Line2D(
-                [0], [0],
-                marker="o",
-                linestyle="",
-                markerfacecolor=colors_for_category[idx],
-                markeredgecolor="none",
-                label=label,
-            )
+    print(f"[{topic}] {projection_backend} shape: {emb_2d.shape}, n={n_samples}, {projection_params}")
+
+    for color_by in list_categories:
+        panel = category_panel(emb_2d, rows, topic, color_by, projection_params)
+
+        if batch_render:
+            panels.append(panel)
+        else:
+            fig, ax = plt.subplots(figsize=(8, 6))
+            draw_scatter(ax, panel)
+            plt.tight_layout()
+            plt.show()
+
+    # ----- Perplexity x seed sweep (shares the PCA above; t-SNE backends only) -----
+    if run_sweep and projection_backend in ("tsne", "fft_tsne"):
+        sweep_report, sweep_projections = tsne_sweep(
+            emb_topic, sweep_perplexities, sweep_seeds, pca_dims=pca_dims, k=sweep_k, data_hash=topic_hash,
+            X_pca=emb_pca, backend=projection_backend, n_jobs=n_jobs,
         )
-
-    if (color_indices == -1).any():
-        legend_elements.append(
-            Line2D(
-                [0], [0],
-                marker="o",
-                linestyle="",
-                markerfacecolor="lightgray",
-                markeredgecolor="none",
-                label="unknown",
-            )
-        )
-
-    plt.legend(handles=legend_elements, title=color_by, loc="best", fontsize=8, title_fontsize=9)
-    plt.tight_layout()
-    plt.show()
+        summary = summarise_sweep(sweep_report)
+        summary.insert(0, "topic", topic)
+        sweep_summaries.append(summary)
+        print(f"[{topic}] perplexity sweep ({len(sweep_report)} runs):")
+        print(summary.drop(columns="topic").round(3).to_string(index=False))
+
+        if batch_render:
+            for p in summary["perplexity"]:
+                for color_by in list_categories:
+                    panels.append(category_panel(sweep_projections[(p, sweep_seeds[0])], rows, topic, color_by,
+                                                 {"perplexity": p}, seed=sweep_seeds[0]))
+
+#%% Sweep summary across topics
+if run_sweep and sweep_summaries:
+    sweep_summary = pd.concat(sweep_summaries, ignore_index=True)
+    sweep_summary.to_csv(f"../database_storage/tsne_sweep_database_{database_number:02d}.csv", index=False)
+    print(sweep_summary.round(3).to_string(index=False))
+
+#%% Batch mode: render every (topic, category) panel to files in parallel, plus a composite grid (one row per topic)
+if batch_render:
+    paths = render_panels(panels, figure_dir, formats=figure_formats, grid_name=f"{projection_backend}_by_topic_composite",
+                          n_cols=len(list_categories))
+    print(f"Wrote {len(paths)} files to {figure_dir}")
@@ -0,0 +1,108 @@
+"""Local checks of the formal constraints the generation prompts put on each paragraph (120-150 words, a single
+paragraph, no lists, no em-dashes), plus a readability index as a proxy for difficulty.
+
+text_statistics works on a whole corpus at once (pandas string operations and one sparse word count matrix, see
+text_features) and is cheap enough to run on every API response inside a generation loop. Paragraphs that violate a
+constraint are appended to a regeneration queue (a JSONL file with the database row and its controls) so that only
+those rows are regenerated."""
+
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer
+
+from text_features import TOKEN_PATTERN, split_sentences
+
+EM_DASH = "—"
+LIST_ITEM = r"(?m)^\s*(?:[-*•]|\d+[.)]|[a-zA-Z][.)])\s+"
+PARAGRAPH_BREAK = r"\n\s*\n|\n(?=\s*\S)"
+
+# Flesch-Kincaid grade level bands expected for each difficulty level (None = unbounded)
+GRADE_BANDS = {"low": (None, 12.0), "high": (12.0, None)}
+
+
+def count_syllables(word):
+    """Vowel-group syllable estimate of one lower-case word (silent final e dropped, at least one syllable)."""
+    groups = len(re.findall(r"[aeiouy]+", word))
+    if word.endswith("e") and not word.endswith(("le", "ee", "ye")) and groups > 1:
+        groups -= 1
+    return max(1, groups)
+
+
+def text_statistics(texts):
+    """One row per text: n_words (whitespace-separated), n_sentences, n_paragraphs, n_em_dashes, n_list_items,
+    syllables_per_word, flesch_reading_ease and flesch_kincaid_grade."""
+    texts = pd.Series(texts).fillna("").reset_index(drop=True)
+    stripped = texts.str.strip()
+
+    vectorizer = CountVectorizer(lowercase=True, token_pattern=TOKEN_PATTERN)
+    counts = vectorizer.fit_transform(texts).astype(float)
+    syllables = np.array([count_syllables(w) for w in vectorizer.get_feature_names_out()], dtype=float)
+    n_tokens = np.maximum(np.asarray(counts.sum(axis=1)).ravel(), 1)
+    syllables_per_word = (counts @ syllables) / n_tokens
+
+    n_words = stripped.str.split().str.len().to_numpy()
+    n_sentences = np.maximum(split_sentences(stripped).str.len().to_numpy(), 1)
+    words_per_sentence = n_words / n_sentences
+
+    return pd.DataFrame({
+        "n_words": n_words,
+        "n_sentences": n_sentences,
+        "n_paragraphs": np.where(stripped.str.len() > 0, stripped.str.count(PARAGRAPH_BREAK) + 1, 0),
+        "n_em_dashes": texts.str.count(EM_DASH).to_numpy(),
+        "n_list_items": texts.str.count(LIST_ITEM).to_numpy(),
+        "syllables_per_word": syllables_per_word,
+        "flesch_reading_ease": 206.835 - 1.015 * words_per_sentence - 84.6 * syllables_per_word,
+        "flesch_kincaid_grade": 0.39 * words_per_sentence + 11.8 * syllables_per_word - 15.59,
+    })
+
+
+def constraint_violations(texts, min_words=120, max_words=150, difficulty=None, grade_bands=GRADE_BANDS):
+    """text_statistics plus a "violations" column: a list of the constraints each text breaks (empty if none).
+
+    If difficulty (requested levels, aligned with texts) is given, texts whose Flesch-Kincaid grade falls outside the
+    band of their level in grade_bands are flagged as well."""
+    stats = text_statistics(texts)
+    checks = {
+        "too_short": stats["n_words"] < min_words,
+        "too_long": stats["n_words"] > max_words,
+        "multiple_paragraphs": stats["n_paragraphs"] > 1,
+        "em_dash": stats["n_em_dashes"] > 0,
+        "list": stats["n_list_items"] > 0,
+    }
+    if difficulty is not None:
+        difficulty = pd.Series(difficulty).reset_index(drop=True)
+        grade = stats["flesch_kincaid_grade"]
+        low = difficulty.map(lambda d: grade_bands.get(d, (None, None))[0]).astype(float)
+        high = difficulty.map(lambda d: grade_bands.get(d, (None, None))[1]).astype(float)
+        checks["readability"] = (grade < low) | (grade > high)
+
+    flags = pd.DataFrame(checks)
+    stats["violations"] = [list(flags.columns[row]) for row in flags.to_numpy()]
+    return stats
+
+
+def queue_regeneration(queue_path, row, controls, violations):
+    """Append one paragraph to the regeneration queue (row = position in the database CSV)."""
+    with open(queue_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"row": int(row), "controls": controls, "violations": list(violations)}) + "\n")
+
+
+def queue_violations(queue_path, df, stats, control_cols):
+    """Queue every row of a database whose stats (from constraint_violations) has violations. Returns the count."""
+    bad = [i for i, v in enumerate(stats["violations"]) if v]
+    for i in bad:
+        queue_regeneration(queue_path, i, df.iloc[i][control_cols].to_dict(), stats["violations"].iloc[i])
+    return len(bad)
+
+
+def load_regeneration_queue(queue_path):
+    """Queued rows as {row: entry}, the last entry winning for a row queued more than once."""
+    if not os.path.exists(queue_path):
+        return {}
+    with open(queue_path, "r", encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    return {entry["row"]: entry for entry in entries}
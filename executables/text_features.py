@@ -0,0 +1,94 @@
+"""Cheap, vectorised text features of a whole corpus of paragraphs.
+
+Texts are tokenised once into a sparse document x word count matrix; every word-level property (stop word, length,
+pronoun class, lexicon score, ...) is a vector over the vocabulary, so each feature of every paragraph is one sparse
+matrix product. Sentence-level features use pandas string operations over the whole corpus.
+
+Sentiment and concreteness scores come from optional word lexicons (e.g. the Brysbaert et al. 2014 concreteness norms,
+or the NRC VAD / VADER valence lexicons) loaded with load_lexicon; the corresponding features are skipped when no
+lexicon is given."""
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, CountVectorizer
+
+TOKEN_PATTERN = r"(?u)\b[a-zA-Z][a-zA-Z'-]*\b"
+SENTENCE_END = r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])"
+
+FIRST_PERSON = {"i", "me", "my", "mine", "myself", "we", "us", "our", "ours", "ourselves"}
+THIRD_PERSON = {"he", "him", "his", "himself", "she", "her", "hers", "herself", "they", "them", "their", "theirs",
+                "themselves"}
+HEDGES = {"may", "might", "could", "perhaps", "possibly", "likely", "unlikely", "seems", "seem", "suggests",
+          "suggest", "appears", "appear", "often", "sometimes", "usually", "typically"}
+
+
+def load_lexicon(path, word_col, score_col, sep=None):
+    """Word -> score dict from a delimited lexicon file (lower-cased words, multi-word entries dropped)."""
+    lexicon = pd.read_csv(path, sep=sep, engine="python", usecols=[word_col, score_col]).dropna()
+    words = lexicon[word_col].astype(str).str.lower()
+    keep = ~words.str.contains(" ")
+    return dict(zip(words[keep], lexicon[score_col][keep].astype(float)))
+
+
+def split_sentences(texts):
+    """Series of sentence lists, one per text."""
+    return pd.Series(texts).fillna("").str.strip().str.split(SENTENCE_END, regex=True)
+
+
+def _lexicon_scores(vocab, counts, n_words, lexicon):
+    """Mean lexicon score over the scored tokens of every text, and the fraction of tokens that are scored."""
+    scores = np.array([lexicon.get(word, np.nan) for word in vocab])
+    scored = ~np.isnan(scores)
+    n_scored = counts @ scored.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (counts @ np.where(scored, scores, 0.0)) / n_scored
+    return mean, n_scored / n_words
+
+
+def text_features(texts, sentiment_lexicon=None, concreteness_lexicon=None):
+    """One row of features per text.
+
+    Columns: n_words, n_sentences, mean_sentence_length, sd_sentence_length, mean_word_length, long_word_ratio
+    (words of 7+ letters), type_token_ratio, lexical_density (share of non-stop words), first_person_rate,
+    third_person_rate, hedge_rate, past_tense_rate (-ed words), digit_rate, and, when the lexicons are given,
+    sentiment_score / sentiment_coverage and concreteness_score / concreteness_coverage."""
+    texts = pd.Series(texts).fillna("").reset_index(drop=True)
+
+    vectorizer = CountVectorizer(lowercase=True, token_pattern=TOKEN_PATTERN)
+    counts = vectorizer.fit_transform(texts).astype(float).tocsr()
+    vocab = vectorizer.get_feature_names_out()
+    n_words = np.asarray(counts.sum(axis=1)).ravel()
+    safe_words = np.maximum(n_words, 1)
+
+    def rate(mask):
+        return (counts @ np.asarray(mask, dtype=float)) / safe_words
+
+    word_length = np.array([len(w) for w in vocab], dtype=float)
+    features = {
+        "n_words": n_words,
+        "mean_word_length": (counts @ word_length) / safe_words,
+        "long_word_ratio": rate(word_length >= 7),
+        "type_token_ratio": counts.getnnz(axis=1) / safe_words,
+        "lexical_density": rate([w not in ENGLISH_STOP_WORDS for w in vocab]),
+        "first_person_rate": rate([w in FIRST_PERSON for w in vocab]),
+        "third_person_rate": rate([w in THIRD_PERSON for w in vocab]),
+        "hedge_rate": rate([w in HEDGES for w in vocab]),
+        "past_tense_rate": rate([w.endswith("ed") and len(w) > 4 for w in vocab]),
+        "digit_rate": texts.str.count(r"\d+(?:[.,]\d+)?").to_numpy() / safe_words,
+    }
+
+    sentences = split_sentences(texts).explode()
+    sentence_words = sentences.str.count(TOKEN_PATTERN)
+    sentence_words = sentence_words[sentence_words > 0].groupby(level=0)
+    features["n_sentences"] = sentence_words.size().reindex(texts.index, fill_value=0).to_numpy()
+    features["mean_sentence_length"] = sentence_words.mean().reindex(texts.index).to_numpy()
+    features["sd_sentence_length"] = sentence_words.std(ddof=0).reindex(texts.index).to_numpy()
+
+    if sentiment_lexicon is not None:
+        features["sentiment_score"], features["sentiment_coverage"] = _lexicon_scores(
+            vocab, counts, safe_words, sentiment_lexicon)
+    if concreteness_lexicon is not None:
+        features["concreteness_score"], features["concreteness_coverage"] = _lexicon_scores(
+            vocab, counts, safe_words, concreteness_lexicon)
+
+    return pd.DataFrame(features, index=texts.index)
@@ -0,0 +1,130 @@
+"""Full per-topic report of one database in a single pass: for every topic_hint, the 2-D projection of its paragraphs
+coloured by every category, the cross-validated decoding accuracy of every label and the pairwise associations
+between the style factors within the topic.
+
+The corpus is grouped by topic once (row positions, no DataFrame copies), each topic's PCA and projection are
+computed once and shared by all of its colourings, and the topics are processed in parallel (see topic_analysis.py).
+Tables go to database_storage/topic_reports/, figures to database_storage/figures/ in batch mode."""
+
+import os
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from decoding_tools import embedding_csv_path, ensure_embedding_memmap, load_embedding_memmap
+from plot_rendering import FIGURE_DIR, draw_scatter, render_panels, scatter_panel
+from projection_cache import backend_axis_label
+from topic_analysis import analyse_topics, category_codes
+
+#%% Settings
+database_number = 13
+database_name = "gpt5_1-full"
+embedding_size = "large"
+topic_col = "topic_hint"
+
+# Categories to colour by (logical name -> column), with their fixed levels and colours
+column_map = {
+    "genre": "genre",
+    "difficulty": "difficulty",
+    "coherence_predictability": "coherence_predictability",
+    "emotional_valence": "emotional_valence",
+    "concreteness": "concreteness",
+    "tone": "tone",
+}
+category_values = {
+    "genre": ["narrative", "expository"],
+    "difficulty": ["high", "medium", "low"],
+    "coherence_predictability": [
+        "high_coherence_high_predictability",
+        "low_coherence",
+        "high_coherence_low_predictability"
+    ],
+    "emotional_valence": ["negative", "positive", "neutral"],
+    "concreteness": ["abstract", "mixed", "concrete"],
+    "tone": ["reflective", "technical", "plain"],
+}
+category_colors = {
+    "genre": ["tab:blue", "tab:orange"],
+    "difficulty": ["tab:blue", "tab:orange", "tab:green"],
+    "coherence_predictability": ["tab:blue", "tab:orange", "tab:green"],
+    "emotional_valence": ["tab:blue", "tab:orange", "tab:green"],
+    "concreteness": ["tab:blue", "tab:orange", "tab:green"],
+    "tone": ["tab:blue", "tab:orange", "tab:green"],
+}
+# Labels decoded and factors cross-tabulated within each topic
+label_columns = list(column_map.values())
+factor_cols = list(column_map.values())
+
+# Projection (see projection_cache.py); perplexity / n_neighbors default to a value scaled to the topic size
+projection_backend = "tsne"
+backend_params = {"init": "pca", "learning_rate": "auto"}
+pca_dims = 50
+seed = 17
+min_samples = 10
+n_jobs = -1
+
+# Headless batch mode: render all figures to PNG/SVG files in worker processes instead of showing windows
+batch_render = False
+figure_formats = ("png", "svg")
+figure_dir = f"{FIGURE_DIR}/database_{database_number:02d}"
+report_dir = "../database_storage/topic_reports"
+
+csv_path = embedding_csv_path(database_number, database_name, embedding_size)
+database = pd.read_csv(csv_path)
+embedding_matrix = load_embedding_memmap(ensure_embedding_memmap(csv_path))
+
+#%% One pass over the topics
+groups, results = analyse_topics(
+    database, embedding_matrix, topic_col, label_columns, factor_cols,
+    min_samples=min_samples, n_jobs=n_jobs, pca_dims=pca_dims, backend=projection_backend,
+    backend_params=backend_params, seed=seed,
+)
+colour_codes = category_codes(database, column_map, category_values)
+
+#%% Colourings: every category of every topic from the topic's one projection
+panels = []
+for topic, result in results.items():
+    setting_text = "".join(f", {k}={v}" for k, v in result["params"].items())
+    setting_tag = "".join(f"_{k}{v}" for k, v in result["params"].items())
+    topic_codes = colour_codes[groups[topic]]
+    for j, color_by in enumerate(category_values):
+        panel = scatter_panel(
+            result["coords"],
+            topic_codes[:, j],
+            category_values[color_by],
+            category_colors[color_by],
+            title=f"2-D {projection_backend} (topic={topic}{setting_text})\n"
+                  f"Database: {database_name} | Colored by: {color_by}",
+            legend_title=color_by,
+            name=f"{projection_backend}_{topic}{setting_tag}_{color_by}",
+            axis_label=backend_axis_label(projection_backend),
+        )
+        if batch_render:
+            panels.append(panel)
+        else:
+            fig, ax = plt.subplots(figsize=(8, 6))
+            draw_scatter(ax, panel)
+            plt.tight_layout()
+            plt.show()
+
+if batch_render:
+    paths = render_panels(panels, figure_dir, formats=figure_formats,
+                          grid_name=f"{projection_backend}_topic_report_composite", n_cols=len(category_values))
+    print(f"Wrote {len(paths)} files to {figure_dir}")
+
+#%% Tables
+pca_table = pd.concat([r["pca"] for r in results.values()], ignore_index=True)
+decoding_table = pd.concat([r["decoding"] for r in results.values()], ignore_index=True)
+association_table = pd.concat([r["associations"] for r in results.values()], ignore_index=True)
+
+print("=== PCA per topic ===")
+print(pca_table.round(3).to_string(index=False))
+print("\n=== Ridge decoding accuracy within each topic ===")
+print(decoding_table.pivot(index="label", columns="topic", values="accuracy_mean").round(3).to_string())
+print("\n=== Strongest within-topic associations (Cramér's V) ===")
+print(association_table.sort_values("v", ascending=False).head(10).round(3).to_string(index=False))
+
+os.makedirs(report_dir, exist_ok=True)
+for name, table in (("pca", pca_table), ("decoding", decoding_table), ("associations", association_table)):
+    table.to_csv(f"{report_dir}/{name}_database_{database_number:02d}.csv", index=False)
+print(f"\nSaved the per-topic tables to {report_dir}")
@@ -0,0 +1,110 @@
+"""Per-topic analysis of a database: 2-D projection, decoding and factor associations within each topic_hint.
+
+The corpus is grouped once into arrays of row positions (group_indices); nothing is copied per topic except the
+topic's rows of the embedding matrix. Every per-row input of the analyses (colouring codes, one-hot decoding targets,
+factor codes for the contingency tables) is encoded once for the whole corpus and sliced with the same row positions.
+Within a topic the embedding rows, their PCA and the projection (cached, see projection_cache.py) are computed one
+time and shared by every colouring; the decoding and association summaries run off the same slices. The decoding
+does not reuse the topic PCA: that PCA is fit on all of the topic's rows, test folds included, so the ridge probe
+takes its own SVD of each fold's training rows (not cached, as no other analysis uses these folds). Topics are
+independent joblib tasks: the embedding matrix is a memmap, so workers read their rows from the shared file."""
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from association_engine import association_from_codes, encode_factors
+from decoding_tools import one_hot_labels, ridge_probe_targets
+from projection_cache import PROJECTION_DIR, array_hash, pca_reduce, project
+
+
+def group_indices(values):
+    """{level: row positions} for every level of values (sorted; missing values are left out), from a single
+    factorize and stable argsort."""
+    codes, uniques = pd.factorize(pd.Series(values), sort=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return {level: order[bounds[i]:bounds[i + 1]] for i, level in enumerate(uniques)}
+
+
+def category_codes(df, column_map, category_values):
+    """Codes of every colouring category against its fixed, ordered list of levels (unknown/missing -> -1).
+
+    Returns an (n_rows, n_categories) array with one column per key of category_values, read from
+    df[column_map[name]]."""
+    codes = np.empty((len(df), len(category_values)), dtype=np.int64)
+    for j, (name, levels) in enumerate(category_values.items()):
+        dtype = pd.api.types.CategoricalDtype(categories=levels, ordered=True)
+        codes[:, j] = df[column_map[name]].astype(str).str.strip().astype(dtype).cat.codes
+    return codes
+
+
+def association_table(matrices, cols):
+    """One row per pair of distinct factors (upper triangle) of the matrices returned by association_from_codes."""
+    rows = []
+    for i, a in enumerate(cols):
+        for b in cols[i + 1:]:
+            rows.append({"factor_a": a, "factor_b": b,
+                         **{name: matrices[name].at[a, b] for name in ("v", "v_corr", "p", "dof")}})
+    return pd.DataFrame(rows)
+
+
+def analyse_topic(topic, rows, X, Y, blocks, factor_codes, n_levels, factor_cols, pca_dims=50, backend="tsne",
+                  backend_params=None, seed=17, n_splits=5, cache_dir=PROJECTION_DIR):
+    """Projection, ridge decoding and pairwise associations for one topic.
+
+    rows are the topic's row positions in X; Y and factor_codes are already restricted to those rows. Returns a dict
+    with the topic's coordinates, the projection parameters used and its pca, decoding and association tables (each
+    with a topic column)."""
+    X_topic = np.asarray(X[rows], dtype=float)
+    n_samples = X_topic.shape[0]
+    topic_hash = array_hash(X_topic)
+
+    # Without an explicit perplexity / n_neighbors, scale them to the topic size (they must stay below n_samples)
+    params = dict(backend_params or {})
+    if backend in ("tsne", "fft_tsne"):
+        params.setdefault("perplexity", min(30, max(5, n_samples // 3)))
+    elif backend == "umap":
+        params.setdefault("n_neighbors", min(15, n_samples - 1))
+
+    X_pca, pca = pca_reduce(X_topic, pca_dims)
+    coords = project(X_topic, backend=backend, pca_dims=pca_dims, seed=seed, data_hash=topic_hash, X_pca=X_pca,
+                     cache_dir=cache_dir, **params)
+
+    pca_summary = pd.DataFrame([{
+        "topic": topic,
+        "n_samples": n_samples,
+        "n_components": pca.n_components_,
+        "explained_variance": pca.explained_variance_ratio_.sum(),
+    }])
+    # Fold SVDs of the training rows only, not the topic PCA (fit on the test rows too)
+    decoding = ridge_probe_targets(X_topic, Y, blocks, n_splits=min(n_splits, n_samples), cache=False)
+    decoding.insert(0, "topic", topic)
+    associations = association_table(association_from_codes(factor_codes, n_levels, factor_cols), factor_cols)
+    associations.insert(0, "topic", topic)
+
+    return {"topic": topic, "coords": coords, "params": params, "pca": pca_summary, "decoding": decoding,
+            "associations": associations}
+
+
+def analyse_topics(df, X, topic_col, label_columns, factor_cols, min_samples=10, n_jobs=-1, **kwargs):
+    """analyse_topic for every level of df[topic_col] with at least min_samples rows, in parallel across topics.
+
+    The labels and factors are encoded once for the whole corpus; kwargs are passed on to analyse_topic. Returns
+    (groups, results): {topic: row positions} and {topic: analyse_topic result}."""
+    groups = {}
+    for topic, rows in group_indices(df[topic_col]).items():
+        if len(rows) < min_samples:
+            print(f"Skipping topic '{topic}' (too few samples: {len(rows)})")
+        else:
+            groups[topic] = rows
+
+    Y, blocks = one_hot_labels(df, label_columns)
+    factor_codes, levels = encode_factors(df, factor_cols)
+    n_levels = [len(lv) for lv in levels]
+
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(analyse_topic)(topic, rows, X, Y[rows], blocks, factor_codes[rows], n_levels, factor_cols, **kwargs)
+        for topic, rows in groups.items()
+    )
+    return groups, {result["topic"]: result for result in results}
@@ -0,0 +1,120 @@
+"""Perplexity x seed sweep of t-SNE projections, scored by how well each one preserves neighbourhoods.
+
+The PCA preprocessing is computed once and shared by all runs; the runs themselves are independent joblib tasks and
+go through the projection cache, so repeating a sweep (or extending its grid) only fits the missing runs. Each run is
+scored against the original embedding space with
+
+- trustworthiness: penalises points that are near neighbours in 2-D but not in the original space (1 = perfect);
+- knn_overlap: mean fraction of each point's k nearest neighbours in the original space that are also among its k
+  nearest neighbours in 2-D;
+
+and for each perplexity, seed_agreement is the mean kNN overlap between the projections of every pair of seeds (low
+values mean the apparent clusters depend on the seed). All neighbour computations use one dense distance matrix per
+projection and argpartition / argsort over its rows."""
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from projection_cache import PROJECTION_DIR, array_hash, pca_reduce, project
+
+
+def squared_distances(X):
+    """Pairwise squared Euclidean distances between the rows of X, with +inf on the diagonal."""
+    X = np.asarray(X, dtype=float)
+    sq = np.einsum("ij,ij->i", X, X)
+    D = np.maximum(sq[:, None] + sq[None, :] - 2 * X @ X.T, 0)
+    np.fill_diagonal(D, np.inf)
+    return D
+
+
+def knn_indices(D, k):
+    """Indices of the k nearest neighbours of every row of a distance matrix (unordered within the k)."""
+    return np.argpartition(D, k - 1, axis=1)[:, :k]
+
+
+def knn_overlap(knn_a, knn_b):
+    """Mean fraction of shared neighbours between two (n, k) neighbour index arrays."""
+    n, k = knn_a.shape
+    rows = np.repeat(np.arange(n), k)
+    member = np.zeros((n, n), dtype=bool)
+    member[rows, knn_a.ravel()] = True
+    return member[rows, knn_b.ravel()].reshape(n, k).sum(axis=1).mean() / k
+
+
+def trustworthiness_from_distances(D_high, knn_low, k):
+    """Trustworthiness (Venna & Kaski 2001) of a projection, from the original-space distance matrix and the
+    projection's k-nearest-neighbour indices; same value as sklearn.manifold.trustworthiness."""
+    n = D_high.shape[0]
+    ranks = np.empty_like(D_high, dtype=np.int64)
+    order = np.argsort(D_high, axis=1)
+    ranks[np.arange(n)[:, None], order] = np.arange(1, n + 1)   # neighbour rank in the original space (1 = nearest)
+    penalty = np.maximum(ranks[np.arange(n)[:, None], knn_low] - k, 0).sum()
+    return 1 - 2.0 / (n * k * (2 * n - 3 * k - 1)) * penalty
+
+
+def _sweep_run(X_pca, data_hash, pca_dims, perplexity, seed, init, backend, cache_dir):
+    # X_pca is both the input of the fit and (when pca_dims is set) the precomputed PCA of the hashed data
+    coords = project(X_pca, backend=backend, pca_dims=pca_dims, seed=seed, data_hash=data_hash, X_pca=X_pca,
+                     cache_dir=cache_dir, perplexity=perplexity, init=init)
+    return perplexity, seed, coords
+
+
+def tsne_sweep(X, perplexities, seeds, pca_dims=50, init="random", k=5, data_hash=None, X_pca=None,
+               backend="tsne", cache_dir=PROJECTION_DIR, n_jobs=-1):
+    """t-SNE projections of X for every (perplexity, seed), with neighbourhood-preservation scores.
+
+    With init="pca" the optimisation starts from the same layout for every seed and the runs are (nearly) identical,
+    so seed stability is only meaningful with init="random". X_pca may hold the PCA of X already computed by the
+    caller (pca_reduce with the same pca_dims). backend is one of the t-SNE backends of projection_cache ("tsne" or
+    "fft_tsne").
+
+    Perplexities >= n_samples are skipped. Returns (report, projections): one row per run with trustworthiness and
+    knn_overlap (plus seed_agreement per perplexity), and {(perplexity, seed): coords}."""
+    X = np.asarray(X, dtype=float)
+    n_samples = X.shape[0]
+    k = min(k, n_samples - 2)
+    data_hash = data_hash or array_hash(X)
+    if X_pca is None:
+        X_pca = pca_reduce(X, pca_dims)[0] if pca_dims is not None else X
+
+    grid = [(p, s) for p in perplexities if p < n_samples for s in seeds]
+    runs = Parallel(n_jobs=n_jobs)(
+        delayed(_sweep_run)(X_pca, data_hash, pca_dims, p, s, init, backend, cache_dir) for p, s in grid
+    )
+    projections = {(p, s): coords for p, s, coords in runs}
+
+    D_high = squared_distances(X)
+    knn_high = knn_indices(D_high, k)
+    knn_low = {key: knn_indices(squared_distances(coords), k) for key, coords in projections.items()}
+
+    rows = []
+    for (p, s), knn in knn_low.items():
+        rows.append({
+            "perplexity": p,
+            "seed": s,
+            "trustworthiness": trustworthiness_from_distances(D_high, knn, k),
+            "knn_overlap": knn_overlap(knn_high, knn),
+        })
+    report = pd.DataFrame(rows)
+
+    seed_agreement = {
+        p: np.mean([knn_overlap(knn_low[(p, a)], knn_low[(p, b)]) for a, b in combinations(seeds, 2)])
+        if len(seeds) > 1 else np.nan
+        for p in report["perplexity"].unique()
+    }
+    report["seed_agreement"] = report["perplexity"].map(seed_agreement)
+    return report, projections
+
+
+def summarise_sweep(report):
+    """Mean and spread over seeds of every score, one row per perplexity."""
+    return report.groupby("perplexity").agg(
+        trustworthiness_mean=("trustworthiness", "mean"),
+        trustworthiness_sd=("trustworthiness", "std"),
+        knn_overlap_mean=("knn_overlap", "mean"),
+        knn_overlap_sd=("knn_overlap", "std"),
+        seed_agreement=("seed_agreement", "first"),
+    ).reset_index()
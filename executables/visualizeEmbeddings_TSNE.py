@@ -1,4 +1,4 @@
-# Goal: visualize embeddings with t-SNE and color points by a chosen category.
+# Goal: visualize embeddings with t-SNE (or another 2-D projection backend) and color points by a chosen category.
 
 #%% Choose which category to color points by
 # Logical options:
@@ -8,23 +8,26 @@ list_categories = ["genre", "difficulty", "coherence_predictability", "emotional
 
 #%% Imports and data loading
 import pandas as pd
-from sklearn.manifold import TSNE
-import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib
-from matplotlib.lines import Line2D
-from ast import literal_eval
+
+from decoding_tools import embedding_csv_path, ensure_embedding_memmap, load_embedding_memmap
+from plot_rendering import FIGURE_DIR, draw_scatter, render_panels, scatter_panel
+from projection_cache import backend_axis_label, project
 
 database_number = 18
 database_name = "gpt5_1-full-120_to_150_words"
 embedding_size = "large"
 
-database = pd.read_csv(
-    f"../database_storage/database_{database_number:02d}-{database_name}__embeddings-{embedding_size}.csv"
-)
+# Headless batch mode: render all figures to PNG/SVG files in worker processes instead of showing windows
+batch_render = False
+figure_formats = ("png", "svg")
+figure_dir = f"{FIGURE_DIR}/database_{database_number:02d}"
 
-# Embeddings column assumed to be a stringified list (e.g. "[0.1, 0.2, ...]")
-embedding_matrix = np.array(database.embedding.apply(literal_eval).to_list())
+csv_path = embedding_csv_path(database_number, database_name, embedding_size)
+database = pd.read_csv(csv_path)
+
+# Embeddings column is a stringified list (e.g. "[0.1, 0.2, ...]"); it is parsed once and memory-mapped afterwards
+embedding_matrix = load_embedding_memmap(ensure_embedding_memmap(csv_path))
 
 # Optional: load paragraph domains (not used in plotting but kept from original code)
 paragraph_domains = pd.read_csv(
@@ -44,6 +47,40 @@ column_map = {
     "topic_hint": "topic_hint",
 }
 
+#%% Set hyperparameters and compute the 2-D projection once (cached on disk, see projection_cache.py); every
+# category below is rendered from the same coordinates.
+
+# Projection backend: "tsne" (sklearn), "fft_tsne" (FFT-accelerated t-SNE, needs openTSNE), "umap" (needs
+# umap-learn) or "pca". For tens of thousands of paragraphs use "fft_tsne" or "umap".
+projection_backend = "tsne"
+n_jobs = -1     # Threads used by the fft_tsne backend
+
+final_dims = 2  # Number of dimensions for the final transformation
+perplex = 15    # Perplexity
+r_state = 17    # Random state for repeatable results
+initialization = "pca"  # 'random' or 'pca'
+l_rate = "auto"     # Learning rate
+
+backend_params = {
+    "tsne": {"perplexity": perplex, "init": initialization, "learning_rate": l_rate},
+    "fft_tsne": {"perplexity": perplex, "init": initialization, "learning_rate": l_rate},
+    "umap": {"n_neighbors": 15, "min_dist": 0.1},
+    "pca": {},
+}
+projection_params = backend_params[projection_backend]
+projection_text = ", ".join(f"{k}={v}" for k, v in projection_params.items())
+projection_tag = "_".join([projection_backend] + [f"{k}{v}" for k, v in projection_params.items()])
+
+embeddings_2d = project(
+    embedding_matrix,
+    backend=projection_backend,
+    seed=r_state,
+    n_jobs=n_jobs,
+    **projection_params,
+)
+print(f"{projection_backend} projection ready with shape {embeddings_2d.shape}.")
+
+panels = []
 for color_by in list_categories:
     # This is the actual column we will use:
     color_column = column_map[color_by]
@@ -91,72 +128,29 @@ for color_by in list_categories:
         .cat.codes                  # unknown/missing -> -1
     )
 
-    #%% Set hyperparameters, create a t-SNE model, and transform the data
-
-    final_dims = 2  # Number of dimensions for the final transformation
-    perplex = 15    # Perplexity
-    r_state = 17    # Random state for repeatable results
-    initialization = "pca"  # 'random' or 'pca'
-    l_rate = "auto"     # Learning rate
-
-    tsne = TSNE(
-        n_components=final_dims,
-        perplexity=perplex,
-        init=initialization,
-        learning_rate=l_rate,
-        random_state=r_state,
-    )
-
-    embeddings_tsne = tsne.fit_transform(embedding_matrix)
-    print(f"Fit successful with shape {embeddings_tsne.shape}.")
-
-    #%% Create plots of t-SNE transformation
-
-    x_data = [x for x, y in embeddings_tsne]
-    y_data = [y for x, y in embeddings_tsne]
-    color_indices = database[f"{color_by}_id"]
-
-    colormap = matplotlib.colors.ListedColormap(colors_for_category)
-
-    plt.figure(figsize=(8, 6))
-    plt.scatter(x_data, y_data, c=color_indices, cmap=colormap, alpha=0.8)
-
-    plt.title(
-        f"{final_dims}-D t-SNE (perplexity={perplex}, init={initialization}, l_rate={l_rate})\n"
-        f"Database: {database_name} | Colored by: {color_by}",
-        fontsize=10,
+    #%% Create plots of the 2-D projection
+
+    panel = scatter_panel(
+        embeddings_2d,
+        database[f"{color_by}_id"],
+        labels,
+        colors_for_category,
+        title=f"{final_dims}-D {projection_backend} ({projection_text})\n"
+              f"Database: {database_name} | Colored by: {color_by}",
+        legend_title=color_by,
+        name=f"{projection_tag}_{color_by}",
+        axis_label=backend_axis_label(projection_backend),
     )
 
-    plt.xlabel("t-SNE 1")
-    plt.ylabel("t-SNE 2")
-
-    # Build legend from labels & colors
-    legend_elements = []
-    for idx, label in enumerate(labels):
-        legend_elements.append(
-            Line2D(
-                [0], [0],
-                marker="o",
-                linestyle="",
-                markerfacecolor=colors_for_category[idx],
-                markeredgecolor="none",
-                label=label,
-            )
-        )
-
-    # Optional: add "unknown" if any -1 codes exist
-    if (color_indices == -1).any():
-        legend_elements.append(
-            Line2D(
-                [0], [0],
-                marker="o",
-                linestyle="",
-                markerfacecolor="lightgray",
-                markeredgecolor="none",
-                label="unknown",
-            )
-        )
-
-    plt.legend(handles=legend_elements, title=color_by, loc="best", fontsize=8, title_fontsize=9)
-    plt.tight_layout()
-    plt.show()
+    if batch_render:
+        panels.append(panel)
+    else:
+        fig, ax = plt.subplots(figsize=(8, 6))
+        draw_scatter(ax, panel)
+        plt.tight_layout()
+        plt.show()
+
+#%% Batch mode: render every panel to files in parallel (no windows), plus a composite grid
+if batch_render:
+    paths = render_panels(panels, figure_dir, formats=figure_formats, grid_name=f"{projection_backend}_composite")
+    print(f"Wrote {len(paths)} files to {figure_dir}")